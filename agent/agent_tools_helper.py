@@ -1,22 +1,28 @@
 # Agent and Tool-based logic
+import asyncio
 import json
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 
 # from langchain_classic.agents import create_react_agent
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages import (AIMessage, BaseMessage, HumanMessage,
+                                     ToolMessage)
 from langchain_core.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.prebuilt import create_react_agent
 
 # Configuration
 import shared.config
 from agent.external_tools import get_recent_activity as fetch_activity
 from agent.external_tools import get_user_profile as fetch_profile
 from agent.external_tools import get_user_stats as fetch_stats
+from shared.components import get_llm, registry
+from shared.instrumentation import STAGE_TAG_PREFIX, count
+from shared.metrics import Counters
+from shared.query_router import get_router
 
-# Initialize LLM
-llm = ChatGoogleGenerativeAI(model="gemini-flash-latest",
-                             google_api_key=os.environ['GEMINI_API_KEY'])
+# Answer simple lookups (one user, known tools) without the ReAct loop, see `plan_tool_calls`
+TOOL_FAST_PATH_ENABLED = os.environ.get("TOOL_FAST_PATH", "1") != "0"
 
 
 # Convert mock tools to LangChain tools
@@ -42,24 +48,63 @@ def get_recent_activity(user_id: str, limit: int = 5) -> str:
 
 
 tools = [get_user_profile, get_user_stats, get_recent_activity]
+tools_by_name = {t.name: t for t in tools}
 
+# Words in a question that call for each tool on the fast path
+TOOL_INTENTS = {
+    "get_user_profile": re.compile(
+        r"\b(profile|email|location|where|bio|website|company|joined|who is)\b"),
+    "get_user_stats": re.compile(
+        r"\b(stats|statistics|followers|following|posts|engagement|likes|comments|popular)\b"),
+    "get_recent_activity": re.compile(
+        r"\b(activity|recent|recently|lately|latest|up to)\b"),
+}
+
+# Independent tool calls of one turn run side by side on this pool
+_tool_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tools")
+
+AGENT_PROMPT = (
+    "You answer questions about users of an external service with the tools provided. "
+    "Request every tool call the question needs in a single turn; independent calls run "
+    "concurrently. Answer from the tool results once you have them."
+)
+
+# LLM round trips and tool calls of tool-routed queries, by path
+tool_path_counters = Counters("fast_path", "agent", "llm_calls", "tool_calls", "tool_turns")
+
+
+def build_agent():
+    "Create the ReAct agent using LangGraph's prebuilt function."
+    from langgraph.prebuilt import create_react_agent
+    return create_react_agent(model=get_llm(), tools=tools, prompt=AGENT_PROMPT)  # type: ignore
+
+
+def build_tool_summarizer():
+    "The chat model answering from fast-path tool results, with tool calling switched off."
+    return get_llm().bind_tools(tools, tool_choice="none").with_config(
+        tags=[STAGE_TAG_PREFIX + "tool_summary"])
+
+
+# The compiled ReAct agent has no checkpointer and keeps no state between
+# invocations, so it is built once and shared by every session.
+registry.register("agent", build_agent)
+registry.register("tool_summarizer", build_tool_summarizer)
 
-def call_model_with_tools(state) -> dict:
-    """Execute tool-based Q&A using ReAct agent."""
 
-    # Create the ReAct agent using LangGraph's prebuilt function
-    agent = create_react_agent(model=llm, tools=tools)  # type: ignore
+def get_agent():
+    """Return the shared ReAct agent, building it once on first use."""
+    return registry.get("agent")
 
-    # Prepare input for the agent
+
+def _agent_input(state) -> dict:
+    "Prepare input for the agent."
     messages = state.get("messages", [])
     if not messages:
         messages = [HumanMessage(content=state["input"])]
+    return {"messages": messages}
 
-    agent_input = {"messages": messages}
-
-    # Invoke the agent
-    response = agent.invoke(agent_input)
 
+def _agent_update(response) -> dict:
     messages = response["messages"]
     last_ai = next(m for m in reversed(messages)
                    if getattr(m, "type", None) == "ai")
@@ -70,3 +115,105 @@ def call_model_with_tools(state) -> dict:
         "context": "External service data",
         "answer": answer_text,
     }
+
+
+def plan_tool_calls(question: str) -> AIMessage | None:
+    """
+    Tool calls answering a simple question directly, or None when the agent should decide.
+
+    A question is simple when it names exactly one known user and asks for something one or
+    more tools provide (e.g. "Get Ana's profile and stats"). The plan is the tool-calling
+    turn the model would otherwise have produced.
+    """
+    user_ids = get_router().name_matcher.user_ids(question)
+    if len(user_ids) != 1:
+        return None
+    lower = question.lower()
+    names = [name for name, pattern in TOOL_INTENTS.items() if pattern.search(lower)]
+    if not names:
+        return None
+    return AIMessage(content="", tool_calls=[
+        {"name": name, "args": {"user_id": user_ids[0]}, "id": f"direct_{i}",
+         "type": "tool_call"}
+        for i, name in enumerate(names)])
+
+
+def run_tool_calls(message: AIMessage) -> list[ToolMessage]:
+    "Run the tool calls of one turn concurrently."
+    futures = [_tool_pool.submit(copy_context().run, tools_by_name[call["name"]].invoke, call)
+               for call in message.tool_calls]
+    return [future.result() for future in futures]
+
+
+async def arun_tool_calls(message: AIMessage) -> list[ToolMessage]:
+    "Async counterpart of `run_tool_calls`."
+    return list(await asyncio.gather(*(tools_by_name[call["name"]].ainvoke(call)
+                                       for call in message.tool_calls)))
+
+
+def _record_agent_run(state, response):
+    "Count the agent's LLM calls, tool calls and tool-calling turns for this query."
+    new_messages = response["messages"][len(_agent_input(state)["messages"]):]
+    ai_messages = [m for m in new_messages if isinstance(m, AIMessage)]
+    tool_path_counters.increment("agent")
+    tool_path_counters.increment("llm_calls", len(ai_messages))
+    tool_path_counters.increment("tool_turns", sum(1 for m in ai_messages if m.tool_calls))
+    tool_path_counters.increment(
+        "tool_calls", sum(1 for m in new_messages if isinstance(m, ToolMessage)))
+
+
+def _fast_path_update(state, plan: AIMessage, results: list[ToolMessage],
+                      answer: AIMessage) -> dict:
+    tool_path_counters.increment("fast_path")
+    tool_path_counters.increment("llm_calls")
+    tool_path_counters.increment("tool_turns")
+    tool_path_counters.increment("tool_calls", len(results))
+    count("tool_fast_path")
+    return _agent_update({"messages": [HumanMessage(content=state["input"]), plan,
+                                       *results, answer]})
+
+
+def tool_path_stats() -> dict:
+    "Counters of tool-routed queries, with LLM calls and tool turns per query."
+    counters = tool_path_counters.as_dict()
+    queries = counters["fast_path"] + counters["agent"]
+    return {
+        **counters,
+        "llm_calls_per_query": counters["llm_calls"] / queries if queries else 0.0,
+        "tool_turns_per_query": counters["tool_turns"] / queries if queries else 0.0,
+    }
+
+
+def call_model_with_tools(state) -> dict:
+    """
+    Execute tool-based Q&A.
+
+    Simple lookups run their tool calls directly and make one LLM call to phrase the answer
+    (`plan_tool_calls`); anything else goes through the ReAct agent.
+    """
+    plan = plan_tool_calls(state["input"]) \
+        if TOOL_FAST_PATH_ENABLED and not state.get("messages") else None
+    if plan is not None:
+        results = run_tool_calls(plan)
+        answer = registry.get("tool_summarizer").invoke(
+            [HumanMessage(content=state["input"]), plan, *results])
+        return _fast_path_update(state, plan, results, answer)
+
+    response = get_agent().invoke(_agent_input(state))
+    _record_agent_run(state, response)
+    return _agent_update(response)
+
+
+async def acall_model_with_tools(state) -> dict:
+    """Async counterpart of `call_model_with_tools`."""
+    plan = plan_tool_calls(state["input"]) \
+        if TOOL_FAST_PATH_ENABLED and not state.get("messages") else None
+    if plan is not None:
+        results = await arun_tool_calls(plan)
+        answer = await registry.get("tool_summarizer").ainvoke(
+            [HumanMessage(content=state["input"]), plan, *results])
+        return _fast_path_update(state, plan, results, answer)
+
+    response = await get_agent().ainvoke(_agent_input(state))
+    _record_agent_run(state, response)
+    return _agent_update(response)
@@ -0,0 +1,287 @@
+"""
+Data access for the user records behind the agent's tools.
+
+`UserDataStore` sits between the service functions in `agent.external_tools`
+and a pluggable backend (`InMemoryBackend`, or `SQLiteBackend` as a stand-in
+for the real remote service):
+
+- user names are resolved with a `NameIndex` built once: case- and
+  accent-insensitive, with a fuzzy fallback for misspellings;
+- records are cached per (kind, user ID) for `ttl_seconds`, including "not
+  found" answers;
+- concurrent requests for a record that is already being fetched wait for
+  that fetch instead of starting another (request coalescing), so parallel
+  agent turns about the same user reach the backend once;
+- `get_many` fetches all missing records of a kind with one backend call.
+
+A backend implements `fetch_many(kind, user_ids)`, returning the records it
+has by user ID, and `names()`, returning each user's display name.
+"""
+
+import difflib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+
+from shared.metrics import Counters, LatencyRecorder
+
+KINDS = ("profile", "stats", "activity")
+
+
+def normalize_name(name: str) -> str:
+    "Case-, accent- and whitespace-insensitive form of a name (\"Ana Müller\" -> \"ana muller\")."
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """
+    Resolves user names to user IDs, exactly or approximately.
+
+    Every alias is indexed under its normalized form (`normalize_name`), and
+    so is each display name and each of its words that belongs to a single
+    user ("Ana Müller", "ana", "muller"). Names without an exact match are
+    looked up through a trigram index and accepted if the closest candidate is
+    at least `min_similarity` similar (`difflib` ratio), e.g. "Sara" -> Sarah.
+
+    Parameters
+    ----------
+    display_names : dict[str, str]
+        User ID to display name.
+    aliases : dict[str, str], optional
+        Other names (nicknames, first names) to user ID.
+    min_similarity : float
+        Minimum similarity of a fuzzy match.
+    """
+
+    def __init__(self, display_names: dict[str, str], aliases: dict[str, str] | None = None,
+                 min_similarity: float = 0.8):
+        self.min_similarity = min_similarity
+        self._exact = {}
+        words = defaultdict(set)
+        for user_id, name in display_names.items():
+            self._exact[normalize_name(name)] = user_id
+            for word in normalize_name(name).split():
+                words[word].add(user_id)
+        for word, user_ids in words.items():
+            if len(user_ids) == 1:
+                self._exact.setdefault(word, next(iter(user_ids)))
+        for alias, user_id in (aliases or {}).items():
+            self._exact[normalize_name(alias)] = user_id
+
+        self._by_trigram = defaultdict(set)
+        for key in self._exact:
+            for trigram in _trigrams(key):
+                self._by_trigram[trigram].add(key)
+
+    def resolve(self, name: str, fuzzy: bool = True) -> str | None:
+        "User ID of `name`, or None when no indexed name is close enough."
+        key = normalize_name(name)
+        if key in self._exact:
+            return self._exact[key]
+        if not fuzzy or not key:
+            return None
+        candidates = set().union(*(self._by_trigram.get(t, ()) for t in _trigrams(key)))
+        best, best_score = None, self.min_similarity
+        for candidate in candidates:
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score >= best_score:
+                best, best_score = candidate, score
+        return self._exact[best] if best is not None else None
+
+
+class InMemoryBackend:
+    """
+    Backend serving records from dictionaries.
+
+    Parameters
+    ----------
+    records : dict[str, dict[str, object]]
+        Kind (see `KINDS`) to user ID to record.
+    """
+
+    def __init__(self, records: dict[str, dict[str, object]]):
+        self.records = records
+
+    def fetch_many(self, kind: str, user_ids: list[str]) -> dict[str, object]:
+        table = self.records.get(kind, {})
+        return {user_id: table[user_id] for user_id in user_ids if user_id in table}
+
+    def names(self) -> dict[str, str]:
+        return {user_id: profile["name"]
+                for user_id, profile in self.records.get("profile", {}).items()}
+
+
+class SQLiteBackend:
+    """
+    Backend reading JSON records from a SQLite table, a local stand-in for the remote service.
+
+    Parameters
+    ----------
+    path : str
+        Database file (":memory:" for a private in-memory database).
+    """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_records ("
+                "kind TEXT NOT NULL, user_id TEXT NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (kind, user_id))")
+
+    def load(self, records: dict[str, dict[str, object]]):
+        "Insert or replace `records` (kind to user ID to record)."
+        rows = [(kind, user_id, json.dumps(record))
+                for kind, table in records.items() for user_id, record in table.items()]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO user_records (kind, user_id, data) VALUES (?, ?, ?)", rows)
+
+    def fetch_many(self, kind: str, user_ids: list[str]) -> dict[str, object]:
+        placeholders = ",".join("?" * len(user_ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT user_id, data FROM user_records "
+                f"WHERE kind = ? AND user_id IN ({placeholders})", [kind, *user_ids]).fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    def names(self) -> dict[str, str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT user_id, data FROM user_records WHERE kind = 'profile'").fetchall()
+        return {user_id: json.loads(data)["name"] for user_id, data in rows}
+
+
+class UserDataStore:
+    """
+    Cached, coalescing access to user records by user ID or name.
+
+    Records returned are shared with the cache and must not be modified.
+
+    Parameters
+    ----------
+    backend : InMemoryBackend | SQLiteBackend
+        Where records come from.
+    aliases : dict[str, str], optional
+        Extra names to user ID for the `NameIndex`.
+    ttl_seconds : float
+        Lifetime of a cached record (or of a "not found" answer).
+    max_entries : int
+        LRU capacity of the cache.
+    """
+
+    def __init__(self, backend, aliases: dict[str, str] | None = None,
+                 ttl_seconds: float = 300, max_entries: int = 4096):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.user_ids = set(backend.names())
+        self.name_index = NameIndex(backend.names(), aliases)
+
+        # (kind, user ID) -> (record or None, expires at)
+        self._entries = OrderedDict()
+        # (kind, user ID) -> Future of the fetch in progress
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+        self.counters = Counters("hits", "misses", "coalesced", "backend_calls")
+        self.backend_latency = LatencyRecorder()
+
+    def resolve(self, user: str) -> str | None:
+        "User ID of `user`, given as a user ID or a (possibly misspelt) name."
+        return user if user in self.user_ids else self.name_index.resolve(user)
+
+    def get(self, kind: str, user: str):
+        "The `kind` record of `user` (ID or name), or None if there is none."
+        return self.get_many(kind, [user])[user]
+
+    def get_many(self, kind: str, users: list[str]) -> dict[str, object]:
+        """
+        The `kind` records of several users, keyed as given (ID or name), None where missing.
+
+        Cached records are served directly, records another thread is fetching are awaited,
+        and the rest are fetched with a single backend call.
+        """
+        resolved = {user: self.resolve(user) for user in users}
+        user_ids = list(dict.fromkeys(user_id for user_id in resolved.values() if user_id))
+        found, waiting, claimed = {}, {}, []
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                key = (kind, user_id)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.counters.increment("hits")
+                    found[user_id] = entry[0]
+                elif key in self._in_flight:
+                    self.counters.increment("coalesced")
+                    waiting[user_id] = self._in_flight[key]
+                else:
+                    self.counters.increment("misses")
+                    self._in_flight[key] = Future()
+                    claimed.append(user_id)
+
+        if claimed:
+            found.update(self._fetch(kind, claimed))
+        for user_id, future in waiting.items():
+            found[user_id] = future.result()
+        return {user: found.get(user_id) if user_id else None
+                for user, user_id in resolved.items()}
+
+    def _fetch(self, kind: str, user_ids: list[str]) -> dict[str, object]:
+        "Fetch claimed records, cache them and hand them to the requests waiting on them."
+        start = time.perf_counter()
+        try:
+            self.counters.increment("backend_calls")
+            records = self.backend.fetch_many(kind, user_ids)
+        except BaseException as e:
+            with self._lock:
+                futures = [self._in_flight.pop((kind, user_id)) for user_id in user_ids]
+            for future in futures:
+                future.set_exception(e)
+            raise
+        finally:
+            self.backend_latency.record(time.perf_counter() - start)
+
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            futures = []
+            for user_id in user_ids:
+                key = (kind, user_id)
+                self._entries[key] = (records.get(user_id), expires_at)
+                self._entries.move_to_end(key)
+                futures.append((self._in_flight.pop(key), records.get(user_id)))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        for future, record in futures:
+            future.set_result(record)
+        return records
+
+    def invalidate(self, kind: str | None = None, user_id: str | None = None):
+        "Drop cached records, all of them or those of one kind and/or user."
+        with self._lock:
+            for key in [key for key in self._entries
+                        if kind in (None, key[0]) and user_id in (None, key[1])]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        counters = self.counters.as_dict()
+        requests = counters["hits"] + counters["misses"] + counters["coalesced"]
+        return {
+            **counters,
+            "entries": len(self._entries),
+            "hit_rate": counters["hits"] / requests if requests else 0.0,
+            "backend_latency": self.backend_latency.summary(),
+        }
@@ -0,0 +1,261 @@
+"""
+Batch question answering for offline evaluation and back-fills.
+
+`answer_questions` and `aanswer_questions` answer many independent,
+single-turn questions much faster than one `execute_user_query` call each:
+
+- questions are taken in chunks of `batch_size`; each chunk is embedded with
+  one call to the model (for routing and retrieval), its RAG questions are
+  searched with one vector-store query, and the next chunk is retrieved while
+  the current one is answered;
+- answer LLM calls (and agent runs for tool questions) are fanned out with at
+  most `concurrency` in flight and at most `rate` started per second;
+- results are yielded, and written by the CLI, as they complete.
+
+The CLI reads JSONL with a "question" (and optionally an "id") per line and
+appends one JSON result per line to the output file. Questions whose id
+already has an answer there are skipped, so an interrupted run resumes where it
+stopped:
+
+    python batch_query.py questions.jsonl answers.jsonl --concurrency 8 --rate 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Iterable
+
+from langchain_core.documents import Document
+
+from agent.agent_tools_helper import acall_model_with_tools
+from rag import rag_helper
+from rag.hybrid_retriever import HybridRetriever, similarity_search_many
+from shared.components import get_embeddings
+from shared.get_embedding_function import embed_queries
+from shared.query_router import route_query
+
+BATCH_SIZE = 64
+CONCURRENCY = 8
+
+
+class RateLimiter:
+    "Spaces out calls to at most `rate` per second on one event loop (no limit when falsy)."
+
+    def __init__(self, rate: float | None = None):
+        self.interval = 1 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        await asyncio.sleep(start - now)
+
+
+def retrieve_many(questions: list[str],
+                  vectors: list[list[float]]) -> list[list[Document]]:
+    "The context of each question, with one vector search for all of them."
+    retriever = rag_helper.get_retriever()
+    if isinstance(retriever, HybridRetriever):
+        contexts = retriever.retrieve_many(questions, vectors)
+    else:
+        contexts = similarity_search_many(retriever.vectorstore, vectors,
+                                          retriever.search_kwargs.get("k", rag_helper.RETRIEVAL_K))
+    if rag_helper.CONTEXT_ASSEMBLY_ENABLED:
+        contexts = [rag_helper.context_assembler.assemble(context) for context in contexts]
+    return contexts
+
+
+def prepare(items: list[dict]) -> list[dict]:
+    """
+    Route a chunk of questions and retrieve the context of those answered by RAG.
+
+    The chunk is embedded with one call; the vectors serve both routing and retrieval.
+    """
+    vectors = embed_queries(get_embeddings(), [item["question"] for item in items])
+    prepared = [{**item, "route": route_query(item["question"], vector).route}
+                for item, vector in zip(items, vectors)]
+    rag = [(item, vector) for item, vector in zip(prepared, vectors) if item["route"] == "rag"]
+    if rag:
+        contexts = retrieve_many([item["question"] for item, _ in rag],
+                                 [vector for _, vector in rag])
+        for (item, _), context in zip(rag, contexts):
+            item["context"] = context
+    return prepared
+
+
+async def aprepare(items: list[dict]) -> list[dict]:
+    try:
+        return await asyncio.to_thread(prepare, items)
+    except Exception as e:
+        # The chunk's questions are reported as failed; later chunks still run
+        return [{**item, "error": f"{type(e).__name__}: {e}"} for item in items]
+
+
+async def answer(item: dict, semaphore: asyncio.Semaphore, rate_limiter: RateLimiter) -> dict:
+    "Result record for one prepared question."
+    result = {"id": item["id"], "question": item["question"], "route": item.get("route")}
+    if "error" in item:
+        return {**result, "error": item["error"]}
+    async with semaphore:
+        await rate_limiter.wait()
+        start = time.perf_counter()
+        try:
+            if item["route"] == "tools":
+                response = await acall_model_with_tools({"input": item["question"]})
+                result["answer"] = response["answer"]
+            else:
+                result["answer"] = await rag_helper.get_answer_chain().ainvoke({
+                    "input": item["question"],
+                    "chat_history": [],
+                    "context": item["context"],
+                })
+                result["sources"] = [doc.metadata.get("source") for doc in item["context"]]
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["latency_ms"] = (time.perf_counter() - start) * 1e3
+    return result
+
+
+async def aanswer_questions(items: Iterable[dict], batch_size: int = BATCH_SIZE,
+                            concurrency: int = CONCURRENCY,
+                            rate: float | None = None) -> AsyncIterator[dict]:
+    """
+    Answer questions, yielding results in completion order.
+
+    Parameters
+    ----------
+    items : Iterable[dict]
+        Questions as {"id": ..., "question": ...}; the id is copied to the result.
+    batch_size : int
+        Questions embedded and searched together.
+    concurrency : int
+        Maximum answer LLM calls (or agent runs) in flight.
+    rate : float, optional
+        Maximum answer calls started per second.
+
+    Yields
+    ------
+    result : dict
+        `id`, `question`, `route` and either `answer` (with `sources` for RAG answers and
+        `latency_ms`) or `error`.
+    """
+    items = list(items)
+    chunks = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+    semaphore, rate_limiter = asyncio.Semaphore(concurrency), RateLimiter(rate)
+    pending = set()
+
+    next_chunk = asyncio.create_task(aprepare(chunks[0])) if chunks else None
+    try:
+        for index in range(len(chunks)):
+            prepared = await next_chunk
+            if index + 1 < len(chunks):
+                next_chunk = asyncio.create_task(aprepare(chunks[index + 1]))
+            pending |= {asyncio.create_task(answer(item, semaphore, rate_limiter))
+                        for item in prepared}
+            # Keep about one chunk of answers in flight, so the prepared contexts held stay bounded
+            while len(pending) > batch_size:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # A consumer that stops early (or fails) leaves answers and a prepared chunk in flight
+        outstanding = pending | ({next_chunk} if next_chunk else set())
+        for task in outstanding:
+            task.cancel()
+        await asyncio.gather(*outstanding, return_exceptions=True)
+
+
+def answer_questions(questions: list[str], **options) -> list[dict]:
+    "Answer `questions`, returning results in input order; see `aanswer_questions`."
+    async def collect():
+        items = [{"id": i, "question": question} for i, question in enumerate(questions)]
+        return [result async for result in aanswer_questions(items, **options)]
+
+    return sorted(asyncio.run(collect()), key=lambda result: result["id"])
+
+
+def read_questions(path: str) -> list[dict]:
+    "Questions of a JSONL file; a line without an id gets its line number."
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                record = json.loads(line)
+                items.append({"id": record.get("id", line_number),
+                              "question": record["question"]})
+    return items
+
+
+def answered_ids(path: str) -> set:
+    "IDs already answered in an output file. A line cut short by an interruption is ignored."
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "answer" in record:
+                done.add(record["id"])
+    return done
+
+
+def ends_mid_line(path: str) -> bool:
+    "True when the file's last line was cut short, so appended output needs a newline first."
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+async def run_batch(input_path: str, output_path: str, batch_size: int = BATCH_SIZE,
+                    concurrency: int = CONCURRENCY, rate: float | None = None) -> dict:
+    "Answer the questions of `input_path` not yet answered in `output_path`, appending results."
+    items = read_questions(input_path)
+    done = answered_ids(output_path)
+    todo = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} questions, {len(items) - len(todo)} already answered, "
+          f"{len(todo)} to go.")
+
+    counts = {"answered": 0, "errors": 0}
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as out:
+        if ends_mid_line(output_path):
+            out.write("\n")
+        async for result in aanswer_questions(todo, batch_size, concurrency, rate):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["errors" if "error" in result else "answered"] += 1
+            finished = counts["answered"] + counts["errors"]
+            if finished % 100 == 0 or finished == len(todo):
+                print(f"{finished}/{len(todo)} done ({counts['errors']} errors), "
+                      f"{finished / (time.perf_counter() - start):.1f} questions/s")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="JSONL file with a \"question\" (and optional \"id\") per line.")
+    parser.add_argument("output", help="JSONL results file; appended to, and used to resume.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Questions embedded and searched together.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="Answer LLM calls in flight.")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Maximum answer LLM calls started per second.")
+    args = parser.parse_args()
+    asyncio.run(run_batch(args.input, args.output, args.batch_size, args.concurrency,
+                          args.rate))
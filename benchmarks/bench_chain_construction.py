@@ -0,0 +1,48 @@
+"""
+Micro-benchmark for per-request graph construction overhead.
+
+Compares building the RAG chain and ReAct agent on every request (the old
+behaviour) with fetching the shared instances built once by `warm_up`.
+No LLM calls are made; only construction is timed.
+
+Run from the project root:
+    python -m benchmarks.bench_chain_construction --iterations 200
+"""
+import argparse
+import time
+
+from agent.agent_tools_helper import build_agent, get_agent
+from langchain_helper import warm_up
+from rag.rag_helper import answer_question, get_rag_chain
+
+
+def time_per_call(func, iterations: int) -> float:
+    "Return the mean wall time of `func()` in microseconds."
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200,
+                        help="Number of calls to time per case.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    warm_up()
+    print(f"warm_up: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+    cases = [
+        ("rag chain, rebuilt per request", answer_question),
+        ("rag chain, shared", get_rag_chain),
+        ("react agent, rebuilt per request", build_agent),
+        ("react agent, shared", get_agent),
+    ]
+    for name, func in cases:
+        print(f"{name:<36} {time_per_call(func, args.iterations):>10.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Chunking benchmark: the structured (headings and tokens) vs the recursive splitter.
+
+Ingests data_sources/books into a throwaway Chroma DB and BM25 index once per
+chunker and prints, for each:
+
+- the chunk count and mean chunk size (approximate tokens);
+- the time to load and split the books, and to embed and write the chunks;
+- the size of the DB and keyword index on disk;
+- recall@k and MRR of vector and hybrid retrieval on the labelled questions
+  of bench_retrieval.
+
+The embedding cache is off (unless EMBEDDING_CACHE is set), so both chunkers
+pay for every embedding. With EMBEDDING_PROVIDER=fake it runs offline.
+
+Run from the project root:
+    python -m benchmarks.bench_chunking --k 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunkers", nargs="+", default=["recursive", "structured"])
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--workers", type=int, default=1, help="Embedding processes.")
+    args = parser.parse_args()
+
+    os.environ.setdefault("EMBEDDING_CACHE", "0")
+    # Imported after the environment is configured, which turns the cache off
+    from langchain_chroma import Chroma
+
+    from benchmarks.bench_retrieval import evaluate, load_questions
+    from create_db import list_source_files, load_documents, split_text
+    from ingest.bm25_index import BM25Index
+    from ingest.manifest import assign_chunk_ids
+    from ingest.pipeline import EMBED_BATCH_SIZE, embed_and_write
+    from rag.hybrid_retriever import HybridRetriever
+    from shared.get_embedding_function import get_embedding_function
+    from shared.tokens import approximate_tokens
+
+    questions = load_questions()
+    print(f"{len(questions)} questions")
+    for chunker in args.chunkers:
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            chunks = list(split_text(load_documents(
+                list_source_files("data_sources/books"), workers=1, chunker=chunker), chunker))
+            split_s = time.perf_counter() - start
+
+            db = Chroma(persist_directory=directory, embedding_function=get_embedding_function())
+            ids = assign_chunk_ids(chunks)
+            stats = embed_and_write(db, list(zip(ids, chunks)), EMBED_BATCH_SIZE, args.workers)
+            lexical = BM25Index(directory)
+            lexical.add((id_, chunk.page_content) for id_, chunk in zip(ids, chunks))
+            lexical.commit()
+
+            tokens = sum(approximate_tokens(chunk.page_content) for chunk in chunks) / len(chunks)
+            print(f"{chunker:<11} {len(chunks):5d} chunks of {tokens:4.0f} tokens   "
+                  f"load+split {split_s:5.2f} s   embed+write {stats.seconds:6.2f} s   "
+                  f"index {directory_mb(directory):5.1f} MB")
+            for k in args.k:
+                retrievers = {
+                    "vector": db.as_retriever(search_type="similarity", search_kwargs={"k": k}),
+                    "hybrid": HybridRetriever(vector_store=db, lexical_index=lexical, k=k),
+                }
+                for name, retriever in retrievers.items():
+                    result = evaluate(retriever, questions)
+                    print(f"            {name:<7} k={k:<3} recall@k {result['recall']:.2f}   "
+                          f"MRR {result['mrr']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
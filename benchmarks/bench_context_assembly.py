@@ -0,0 +1,68 @@
+"""
+Context assembly benchmark.
+
+For each labelled question in retrieval_questions.jsonl, retrieves --k chunks
+and compares stuffing them into the prompt as is with the output of
+`ContextAssembler` (merged, deduplicated, budgeted). Reports approximate
+prompt tokens, whether the expected answer text is still in the context, and
+the latency of the answer LLM call with each context using the configured LLM
+(LLM_PROVIDER=fake has a fixed latency; skip the calls with --no-llm).
+
+Run from the project root (needs a built vector DB):
+    python -m benchmarks.bench_context_assembly --k 8 --budget 1500
+"""
+import argparse
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from benchmarks.bench_retrieval import first_relevant_rank, load_questions
+from rag.context_assembly import ContextAssembler, approximate_tokens
+from rag.hybrid_retriever import HybridRetriever
+from shared.components import get_lexical_index, get_llm, get_vector_store
+from shared.metrics import LatencyRecorder
+
+
+def prompt_for(question: str, documents) -> list:
+    context = "\n\n".join(document.page_content for document in documents)
+    return [SystemMessage("Use the following pieces of retrieved context to answer the "
+                          "question in three to seven sentences.\n\n" + context),
+            HumanMessage(question)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=8, help="Chunks retrieved per question.")
+    parser.add_argument("--budget", type=int, default=1500, help="Context token budget.")
+    parser.add_argument("--no-llm", action="store_true", help="Skip the answer LLM calls.")
+    args = parser.parse_args()
+
+    questions = load_questions()
+    retriever = HybridRetriever(vector_store=get_vector_store(),
+                                lexical_index=get_lexical_index(), k=args.k)
+    assembler = ContextAssembler(token_budget=args.budget)
+    results = {name: {"tokens": 0, "found": 0, "latency": LatencyRecorder()}
+               for name in ("raw", "assembled")}
+
+    for item in questions:
+        raw = retriever.invoke(item["question"])
+        for name, documents in (("raw", raw), ("assembled", assembler(raw))):
+            result = results[name]
+            result["tokens"] += sum(approximate_tokens(d.page_content) for d in documents)
+            result["found"] += first_relevant_rank(documents, item["expected"]) is not None
+            if not args.no_llm:
+                start = time.perf_counter()
+                get_llm().invoke(prompt_for(item["question"], documents))
+                result["latency"].record(time.perf_counter() - start)
+
+    print(f"{len(questions)} questions, k={args.k}, budget={args.budget} tokens")
+    for name, result in results.items():
+        latency = result["latency"].summary()
+        print(f"{name:<10} {result['tokens'] / len(questions):7.0f} prompt tokens/question   "
+              f"answer in context {result['found'] / len(questions):.2f}   "
+              f"LLM p50 {latency['p50_ms']:7.1f} ms   p95 {latency['p95_ms']:7.1f} ms")
+    print(assembler.stats())
+
+
+if __name__ == "__main__":
+    main()
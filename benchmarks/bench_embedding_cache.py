@@ -0,0 +1,71 @@
+"""
+Embedding cache benchmark: rebuild and repeated-query speedups.
+
+Embeds the bundled books' chunks and a repeated question three ways: straight
+through the model, through a cold cache (every text misses and is stored), and
+through a warm cache reopened from disk, as a rebuild or a restarted server
+would see it. A throwaway cache file is used so the real cache is untouched.
+
+Run from the project root:
+    python -m benchmarks.bench_embedding_cache --queries 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from create_db import list_source_files, load_documents, split_text
+from shared.embedding_cache import CachedEmbeddings
+from shared.get_embedding_function import (EMBEDDING_MODEL,
+                                           get_gpt4all_embeddings)
+
+BOOKS_PATH = "data_sources/books"
+QUESTION = "What are the names of the Stark children's direwolves?"
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Number of repeated query embeddings.")
+    args = parser.parse_args()
+
+    documents = load_documents(list_source_files(BOOKS_PATH))
+    texts = [chunk.page_content for chunk in split_text(documents)]
+    model = get_gpt4all_embeddings()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embeddings.sqlite3")
+        cold = CachedEmbeddings(EMBEDDING_MODEL, lambda: model, path)
+        warm = CachedEmbeddings(EMBEDDING_MODEL, lambda: model, path)
+
+        rebuild = {
+            "uncached": timed(lambda: model.embed_documents(texts)),
+            "cold cache": timed(lambda: cold.embed_documents(texts)),
+            "warm cache": timed(lambda: warm.embed_documents(texts)),
+        }
+        print(f"Rebuild of {len(texts)} chunks:")
+        for name, seconds in rebuild.items():
+            print(f"  {name:<12} {seconds:8.2f} s "
+                  f"({rebuild['uncached'] / seconds:6.1f}x)")
+
+        queries = {
+            "uncached": timed(lambda: [model.embed_query(QUESTION)
+                                       for _ in range(args.queries)]),
+            "cached": timed(lambda: [warm.embed_query(QUESTION)
+                                     for _ in range(args.queries)]),
+        }
+        print(f"{args.queries} repeated queries:")
+        for name, seconds in queries.items():
+            print(f"  {name:<12} {seconds / args.queries * 1e3:8.3f} ms/query "
+                  f"({queries['uncached'] / seconds:6.1f}x)")
+        print(f"Warm cache stats: {warm.stats()}")
+
+
+if __name__ == "__main__":
+    main()
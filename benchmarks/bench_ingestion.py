@@ -0,0 +1,44 @@
+"""
+Ingestion throughput benchmark for the batched, multi-process embedding pipeline.
+
+Chunks the bundled books once, then embeds and writes them into a throwaway
+Chroma directory with each requested worker count, printing chunks/sec and
+the peak RSS of the main process and of its largest child process for every run.
+
+Run from the project root:
+    python -m benchmarks.bench_ingestion --workers 1 2 4 8 --repeat 4
+"""
+import argparse
+import tempfile
+
+from langchain_chroma import Chroma
+
+from create_db import list_source_files, load_documents, split_text
+from ingest.manifest import assign_chunk_ids
+from ingest.pipeline import EMBED_BATCH_SIZE, embed_and_write
+
+BOOKS_PATH = "data_sources/books"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Replicate the corpus to simulate a larger one.")
+    args = parser.parse_args()
+
+    chunks = list(split_text(load_documents(list_source_files(BOOKS_PATH)))) * args.repeat
+    ids = [f"{i}-{id_}" for i, id_ in enumerate(assign_chunk_ids(chunks))]
+
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            db = Chroma(persist_directory=directory)
+            # A generator, so the pipeline sees a stream rather than a list.
+            stream = (pair for pair in zip(ids, chunks))
+            stats = embed_and_write(db, stream, args.batch_size, workers)
+            print(f"workers={workers:<3} {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Instrumentation overhead benchmark.
+
+Measures the cost of a `span` + `count` pair with no active trace (the hot
+path with TRACING=0), then runs the labelled questions through
+`execute_user_query` with tracing off and on, alternating per question, and
+prints p50/p95 latency of each plus the stage breakdown of the traced runs.
+Uses the configured models; for a quick offline run:
+
+    EMBEDDING_PROVIDER=fake LLM_PROVIDER=fake FAKE_LLM_LATENCY_MS=0 \
+        python -m benchmarks.bench_instrumentation
+
+Run from the project root (needs a built vector DB).
+"""
+import argparse
+import time
+
+from benchmarks.bench_retrieval import load_questions
+from langchain_helper import execute_user_query
+from shared import instrumentation
+from shared.instrumentation import RingBufferExporter, count, span
+from shared.metrics import LatencyRecorder
+
+
+def disabled_overhead_ns(calls: int) -> float:
+    "Nanoseconds per `span` + `count` pair outside a trace."
+    start = time.perf_counter()
+    for _ in range(calls):
+        with span("stage"):
+            count("event")
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Passes over the questions in each mode.")
+    parser.add_argument("--calls", type=int, default=1_000_000,
+                        help="Calls for the disabled-overhead measurement.")
+    args = parser.parse_args()
+
+    print(f"span + count without a trace: {disabled_overhead_ns(args.calls):.0f} ns")
+
+    ring = RingBufferExporter(capacity=100_000)
+    instrumentation.exporters[:] = [ring]
+    questions = load_questions()
+    latency = {False: LatencyRecorder(), True: LatencyRecorder()}
+    for repeat in range(args.repeat):
+        for i, item in enumerate(questions):
+            for enabled in (False, True):
+                instrumentation.TRACING_ENABLED = enabled
+                start = time.perf_counter()
+                # A new thread per query keeps the answer independent of history
+                execute_user_query({"input": item["question"]},
+                                   f"bench-instrumentation-{enabled}-{repeat}-{i}")
+                latency[enabled].record(time.perf_counter() - start)
+
+    for enabled, recorder in latency.items():
+        summary = recorder.summary()
+        print(f"tracing {'on ' if enabled else 'off'}  p50 {summary['p50_ms']:7.2f} ms   "
+              f"p95 {summary['p95_ms']:7.2f} ms")
+
+    traces = ring.recent()
+    stages = {}
+    for trace in traces:
+        for stage in trace["spans"]:
+            stages.setdefault(stage["name"], LatencyRecorder()).record(
+                stage["duration_ms"] / 1e3)
+    print(f"\nstages over {len(traces)} traced queries:")
+    for name, recorder in stages.items():
+        summary = recorder.summary()
+        print(f"  {name:<24} {summary['count']:5d} spans   p50 {summary['p50_ms']:7.2f} ms   "
+              f"p95 {summary['p95_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
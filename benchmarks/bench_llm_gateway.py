@@ -0,0 +1,77 @@
+"""
+LLM gateway benchmark: retries and hedging against an unreliable provider.
+
+Sends --calls concurrent requests to a fake chat model that fails with a 429
+on --error-rate of calls and takes --tail-ms instead of --latency-ms on
+--tail-rate of them, once through a gateway without retries or hedging and
+once through one with both, and prints the success rate, p50/p95/p99 latency
+and the gateway's counters. The gateways allow twice --concurrency calls in
+flight, leaving room for hedges.
+
+Run from the project root:
+    python -m benchmarks.bench_llm_gateway --error-rate 0.05 --tail-rate 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from shared import llm
+from shared.fake_llm import FakeChatModel
+from shared.llm import GatewayMixin, LLMGateway
+from shared.metrics import LatencyRecorder
+
+
+class BenchModel(GatewayMixin, FakeChatModel):
+    pass
+
+
+async def run(model, calls: int, concurrency: int) -> tuple[int, LatencyRecorder, float]:
+    latency = LatencyRecorder(window=calls)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await model.ainvoke(f"Question {i}?")
+            except Exception:
+                return False
+        latency.record(time.perf_counter() - start)
+        return True
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(calls)))
+    return sum(results), latency, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--tail-ms", type=float, default=1000)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hedge-after-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    llm.LLM_RETRY_BASE_MS = 50
+    model = BenchModel(latency=args.latency_ms / 1e3, tail_latency=args.tail_ms / 1e3,
+                       tail_rate=args.tail_rate, error_rate=args.error_rate)
+    print(f"{args.calls} calls, {args.concurrency} in flight, {args.error_rate:.0%} errors, "
+          f"{args.tail_rate:.0%} taking {args.tail_ms:.0f} ms")
+    for name, gateway in (
+            ("plain", LLMGateway(2 * args.concurrency, max_retries=0)),
+            ("gateway", LLMGateway(2 * args.concurrency,
+                                   hedge_after=args.hedge_after_ms / 1e3))):
+        llm.llm_gateway = gateway
+        succeeded, latency, elapsed = asyncio.run(run(model, args.calls, args.concurrency))
+        summary = latency.summary()
+        print(f"{name:<8} success {succeeded / args.calls:.1%}   p50 {summary['p50_ms']:.0f} ms   "
+              f"p95 {summary['p95_ms']:.0f} ms   p99 {summary['p99_ms']:.0f} ms   "
+              f"{args.calls / elapsed:.0f} calls/s")
+        print(f"         {gateway.counters.as_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Reformulation policy benchmark.
+
+Replays a scripted conversation through `rag_helper.standalone_question` once
+per policy and prints how many reformulation LLM calls each policy made and
+the p50/p95 latency of the standalone-question step. Uses the configured LLM.
+
+Run from the project root:
+    python -m benchmarks.bench_reformulation
+"""
+import argparse
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from rag import rag_helper
+from rag.reformulation import POLICIES, ReformulationPolicy
+
+CONVERSATION = [
+    "What are the names of the Stark children's direwolves?",
+    "Which one belongs to Arya?",
+    "Who are the three characters at the Mad Tea Party?",
+    "What does the Hatter say about time?",
+    "Why is he angry with it?",
+    "Who is the Queen of Hearts in Alice in Wonderland?",
+    "What happens at the croquet game?",
+    "And what does she order?",
+]
+
+
+def replay(policy: str) -> dict:
+    rag_helper.reformulation_policy = ReformulationPolicy(policy)
+    chat_history = []
+    for question in CONVERSATION:
+        rag_helper.standalone_question(
+            {"input": question, "chat_history": chat_history})
+        chat_history += [HumanMessage(question), AIMessage("(answer)")]
+    return rag_helper.reformulation_policy.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--policies", nargs="+", default=list(POLICIES),
+                        choices=POLICIES)
+    args = parser.parse_args()
+
+    for policy in args.policies:
+        stats = replay(policy)
+        print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
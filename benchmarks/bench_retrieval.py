@@ -0,0 +1,77 @@
+"""
+Retrieval quality benchmark: vector-only vs hybrid (vector + BM25) retrieval.
+
+For each labelled question in retrieval_questions.jsonl, a retrieved chunk is
+relevant when it contains one of the question's expected phrases. Prints
+recall@k (questions with a relevant chunk in the top k), MRR and mean latency
+per retriever and k. Needs a DB built by `create_db.py`.
+
+Run from the project root:
+    python -m benchmarks.bench_retrieval --k 2 4
+"""
+import argparse
+import json
+import os
+import time
+
+from rag.hybrid_retriever import HybridRetriever
+from shared.components import get_lexical_index, get_vector_store
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "retrieval_questions.jsonl")
+
+
+def load_questions(path: str = QUESTIONS_FILE) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def first_relevant_rank(documents, expected: list[str]) -> int | None:
+    "1-based rank of the first document containing an expected phrase."
+    for rank, document in enumerate(documents, start=1):
+        text = " ".join(document.page_content.split())
+        if any(phrase in text for phrase in expected):
+            return rank
+    return None
+
+
+def evaluate(retriever, questions: list[dict]) -> dict:
+    found, reciprocal_ranks, seconds = 0, 0.0, 0.0
+    for item in questions:
+        start = time.perf_counter()
+        documents = retriever.invoke(item["question"])
+        seconds += time.perf_counter() - start
+        rank = first_relevant_rank(documents, item["expected"])
+        if rank:
+            found += 1
+            reciprocal_ranks += 1 / rank
+    return {
+        "recall": found / len(questions),
+        "mrr": reciprocal_ranks / len(questions),
+        "latency_ms": seconds / len(questions) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--fetch-k", type=int, default=20,
+                        help="Candidates taken from each search before fusion.")
+    args = parser.parse_args()
+
+    questions = load_questions()
+    store, lexical = get_vector_store(), get_lexical_index()
+    print(f"{len(questions)} questions")
+    for k in args.k:
+        retrievers = {
+            "vector": store.as_retriever(search_type="similarity", search_kwargs={"k": k}),
+            "hybrid": HybridRetriever(vector_store=store, lexical_index=lexical,
+                                      k=k, fetch_k=args.fetch_k),
+        }
+        for name, retriever in retrievers.items():
+            result = evaluate(retriever, questions)
+            print(f"{name:<7} k={k:<3} recall@k {result['recall']:.2f}   "
+                  f"MRR {result['mrr']:.2f}   {result['latency_ms']:6.1f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
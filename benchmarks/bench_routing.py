@@ -0,0 +1,71 @@
+"""
+Query routing benchmark: keyword rules vs `QueryRouter`.
+
+Routes every labelled question in routing_questions.jsonl ({"question",
+"route"}) with the original keyword rules and with the router, and prints
+the accuracy of each, the questions each gets wrong, how the router decided
+(name, centroid or fallback) and its latency: the classification alone (once
+the query embedding is known) and the full routing including the embedding.
+Uses the configured embedder; EMBEDDING_PROVIDER=fake runs offline.
+
+Run from the project root:
+    python -m benchmarks.bench_routing --min-margin 0.02
+"""
+import argparse
+import json
+import os
+import time
+
+from shared.metrics import LatencyRecorder
+from shared.query_router import ROUTER_MIN_MARGIN, QueryRouter, keyword_route
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "routing_questions.jsonl")
+
+
+def load_labelled(path: str = QUESTIONS_FILE) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--min-margin", type=float, default=ROUTER_MIN_MARGIN)
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Passes over the questions for the latency measurements.")
+    args = parser.parse_args()
+
+    labelled = load_labelled()
+    router = QueryRouter(min_margin=args.min_margin)
+    router.centroids  # embed the intent examples before timing
+
+    wrong = {"keyword": [], "router": []}
+    for item in labelled:
+        decision = router.route(item["question"])
+        if keyword_route(item["question"]) != item["route"]:
+            wrong["keyword"].append(item["question"])
+        if decision.route != item["route"]:
+            wrong["router"].append(f"{item['question']}  ({decision.method}, {decision.intent}, "
+                                   f"margin {decision.margin or 0:.3f})")
+
+    print(f"{len(labelled)} questions, min margin {args.min_margin}")
+    for name, questions in wrong.items():
+        print(f"{name:<8} accuracy {1 - len(questions) / len(labelled):.2f}")
+        for question in questions:
+            print(f"    wrong: {question}")
+    print(f"router decisions: {router.counters.as_dict()}")
+
+    total = LatencyRecorder()
+    router.classify_latency = LatencyRecorder()
+    for _ in range(args.repeat):
+        for item in labelled:
+            start = time.perf_counter()
+            router.route(item["question"])
+            total.record(time.perf_counter() - start)
+    for name, recorder in (("classify", router.classify_latency), ("route", total)):
+        summary = recorder.summary()
+        print(f"{name:<9} p50 {summary['p50_ms']:.3f} ms   p95 {summary['p95_ms']:.3f} ms   "
+              f"p99 {summary['p99_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
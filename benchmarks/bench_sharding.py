@@ -0,0 +1,111 @@
+"""
+Sharding benchmark: query latency as corpora are added, one collection vs a shard per corpus.
+
+Adds synthetic corpora of random 384-dimensional vectors one at a time, both
+to a single Chroma collection and to a sharded DB (SHARD_BY=corpus, one
+Chroma DB per corpus), and after each addition prints p50/p95 latency of
+single-vector searches:
+
+- "single": the one collection holding every corpus;
+- "fan-out": every shard, searched in parallel and merged by score;
+- "pruned": only the first corpus's shard, selected by `shard_filter`;
+
+and recall@k of the single and fan-out searches against exact search. Both
+are approximate (HNSW); a smaller index per shard tends to be more exact.
+
+Shards are searched side by side, so fan-out latency stays flat only while
+there are CPU cores for the shards; pruning keeps it flat regardless.
+Query vectors are stored vectors with noise added. Uses throwaway
+directories; no embedding model is needed.
+
+Run from the project root:
+    python -m benchmarks.bench_sharding --corpora 8 --chunks 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+WRITE_BATCH = 1000
+
+
+def latency(search, queries) -> tuple[float, float]:
+    "p50 and p95 milliseconds of `search(query)` over the queries."
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append(time.perf_counter() - start)
+    return float(np.percentile(samples, 50) * 1e3), float(np.percentile(samples, 95) * 1e3)
+
+
+def recall(results: list[set], exact: list[set]) -> float:
+    return sum(len(got & want) for got, want in zip(results, exact)) / sum(map(len, exact))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpora", type=int, default=8, help="Corpora added, one at a time.")
+    parser.add_argument("--chunks", type=int, default=5000, help="Chunks per corpus.")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+
+    from ingest.shards import SHARD_SEARCH_THREADS, ShardedVectorStore, ShardSet
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        single = Chroma(persist_directory=f"{directory}/single")._collection
+        shards = ShardSet(f"{directory}/sharded", "data", "corpus")
+        store = ShardedVectorStore(f"{directory}/sharded")
+        files, stored = {}, []
+        print(f"{args.chunks} chunks per corpus, {args.dim} dimensions, k={args.k}, "
+              f"{SHARD_SEARCH_THREADS} search threads, {os.cpu_count()} CPUs")
+        for corpus in range(args.corpora):
+            vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            stored.append(vectors)
+            source = f"data/corpus{corpus}/chunks.txt"
+            ids = [f"{corpus}-{i}" for i in range(args.chunks)]
+            for start in range(0, args.chunks, WRITE_BATCH):
+                rows = slice(start, start + WRITE_BATCH)
+                batch = dict(ids=ids[rows], embeddings=vectors[rows].tolist(),
+                             metadatas=[{"source": source}] * len(ids[rows]),
+                             documents=[f"Chunk {id_}" for id_ in ids[rows]])
+                single.upsert(**batch)
+                shards.upsert(**batch)
+            files[source] = {"chunks": dict.fromkeys(ids, 0)}
+            shards.commit(files)
+
+            noisy = vectors[rng.integers(0, args.chunks, args.queries)]
+            noisy += rng.normal(scale=0.5 / args.dim ** 0.5, size=noisy.shape)
+            queries = noisy.tolist()
+            single_p50, single_p95 = latency(
+                lambda q: single.query(query_embeddings=[q], n_results=args.k,
+                                       include=["documents", "metadatas", "distances"]), queries)
+            fan_p50, fan_p95 = latency(lambda q: store.search([q], args.k), queries)
+            pruned_p50, pruned_p95 = latency(
+                lambda q: store.search([q], args.k, {"corpus": "corpus0"}), queries)
+
+            sample = queries[:50]
+            everything = np.concatenate(stored)
+            exact = [{f"{row // args.chunks}-{row % args.chunks}" for row in top[:args.k]}
+                     for top in np.argsort(-(np.array(sample) @ everything.T), axis=1)]
+            single_ids = [set(ids) for ids in
+                          single.query(query_embeddings=sample, n_results=args.k)["ids"]]
+            sharded_ids = [{doc.id for doc, _ in hits} for hits in store.search(sample, args.k)]
+            print(f"{corpus + 1:2d} corpora ({(corpus + 1) * args.chunks:6d} chunks)   "
+                  f"single p50 {single_p50:5.2f} p95 {single_p95:5.2f} ms   "
+                  f"fan-out p50 {fan_p50:5.2f} p95 {fan_p95:5.2f} ms   "
+                  f"pruned p50 {pruned_p50:5.2f} p95 {pruned_p95:5.2f} ms   "
+                  f"recall@{args.k} single {recall(single_ids, exact):.2f} "
+                  f"fan-out {recall(sharded_ids, exact):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Speculative retrieval benchmark: the reformulate-then-retrieve step with and without speculation.
+
+Replays a scripted conversation of follow-up questions through
+`rag_helper.standalone_question` and `rag_helper.retrieve_context`, once
+serially and once starting the search for the raw input first
+(`rag_helper.speculate`). The reformulation LLM call is simulated: it sleeps
+--llm-latency-ms and returns a scripted standalone question, some of them
+near-identical to the input and some rewritten. Prints p50/p95 of the step
+for both modes and, for the speculative one, how often the speculative
+results were reused, the time saved and the search time wasted.
+
+Uses the vector DB at CHROMA_PATH and the configured embedder; with
+EMBEDDING_PROVIDER=fake (and a DB built with it) it runs offline.
+
+Run from the project root:
+    python -m benchmarks.bench_speculative_retrieval --llm-latency-ms 400 --repeat 3
+"""
+import argparse
+import json
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from rag import rag_helper
+from rag.reformulation import ReformulationPolicy
+from shared.components import registry
+from shared.metrics import LatencyRecorder
+
+# (user input, standalone question the LLM returns)
+CONVERSATION = [
+    ("What are the names of the Stark children's direwolves?",
+     "What are the names of the Stark children's direwolves?"),
+    ("Which one belongs to Arya?", "Which direwolf belongs to Arya Stark?"),
+    ("And what happens to it?", "What happens to Arya Stark's direwolf Nymeria?"),
+    ("Who are the three characters at the Mad Tea Party?",
+     "Who are the three characters at the Mad Tea Party?"),
+    ("What does the Hatter say about time?",
+     "What does the Hatter say about time at the Mad Tea Party?"),
+    ("Why is he angry with it?", "Why is the Hatter angry with Time?"),
+    ("Who is the Queen of Hearts in Alice in Wonderland?",
+     "who is the queen of hearts in alice in wonderland"),
+    ("And what does she order?", "What does the Queen of Hearts order?"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rewrites = dict(CONVERSATION)
+
+    def rewrite(state):
+        time.sleep(args.llm_latency_ms / 1e3)
+        return rewrites[state["input"]]
+
+    registry.register("question_rewriter", lambda: RunnableLambda(rewrite))
+    # Every follow-up is reformulated, so every turn can speculate
+    rag_helper.reformulation_policy = ReformulationPolicy("history")
+    rag_helper.SPECULATIVE_RETRIEVAL_ENABLED = True
+    rag_helper.get_retriever().invoke(CONVERSATION[0][0])  # open the store
+
+    latency = {"serial": LatencyRecorder(), "speculative": LatencyRecorder()}
+    for _ in range(args.repeat):
+        for mode, recorder in latency.items():
+            chat_history = [HumanMessage("Hello"), AIMessage("Hi! Ask me about the books.")]
+            for question, _ in CONVERSATION:
+                state = {"input": question, "chat_history": chat_history}
+                start = time.perf_counter()
+                speculation = rag_helper.speculate(state) if mode == "speculative" else None
+                standalone = rag_helper.standalone_question(state)
+                rag_helper.retrieve_context(
+                    {**state, "standalone_question": standalone, "speculation": speculation},
+                    None)
+                recorder.record(time.perf_counter() - start)
+                chat_history = chat_history + [HumanMessage(question), AIMessage("(answer)")]
+
+    for mode, recorder in latency.items():
+        summary = recorder.summary()
+        print(f"{mode:<12} p50 {summary['p50_ms']:7.1f} ms   p95 {summary['p95_ms']:7.1f} ms")
+    print(json.dumps(rag_helper.get_speculative_retrieval().stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Startup benchmark.
+
+Each measurement runs in a fresh interpreter, so nothing is already imported
+or built:
+
+- `python -X importtime -c "import langchain_helper"`: total import time and
+  the slowest top-level imports;
+- wall time to import `langchain_helper`, then to answer a first tools query
+  and a first RAG query, with the components built along the way.
+
+Uses the local fake LLM (LLM_PROVIDER=fake), so no API key is needed; the RAG
+query needs a built vector DB.
+
+Run from the project root:
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = """
+import json, time
+start = time.perf_counter()
+import langchain_helper
+from shared.components import registry
+timings = {"import": time.perf_counter() - start}
+for name, question in [("first tools query", "What are Ana's stats?"),
+                       ("first rag query", "Who is the Queen of Hearts?")]:
+    start = time.perf_counter()
+    langchain_helper.execute_user_query({"input": question}, name)
+    timings[name] = time.perf_counter() - start
+    timings[name + " built"] = sorted(registry.build_seconds)
+print(json.dumps(timings))
+"""
+
+
+def run_python(args, env):
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True,
+                          text=True, check=True)
+
+
+def import_times(env, top: int):
+    "Return (total seconds, [(cumulative seconds, module)]) for imports made by langchain_helper."
+    stderr = run_python(["-X", "importtime", "-c", "import langchain_helper"], env).stderr
+    rows, total = [], 0.0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        # A module is listed after everything it imported
+        if depth == 1:
+            rows.append((int(cumulative) / 1e6, name.strip()))
+        elif depth == 0:
+            if name.strip() == "langchain_helper":
+                total = int(cumulative) / 1e6
+                break
+            rows = []
+    return total, sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=8,
+                        help="Number of slowest imports to list.")
+    args = parser.parse_args()
+
+    python_path = os.pathsep.join(
+        filter(None, [os.environ.get("PYTHONPATH"), PROJECT_ROOT]))
+    env = {**os.environ, "LLM_PROVIDER": "fake", "FAKE_LLM_LATENCY_MS": "0",
+           "PYTHONPATH": python_path}
+
+    total, rows = import_times(env, args.top)
+    print(f"import langchain_helper: {total * 1e3:.0f} ms (-X importtime)")
+    for seconds, name in rows:
+        print(f"  {seconds * 1e3:8.0f} ms  {name}")
+
+    timings = json.loads(run_python(["-c", COLD_START], env).stdout.splitlines()[-1])
+    print("cold start:")
+    for name in ("import", "first tools query", "first rag query"):
+        built = timings.get(name + " built")
+        suffix = f"   built: {', '.join(built)}" if built is not None else ""
+        print(f"  {name:<18} {timings[name] * 1e3:8.0f} ms{suffix}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Time-to-first-token benchmark for the streaming query path.
+
+Streams a few RAG and tool questions through `stream_user_query` and prints,
+per question, the time to the first answer token next to the total time, then
+the p50/p95 of both. Uses the configured LLM.
+
+Run from the project root:
+    python -m benchmarks.bench_streaming
+"""
+import json
+import time
+
+from langchain_helper import (stream_total_latency, stream_user_query,
+                              time_to_first_token)
+
+QUESTIONS = [
+    "What are the names of the Stark children's direwolves?",
+    "Who are the three characters at the Mad Tea Party?",
+    "What is Ana's profile?",
+    "How many followers does Sarah have?",
+]
+
+
+def main():
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        first = None
+        for _token in stream_user_query({"input": question}):
+            if first is None:
+                first = time.perf_counter() - start
+        total = time.perf_counter() - start
+        print(f"{question:<58} first token {first * 1e3:8.1f} ms, "
+              f"total {total * 1e3:8.1f} ms")
+
+    print(json.dumps({
+        "time_to_first_token": time_to_first_token.summary(),
+        "total": stream_total_latency.summary(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Tool-query benchmark: direct tool fast path vs the ReAct agent.
+
+Answers the tool questions below with `call_model_with_tools`, once with the
+fast path and once with every question going through the agent, and prints
+the LLM calls and tool-calling turns per query and the p50/p95 latency of
+each. Uses the configured LLM; LLM_PROVIDER=fake runs offline.
+
+Run from the project root:
+    python -m benchmarks.bench_tools_path --repeat 3
+"""
+import argparse
+import time
+
+from agent import agent_tools_helper
+from shared.metrics import Counters, LatencyRecorder
+
+QUESTIONS = [
+    "Show Ana's profile",
+    "What are Sarah's stats?",
+    "What is James's recent activity?",
+    "Get Priya's profile and stats",
+    "Show Marco's stats and recent activity",
+    "What are Ana's profile, stats and recent activity?",
+    "Who is Sarah?",
+    "How many followers does Priya have?",
+    # Two users: always answered by the agent
+    "Compare the stats of Ana and Marco",
+]
+
+
+def run(fast_path: bool, repeat: int) -> dict:
+    agent_tools_helper.TOOL_FAST_PATH_ENABLED = fast_path
+    agent_tools_helper.tool_path_counters = Counters(
+        *agent_tools_helper.tool_path_counters.as_dict())
+    latency = LatencyRecorder()
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            agent_tools_helper.call_model_with_tools({"input": question})
+            latency.record(time.perf_counter() - start)
+    return {**agent_tools_helper.tool_path_stats(), **latency.summary()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Passes over the questions per mode.")
+    args = parser.parse_args()
+
+    agent_tools_helper.get_agent()  # build the agent before timing
+    for name, fast_path in (("agent", False), ("fast path", True)):
+        stats = run(fast_path, args.repeat)
+        print(f"{name:<10} llm calls/query {stats['llm_calls_per_query']:.2f}   "
+              f"tool turns/query {stats['tool_turns_per_query']:.2f}   "
+              f"fast path {stats['fast_path']}, agent {stats['agent']}   "
+              f"p50 {stats['p50_ms']:.1f} ms   p95 {stats['p95_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
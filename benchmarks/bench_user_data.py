@@ -0,0 +1,79 @@
+"""
+User data access benchmark: direct backend calls vs `UserDataStore`.
+
+Simulates concurrent agent turns (--threads) each looking up the profile,
+stats and activity of a user picked from a small set, against a backend with
+--latency-ms per call, and prints the backend calls made and the p50/p95
+lookup latency with and without the store's cache and request coalescing.
+
+Run from the project root:
+    python -m benchmarks.bench_user_data --threads 16 --lookups 200
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.external_tools import ACTIVITY, PROFILES, STATS, USER_NAME_TO_ID
+from agent.user_data import KINDS, InMemoryBackend, UserDataStore
+from shared.metrics import LatencyRecorder
+
+
+class RemoteBackend(InMemoryBackend):
+    "In-memory records behind a simulated network round trip."
+
+    def __init__(self, latency: float):
+        super().__init__({"profile": PROFILES, "stats": STATS, "activity": ACTIVITY})
+        self.latency = latency
+        self.calls = 0
+
+    def fetch_many(self, kind, user_ids):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().fetch_many(kind, user_ids)
+
+
+def run(lookup, users: list[str], threads: int) -> LatencyRecorder:
+    latency = LatencyRecorder()
+
+    def turn(user):
+        start = time.perf_counter()
+        for kind in KINDS:
+            lookup(kind, user)
+        latency.record(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(turn, users))
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--lookups", type=int, default=200, help="Agent turns simulated.")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    users = [rng.choice(list(USER_NAME_TO_ID)) for _ in range(args.lookups)]
+
+    direct = RemoteBackend(args.latency_ms / 1e3)
+    direct_latency = run(lambda kind, user: direct.fetch_many(kind, [USER_NAME_TO_ID[user]]),
+                         users, args.threads)
+
+    backend = RemoteBackend(args.latency_ms / 1e3)
+    store = UserDataStore(backend, USER_NAME_TO_ID)
+    store_latency = run(store.get, users, args.threads)
+
+    print(f"{args.lookups} agent turns x {len(KINDS)} lookups, {args.threads} threads, "
+          f"backend latency {args.latency_ms:.0f} ms")
+    for name, calls, latency in (("direct", direct.calls, direct_latency),
+                                 ("store", backend.calls, store_latency)):
+        summary = latency.summary()
+        print(f"{name:<7} backend calls {calls:>5}   turn p50 {summary['p50_ms']:.1f} ms   "
+              f"p95 {summary['p95_ms']:.1f} ms")
+    print(f"store: {store.counters.as_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Vector store benchmark: Chroma vs the memory-mapped float32 and int8 indexes.
+
+Exports the Chroma DB at --db (or a synthetic one with --synthetic N random
+384-dimensional vectors) to a float32 and an int8 index, then, for each
+store, in a fresh interpreter so nothing is cached in the process:
+
+- the time to import the store's module, to open the store and to answer
+  a first query;
+- the memory added by opening and querying it: private (anonymous) memory,
+  and file pages mapped from the OS page cache, which processes share;
+- p50/p95 latency of single-vector searches;
+- recall@k against exact search (the float32 index).
+
+Query vectors are stored vectors with noise added, so they are not exact
+matches. The OS page cache is warm for all stores.
+
+Run from the project root:
+    python -m benchmarks.bench_vector_index --synthetic 50000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = os.path.join(".cache", "bench_vector_index")
+
+CHILD = """
+import json, sys, time
+import numpy as np
+
+def memory_mb():
+    "Private and file-backed resident memory (Linux)."
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                memory[line.split(":")[0]] = int(line.split()[1]) / 1024
+    return memory
+
+backend, path, queries_path, k = sys.argv[1:5]
+queries = np.load(queries_path)
+start = time.perf_counter()
+if backend == "chroma":
+    from langchain_chroma import Chroma
+else:
+    from ingest.vector_index import MmapVectorStore
+imported = time.perf_counter()
+before = memory_mb()
+store = Chroma(persist_directory=path) if backend == "chroma" else MmapVectorStore(path)
+opened = time.perf_counter()
+results = [[doc.id for doc in store.similarity_search_by_vector(queries[0].tolist(), k=int(k))]]
+first = time.perf_counter()
+latencies = []
+for query in queries[1:]:
+    start_query = time.perf_counter()
+    results.append([doc.id for doc in store.similarity_search_by_vector(query.tolist(), k=int(k))])
+    latencies.append(time.perf_counter() - start_query)
+after = memory_mb()
+print(json.dumps({"import_s": imported - start, "open_s": opened - imported,
+                  "first_query_s": first - opened,
+                  "anon_mb": after["RssAnon"] - before["RssAnon"],
+                  "file_mb": after["RssFile"] - before["RssFile"],
+                  "latencies": latencies, "results": results}))
+"""
+
+
+def synthetic_db(path: str, count: int, dim: int = 384, batch: int = 5000):
+    "A Chroma DB of `count` random clustered vectors, built once."
+    from langchain_chroma import Chroma
+    db = Chroma(persist_directory=path)
+    if db._collection.count() >= count:
+        return db
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(64, dim)).astype(np.float32)
+    for start in range(db._collection.count(), count, batch):
+        n = min(batch, count - start)
+        vectors = centers[rng.integers(0, len(centers), n)] + rng.normal(size=(n, dim))
+        ids = [f"chunk-{i}" for i in range(start, start + n)]
+        db._collection.add(ids=ids, embeddings=vectors.astype(np.float32).tolist(),
+                           documents=[f"Synthetic chunk {i}." for i in range(start, start + n)],
+                           metadatas=[{"source": "synthetic", "row": i}
+                                      for i in range(start, start + n)])
+    return db
+
+
+def run_child(backend: str, path: str, queries_path: str, k: int) -> dict:
+    python_path = os.pathsep.join(filter(None, [os.environ.get("PYTHONPATH"), PROJECT_ROOT]))
+    output = subprocess.run([sys.executable, "-c", CHILD, backend, path, queries_path, str(k)],
+                            env={**os.environ, "PYTHONPATH": python_path},
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=None, help="Chroma directory (default CHROMA_PATH).")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Benchmark a synthetic DB of this many vectors instead.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    from ingest.vector_index import export_vector_index
+    from langchain_chroma import Chroma
+    from shared.components import CHROMA_PATH
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    if args.synthetic:
+        db_path = os.path.join(WORK_DIR, f"chroma-{args.synthetic}")
+        db = synthetic_db(db_path, args.synthetic)
+    else:
+        db_path = args.db or CHROMA_PATH
+        db = Chroma(persist_directory=db_path)
+
+    indexes = {}
+    for dtype in ("float32", "int8"):
+        indexes[dtype] = os.path.join(WORK_DIR, f"index-{dtype}")
+        count = export_vector_index(db, indexes[dtype], dtype)
+    rng = np.random.default_rng(1)
+    sample = db.get(limit=args.queries, offset=int(rng.integers(0, max(1, count - args.queries))),
+                    include=["embeddings"])["embeddings"]
+    sample = np.asarray(sample, dtype=np.float32)
+    scale = np.abs(sample).mean()
+    queries = sample + rng.normal(scale=scale, size=sample.shape).astype(np.float32)
+    queries_path = os.path.join(WORK_DIR, "queries.npy")
+    np.save(queries_path, queries)
+
+    sizes = {name: os.path.getsize(os.path.join(indexes[dtype], name)) / 1e6
+             for dtype, name in (("float32", "vectors.f32"), ("int8", "vectors.i8"))}
+    print(f"{count} vectors from {db_path}; matrices: float32 {sizes['vectors.f32']:.1f} MB, "
+          f"int8 {sizes['vectors.i8']:.1f} MB; {len(queries)} queries, k={args.k}")
+
+    runs = {"chroma": run_child("chroma", db_path, queries_path, args.k),
+            "mmap float32": run_child("mmap", indexes["float32"], queries_path, args.k),
+            "mmap int8": run_child("mmap", indexes["int8"], queries_path, args.k)}
+    exact = runs["mmap float32"]["results"]
+    for name, run in runs.items():
+        latencies = np.asarray(run["latencies"]) * 1e3
+        recall = np.mean([len(set(got) & set(want)) / len(want)
+                          for got, want in zip(run["results"], exact)])
+        print(f"{name:<13} import {run['import_s'] * 1e3:6.0f} ms   open "
+              f"{run['open_s'] * 1e3:6.1f} ms   first query {run['first_query_s'] * 1e3:6.1f} ms   "
+              f"private +{run['anon_mb']:5.1f} MB   mapped +{run['file_mb']:5.1f} MB   "
+              f"p50 {np.percentile(latencies, 50):6.2f} ms   "
+              f"p95 {np.percentile(latencies, 95):6.2f} ms   recall@{args.k} {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Load test for the async query path against the local fake LLM.
+
+Runs N concurrent sessions, each asking a series of questions through
+`aexecute_user_query` on its own thread ID, and reports throughput and latency
+for each concurrency level. The fake LLM sleeps asynchronously for
+--llm-latency-ms per call, so throughput should grow with the number of
+sessions until LLM_MAX_CONCURRENCY is reached. The first row shows the
+synchronous `execute_user_query` for comparison.
+
+Run from the project root (needs a built vector DB):
+    python -m benchmarks.load_test_async --sessions 1 4 16 64
+"""
+import argparse
+import asyncio
+import os
+import time
+
+QUESTIONS = [
+    "Who are the three characters at the Mad Tea Party?",
+    "What are the names of the Stark children's direwolves?",
+    "What are Ana's stats?",
+    "What happened when Alice fell down the rabbit hole?",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries", type=int, default=4,
+                        help="Questions asked by each session.")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--max-concurrency", type=int, default=64,
+                        help="LLM_MAX_CONCURRENCY for the run.")
+    return parser.parse_args()
+
+
+def report(label: str, latencies: list[float], elapsed: float):
+    from shared.metrics import percentile
+    print(f"{label:<22} {len(latencies) / elapsed:8.1f} queries/s   "
+          f"p50 {percentile(latencies, 50) * 1e3:7.1f} ms   "
+          f"p95 {percentile(latencies, 95) * 1e3:7.1f} ms")
+
+
+async def run_sessions(aexecute_user_query, sessions: int, queries: int) -> list[float]:
+    latencies = []
+
+    async def session(index: int):
+        for i in range(queries):
+            start = time.perf_counter()
+            question = QUESTIONS[(index + i) % len(QUESTIONS)]
+            await aexecute_user_query({"input": question}, f"load-{sessions}-{index}")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    return latencies
+
+
+def main():
+    args = parse_args()
+    # The provider is chosen when the LLM is built, so configure it before importing.
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    from langchain_helper import aexecute_user_query, execute_user_query, warm_up
+
+    warm_up()
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.queries):
+        query_start = time.perf_counter()
+        execute_user_query({"input": QUESTIONS[i % len(QUESTIONS)]}, "load-sync")
+        latencies.append(time.perf_counter() - query_start)
+    report("sync, 1 session", latencies, time.perf_counter() - start)
+
+    for sessions in args.sessions:
+        start = time.perf_counter()
+        latencies = asyncio.run(
+            run_sessions(aexecute_user_query, sessions, args.queries))
+        report(f"async, {sessions} sessions", latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
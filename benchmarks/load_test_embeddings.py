@@ -0,0 +1,125 @@
+"""
+Load test for query embedding: one model call per caller vs the micro-batching `EmbeddingService`.
+
+N client threads each embed --requests distinct questions as fast as they
+can, against one shared model:
+
+- "direct": each caller calls the model itself. A model instance runs one
+  call at a time, so callers queue for it;
+- "batched": callers go through `EmbeddingService`, which coalesces them
+  into batches of up to --max-batch-size texts, waiting up to --max-wait-ms.
+
+For each client count it prints throughput, p50/p95/p99 latency per query and,
+for the service, the mean batch size. The embedding cache is not used.
+
+`--model gpt4all` loads the real model, batched through `embed_gpt4all_batch`.
+The default `simulated` model sleeps --call-ms per call plus --text-ms per
+text while holding a lock, like a native inference call with a fixed per-call
+cost. Measure the real model to calibrate it.
+
+Run from the project root:
+    python -m benchmarks.load_test_embeddings --clients 1 4 16 64
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from shared.embedding_service import (EMBEDDING_BATCH_MAX_SIZE,
+                                      EMBEDDING_BATCH_MAX_WAIT_MS, EmbeddingService,
+                                      embed_many)
+from shared.fake_embeddings import HashingEmbeddings
+from shared.metrics import percentile
+
+
+class SimulatedModel(HashingEmbeddings):
+    "Hashing embeddings that cost `call_s` per call plus `text_s` per text, one call at a time."
+
+    def __init__(self, call_s: float, text_s: float):
+        super().__init__()
+        self.call_s = call_s
+        self.text_s = text_s
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            time.sleep(self.call_s + self.text_s * len(texts))
+            return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class SerializedModel(Embeddings):
+    "A model that is not thread-safe, called by one thread at a time."
+
+    def __init__(self, model: Embeddings):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with self._lock:
+            return self.model.embed_query(text)
+
+
+def run(embeddings: Embeddings, clients: int, requests: int) -> tuple[float, list[float]]:
+    "Queries per second and per-query latencies of `clients` threads embedding at once."
+    latencies = []
+    barrier = threading.Barrier(clients)
+
+    def client(index: int):
+        barrier.wait()
+        for i in range(requests):
+            start = time.perf_counter()
+            embeddings.embed_query(f"Question {i} of client {index}: which direwolf is Arya's?")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client, range(clients)))
+    return clients * requests / (time.perf_counter() - start), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=20, help="Queries per client.")
+    parser.add_argument("--model", choices=["simulated", "gpt4all"], default="simulated")
+    parser.add_argument("--call-ms", type=float, default=8.0)
+    parser.add_argument("--text-ms", type=float, default=1.0)
+    parser.add_argument("--max-batch-size", type=int, default=EMBEDDING_BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=EMBEDDING_BATCH_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    if args.model == "gpt4all":
+        from shared.get_embedding_function import (embed_gpt4all_batch,
+                                                   get_gpt4all_embeddings)
+        model, infer = get_gpt4all_embeddings(), embed_gpt4all_batch
+        direct = SerializedModel(model)
+    else:
+        model = direct = SimulatedModel(args.call_ms / 1e3, args.text_ms / 1e3)
+        infer = embed_many
+    direct.embed_query("warm up")
+
+    print(f"model {args.model}, max batch {args.max_batch_size}, "
+          f"max wait {args.max_wait_ms} ms, {args.requests} queries per client")
+    for clients in args.clients:
+        service = EmbeddingService(lambda: model, infer, args.max_batch_size, args.max_wait_ms)
+        for mode, embeddings in (("direct", direct), ("batched", service)):
+            throughput, latencies = run(embeddings, clients, args.requests)
+            batch = (f"   mean batch {service.stats()['mean_batch_size']:5.1f}"
+                     if mode == "batched" else "")
+            print(f"{clients:3d} clients {mode:<8} {throughput:8.1f} queries/s   "
+                  f"p50 {percentile(latencies, 50) * 1e3:7.1f} ms   "
+                  f"p95 {percentile(latencies, 95) * 1e3:7.1f} ms   "
+                  f"p99 {percentile(latencies, 99) * 1e3:7.1f} ms{batch}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Offline retrieval-quality and latency suite.
+
+Runs without network access or API keys, so it can run in CI:
+
+- the deterministic `HashingEmbeddings` (EMBEDDING_PROVIDER=fake) and the fake
+  chat model (LLM_PROVIDER=fake) replace GPT4All and Gemini;
+- data_sources/books is ingested with the normal `create_db` pipeline into a
+  separate DB (--db, incremental between runs);
+- recall@k and MRR of the configured `rag_helper` retriever are measured on
+  the labelled questions in retrieval_questions.jsonl;
+- p50/p95/p99 latency is measured for query embedding, retrieval and the full
+  workflow (`execute_user_query`).
+
+Results are written as JSON (--output). Pass a previous results file as
+--baseline to print the change of every metric.
+
+Run from the project root:
+    python -m benchmarks.offline_suite --baseline .cache/benchmarks/previous.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+
+OFFLINE_ENV = {
+    "EMBEDDING_PROVIDER": "fake",
+    "LLM_PROVIDER": "fake",
+    # The books only: the PDFs of data_sources/personal need Unstructured's models
+    "DATA_PATH": "data_sources/books",
+}
+
+
+def retrieval_metrics(ranks: list[int | None], ks: list[int]) -> dict:
+    "recall@k for each k and MRR, from each question's first relevant rank (or None)."
+    count = len(ranks)
+    metrics = {"questions": count}
+    for k in ks:
+        metrics[f"recall@{k}"] = sum(1 for rank in ranks if rank and rank <= k) / count
+    metrics["mrr"] = sum(1 / rank for rank in ranks if rank) / count
+    return metrics
+
+
+def with_k(retriever, k: int):
+    "Copy of the retriever returning `k` documents."
+    if hasattr(retriever, "search_kwargs"):
+        return retriever.model_copy(update={"search_kwargs": {**retriever.search_kwargs, "k": k}})
+    return retriever.model_copy(update={"k": k})
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    "Numeric leaves of nested results, keyed by dotted path."
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def print_comparison(results: dict, baseline: dict):
+    current, previous = flatten(results), flatten(baseline)
+    print(f"\nchange vs baseline ({baseline['meta'].get('commit')}):")
+    for key, value in current.items():
+        if key in previous and not key.startswith("meta."):
+            print(f"  {key:<32} {previous[key]:12.4f} -> {value:12.4f}  "
+                  f"({value - previous[key]:+.4f})")
+
+
+def run(args) -> dict:
+    # Imported after the environment is configured, which selects the fake models
+    import create_db
+    from benchmarks.bench_retrieval import first_relevant_rank, load_questions
+    from langchain_helper import execute_user_query
+    from rag import rag_helper
+    from shared.components import get_embeddings
+    from shared.metrics import LatencyRecorder
+
+    create_db.save_to_chroma(workers=1)
+    questions = load_questions()
+    ks = sorted(args.k)
+
+    retriever = with_k(rag_helper.get_retriever(), ks[-1])
+    ranks = [first_relevant_rank(retriever.invoke(item["question"]), item["expected"])
+             for item in questions]
+
+    embedding, search, graph = LatencyRecorder(), LatencyRecorder(), LatencyRecorder()
+    embeddings = get_embeddings()
+    for repeat in range(args.repeat):
+        for i, item in enumerate(questions):
+            start = time.perf_counter()
+            embeddings.embed_query(item["question"])
+            embedding.record(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            retriever.invoke(item["question"])
+            search.record(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            execute_user_query({"input": item["question"]}, f"offline-suite-{repeat}-{i}")
+            graph.record(time.perf_counter() - start)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "retriever": rag_helper.RETRIEVER,
+            "context_assembly": rag_helper.CONTEXT_ASSEMBLY_ENABLED,
+            "llm_latency_ms": args.llm_latency_ms,
+            "repeat": args.repeat,
+        },
+        "retrieval": retrieval_metrics(ranks, ks),
+        "latency": {
+            "embedding": embedding.summary(),
+            "search": search.summary(),
+            "graph": graph.summary(),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Passes over the questions for the latency measurements.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0,
+                        help="Simulated latency of each fake LLM call.")
+    parser.add_argument("--db", default=".cache/offline_suite/chroma",
+                        help="Directory of the suite's vector DB.")
+    parser.add_argument("--output", default=None,
+                        help="Results file (default .cache/benchmarks/offline-<time>.json).")
+    parser.add_argument("--baseline", default=None, help="Results file to compare with.")
+    args = parser.parse_args()
+
+    os.environ.update(OFFLINE_ENV, CHROMA_PATH=args.db,
+                      FAKE_LLM_LATENCY_MS=str(args.llm_latency_ms))
+    results = run(args)
+
+    print(json.dumps({key: results[key] for key in ("retrieval", "latency")}, indent=2))
+    output = args.output or os.path.join(
+        ".cache", "benchmarks", f"offline-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,265 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
-from langchain_community.document_loaders import DirectoryLoader
+from itertools import groupby
+from pathlib import Path
+from typing import Iterable, Iterator
+
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
-from shared.get_embedding_function import get_embedding_function
+from ingest.bm25_index import BM25Index
+from ingest.chunking import CHUNKER, StructuredSplitter
+from ingest.chroma_writes import update_metadatas
+from ingest.loaders import PARSE_WORKERS, iter_documents
+from ingest.manifest import (MANIFEST_FILE, IngestManifest, assign_chunk_ids,
+                             file_sha256)
+from ingest.pipeline import (EMBED_BATCH_SIZE, EMBED_WORKERS, embed_and_write,
+                             prefetch)
+from ingest.shards import SHARD_BY, ShardSet, load_catalog
+from ingest.vector_index import DTYPES, export_vector_index, index_meta
+from shared.components import CHROMA_PATH, VECTOR_INDEX_PATH, VECTOR_STORE
+
+# dtype of the memory-mapped vector index exported after each update
+VECTOR_INDEX_DTYPE = os.environ.get("VECTOR_INDEX_DTYPE", "int8")
 
-DATA_PATH = "data_sources/books"
-CHROMA_PATH = "chroma"
+# Set DATA_PATH=data_sources (with SHARD_BY=corpus) to also ingest the other
+# corpora; each top-level folder of it is then stored in its own shard
+DATA_PATH = os.environ.get("DATA_PATH", "data_sources/books")
 
+# Settings of the "recursive" chunker
+SPLITTER_SETTINGS = {
+    "chunk_size": 1000,
+    "chunk_overlap": 500,
+}
+CHUNKERS = ("structured", "recursive")
 
-def load_documents():
-    "Load PDF documents from a folder."
-    loader = DirectoryLoader(DATA_PATH,
-                             recursive=True, show_progress=True)
-    documents = loader.load()
-    return documents
+# Documents buffered between the parsing and splitting stages.
+DOCUMENT_QUEUE_SIZE = 4
 
 
-def split_text(documents: list[Document]):
-    "Split documents into chunks."
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=500,
-        length_function=len,
-        add_start_index=True,
+def list_source_files(data_path: str = DATA_PATH) -> list[str]:
+    "List the files to ingest, skipping hidden ones."
+    return sorted(
+        str(path) for path in Path(data_path).rglob("*")
+        if path.is_file() and not any(part.startswith(".") for part in path.parts)
     )
 
-    chunks = text_splitter.split_documents(documents)
-    print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
-    return chunks
 
+def load_documents(paths: list[str] | None = None, workers: int = PARSE_WORKERS,
+                   chunker: str = CHUNKER) -> Iterator[Document]:
+    "Lazily load documents from the data folder, or only the given files, for `chunker`."
+    if paths is None:
+        paths = list_source_files()
+    return iter_documents(paths, workers, structured=chunker == "structured")
 
-def save_to_chroma(chunks: list[Document]):
-    "Clear previous db, and save the new db."
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
-    # create db
-    db = Chroma.from_documents(
-        chunks, get_embedding_function(), persist_directory=CHROMA_PATH
-    )
-    print(f"Saved {len(chunks)} chunks to {CHROMA_PATH}.")
+
+def get_splitter(chunker: str = CHUNKER):
+    "The text splitter of a chunker: \"structured\" (by headings and tokens) or \"recursive\"."
+    if chunker == "structured":
+        return StructuredSplitter()
+    if chunker == "recursive":
+        return RecursiveCharacterTextSplitter(
+            **SPLITTER_SETTINGS,
+            length_function=len,
+            add_start_index=True,
+        )
+    raise ValueError(f"Unknown CHUNKER {chunker!r}, expected one of {CHUNKERS}")
+
+
+def split_text(documents: Iterable[Document], chunker: str = CHUNKER) -> Iterator[Document]:
+    "Split documents into chunks as they arrive."
+    text_splitter = get_splitter(chunker)
+
+    for document in documents:
+        yield from text_splitter.split_documents([document])
+
+
+def splitter_fingerprint(chunker: str = CHUNKER) -> str:
+    "Hash of the chunking settings; changing them invalidates every stored chunk."
+    # The recursive chunker keeps its original fingerprint, so existing DBs stay valid
+    chunker_settings = SPLITTER_SETTINGS if chunker == "recursive" else get_splitter(chunker).settings
+    settings = json.dumps(chunker_settings, sort_keys=True)
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+
+def sync_source(db: Chroma, lexical: BM25Index, manifest: IngestManifest, source: str,
+                sha256: str, chunks: list[Document]) -> list[tuple[str, Document]]:
+    """
+    Bring the stored chunks of one source file in line with `chunks`.
+
+    Chunks that are gone are deleted, and chunks that kept their content but
+    moved within the file get their metadata updated without re-embedding.
+    New chunks are added to the BM25 index right away; their vectors are
+    written by the embedding pipeline.
+
+    Returns the `(id, chunk)` pairs that are new and still need embedding.
+    """
+    ids = assign_chunk_ids(chunks)
+    old_chunks = manifest.chunks(source)
+    new_chunks = {id_: chunk.metadata.get("start_index", 0)
+                  for id_, chunk in zip(ids, chunks)}
+
+    added = [(id_, chunk) for id_, chunk in zip(ids, chunks)
+             if id_ not in old_chunks]
+    moved = [(id_, chunk) for id_, chunk in zip(ids, chunks)
+             if id_ in old_chunks and old_chunks[id_] != new_chunks[id_]]
+    deleted = [id_ for id_ in old_chunks if id_ not in new_chunks]
+
+    if deleted:
+        db.delete(ids=deleted)
+        lexical.remove(deleted)
+    lexical.add((id_, chunk.page_content) for id_, chunk in added)
+    if moved:
+        update_metadatas(db, [id_ for id_, _ in moved],
+                         [chunk.metadata for _, chunk in moved])
+
+    manifest.set_file(source, sha256, new_chunks)
+    print(f"{source}: {len(added)} new, {len(moved)} moved, "
+          f"{len(deleted)} deleted chunks.")
+    return added
+
+
+def sync_changed_sources(shards: ShardSet, manifest: IngestManifest,
+                         hashes: dict[str, str],
+                         chunks: Iterable[Document]) -> Iterator[tuple[str, Document]]:
+    """
+    Sync each changed file as its chunks stream in, yielding the chunks to embed.
+
+    A file's chunks arrive together, so only one file's chunks are held at a
+    time. Changed files that produced no chunks still have their old chunks
+    deleted. Each file is synced against the DB and BM25 index of its shard.
+    """
+    seen = set()
+    for source, source_chunks in groupby(chunks, lambda c: c.metadata["source"]):
+        seen.add(source)
+        yield from sync_source(*shards.stores(source), manifest, source, hashes[source],
+                               list(source_chunks))
+    for source in hashes.keys() - seen:
+        sync_source(*shards.stores(source), manifest, source, hashes[source], [])
+
+
+def backfill_lexical_index(db: Chroma, lexical: BM25Index, page_size: int = 1000):
+    "Index every chunk already in the DB, for DBs built before the BM25 index existed."
+    offset = 0
+    while True:
+        page = db.get(limit=page_size, offset=offset, include=["documents"])
+        if not page["ids"]:
+            break
+        lexical.add(zip(page["ids"], page["documents"]))
+        offset += len(page["ids"])
+    print(f"Indexed {offset} existing chunks for keyword search.")
+
+
+def save_to_chroma(batch_size: int = EMBED_BATCH_SIZE,
+                   workers: int = EMBED_WORKERS,
+                   export_index: str | None = VECTOR_INDEX_DTYPE if VECTOR_STORE == "mmap" else None):
+    """
+    Incrementally update the DB from the data folder.
+
+    Unchanged files are skipped without being parsed, changed files only have
+    their new chunks embedded, and chunks of deleted files are removed. Files
+    stream through parsing, splitting, embedding and writing with bounded
+    queues in between, so memory depends on the batch size, not the corpus.
+    The BM25 keyword index is kept in step with the vector store. With
+    SHARD_BY=corpus or source, each shard has its own DB and BM25 index (see
+    `ingest/shards.py`).
+
+    With `export_index` ("float32" or "int8"), the vectors are then exported to the
+    memory-mapped index at VECTOR_INDEX_PATH (a subdirectory per shard); by default
+    whenever VECTOR_STORE=mmap.
+    """
+    manifest = IngestManifest.load(CHROMA_PATH, splitter_fingerprint())
+    shards = ShardSet(CHROMA_PATH, DATA_PATH, SHARD_BY)
+    if SHARD_BY == "none":
+        db, lexical = shards.open("")
+        if not len(lexical) and manifest.sources():
+            backfill_lexical_index(db, lexical)
+
+    hashes = {path: file_sha256(path) for path in list_source_files()}
+    changed = {path: sha256 for path, sha256 in hashes.items()
+               if manifest.is_changed(path, sha256)}
+
+    for source in manifest.sources() - set(hashes):
+        stale = list(manifest.chunks(source))
+        if stale:
+            db, lexical = shards.stores(source)
+            db.delete(ids=stale)
+            lexical.remove(stale)
+        print(f"{source}: removed, deleted {len(stale)} chunks.")
+        manifest.remove_file(source)
+
+    documents = prefetch(load_documents(list(changed)), DOCUMENT_QUEUE_SIZE)
+    chunks = prefetch(split_text(documents), 2 * batch_size)
+    to_embed = sync_changed_sources(shards, manifest, changed, chunks)
+    stats = embed_and_write(shards, to_embed, batch_size, workers)
+
+    shards.commit(manifest.files)
+    manifest.save()
+    print(f"{len(changed)} of {len(hashes)} files changed, "
+          f"embedded {stats} into {CHROMA_PATH}.")
+
+    if export_index:
+        export_vector_indexes(shards, export_index, manifest.generation)
+
+
+def export_vector_indexes(shards: ShardSet, dtype: str, generation: int):
+    """
+    Export the vectors to memory-mapped indexes, one per shard in VECTOR_INDEX_PATH.
+
+    Only shards changed by this run, or not yet exported as `dtype`, are exported.
+    """
+    if shards.shard_by == "none":
+        targets = {"": VECTOR_INDEX_PATH}
+    else:
+        targets = {name: os.path.join(VECTOR_INDEX_PATH, name)
+                   for name in load_catalog(CHROMA_PATH)["shards"]}
+        if os.path.isdir(VECTOR_INDEX_PATH):
+            for name in set(os.listdir(VECTOR_INDEX_PATH)) - set(targets):
+                shutil.rmtree(os.path.join(VECTOR_INDEX_PATH, name), ignore_errors=True)
+    touched = shards.opened()
+    for name, path in targets.items():
+        meta = index_meta(path)
+        if meta is None or meta["dtype"] != dtype or \
+                (name in touched and meta["generation"] != generation):
+            db, _ = shards.open(name)
+            count = export_vector_index(db, path, dtype, generation)
+            print(f"Exported {count} {dtype} vectors to {path}.")
 
 
-def create_vector_db():
-    "Create vector DB from personal PDF files."
-    documents = load_documents()
-    doc_chunks = split_text(documents)
-    save_to_chroma(doc_chunks)
+def create_vector_db(reset: bool = False, batch_size: int = EMBED_BATCH_SIZE,
+                     workers: int = EMBED_WORKERS, **options):
+    "Create or incrementally update the vector DB from the data folder; see `save_to_chroma`."
+    # A DB without a manifest was built before incremental updates existed and
+    # its chunk IDs are unknown, so it has to be rebuilt once. A DB sharded
+    # differently would put chunks in the wrong shards, but rebuilding it
+    # re-embeds everything, so that is left to --reset.
+    manifest_exists = os.path.exists(os.path.join(CHROMA_PATH, MANIFEST_FILE))
+    shard_by = load_catalog(CHROMA_PATH)["shard_by"]
+    if not reset and manifest_exists and shard_by != SHARD_BY:
+        raise SystemExit(f"The DB in {CHROMA_PATH} is sharded by {shard_by}, not "
+                         f"SHARD_BY={SHARD_BY}. Run with --reset to rebuild it, "
+                         f"or set SHARD_BY={shard_by}.")
+    if reset or not manifest_exists:
+        if os.path.exists(CHROMA_PATH):
+            shutil.rmtree(CHROMA_PATH)
+    save_to_chroma(batch_size, workers, **options)
 
 
 if __name__ == "__main__":
-    create_vector_db()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reset", action="store_true",
+                        help="Delete the DB and re-embed every chunk.")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Chunks per embedding call and per DB write.")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS,
+                        help="Embedding processes; 1 embeds in this process.")
+    parser.add_argument("--export-index", choices=DTYPES,
+                        default=VECTOR_INDEX_DTYPE if VECTOR_STORE == "mmap" else None,
+                        help="Also export the vectors to the memory-mapped index "
+                             "(the default with VECTOR_STORE=mmap).")
+    args = parser.parse_args()
+    create_vector_db(reset=args.reset, batch_size=args.batch_size,
+                     workers=args.workers, export_index=args.export_index)
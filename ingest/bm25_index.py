@@ -0,0 +1,129 @@
+"""
+Persistent BM25 index over the chunks stored in Chroma.
+
+The index is an inverted index in SQLite next to the manifest, keyed by the
+same chunk IDs as the vector store, so `create_db.py` can add and delete
+chunks from both in the same pass. It catches exact names and rare terms
+(direwolf names, minor characters) that embedding similarity tends to miss.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Iterable
+
+BM25_FILE = "bm25.sqlite3"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "about", "after", "all", "also", "an", "and", "any", "are", "as", "at",
+    "be", "been", "but", "by", "can", "could", "did", "do", "does", "for", "from",
+    "had", "has", "have", "he", "her", "his", "how", "i", "if", "in", "into", "is",
+    "it", "its", "me", "my", "no", "not", "of", "on", "or", "our", "she", "so",
+    "than", "that", "the", "their", "them", "then", "there", "these", "they",
+    "this", "to", "was", "we", "were", "what", "when", "where", "which", "who",
+    "whom", "why", "will", "with", "would", "you", "your",
+}
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    "Lowercased word tokens without stopwords, possessive 's' or single characters."
+    return [token for token in _TOKEN.findall(text.lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    BM25 inverted index stored in `<directory>/bm25.sqlite3`.
+
+    Writes (`add`, `remove`) are only visible to other connections after
+    `commit`, which `create_db.py` calls together with `IngestManifest.save`.
+    """
+
+    def __init__(self, directory: str, k1: float = BM25_K1, b: float = BM25_B):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, BM25_FILE)
+        self.k1 = k1
+        self.b = b
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    length INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS postings_by_id ON postings (id);
+            """)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, items: Iterable[tuple[str, str]]):
+        "Index `(id, text)` pairs, replacing chunks that are already indexed."
+        items = list(items)
+        with self._lock:
+            self._remove([id_ for id_, _ in items])
+            for id_, text in items:
+                counts = Counter(tokenize(text))
+                self._conn.execute("INSERT INTO chunks (id, length) VALUES (?, ?)",
+                                   (id_, sum(counts.values())))
+                self._conn.executemany(
+                    "INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                    [(term, id_, tf) for term, tf in counts.items()])
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            self._remove(list(ids))
+
+    def _remove(self, ids: list[str]):
+        self._conn.executemany("DELETE FROM postings WHERE id = ?", [(i,) for i in ids])
+        self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def search(self, query: str, k: int = 20) -> list[tuple[str, float]]:
+        "Return up to `k` `(id, score)` pairs, best first."
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            total, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+            if not total:
+                return []
+            postings = self._conn.execute(
+                "SELECT p.term, p.id, p.tf, c.length FROM postings p "
+                f"JOIN chunks c ON c.id = p.id WHERE p.term IN ({placeholders})",
+                list(terms)).fetchall()
+
+        document_frequency = Counter(term for term, _, _, _ in postings)
+        average_length = total_length / total
+        scores = Counter()
+        for term, id_, tf, length in postings:
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[id_] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,19 @@
+# Writes to a Chroma DB that LangChain's `Chroma` has no public API for
+#
+# `Chroma.add_documents` and `Chroma.update_documents` always embed the texts
+# again, but ingestion writes vectors embedded by its own pipeline and updates
+# moved chunks' metadata without re-embedding. Both go to the underlying
+# collection, and this is the one place that reaches into it.
+from langchain_chroma import Chroma
+
+
+def upsert_embedded(db: Chroma, ids: list[str], embeddings: list[list[float]],
+                    metadatas: list[dict], documents: list[str]):
+    "Insert or replace chunks whose vectors were already computed."
+    db._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas,
+                          documents=documents)
+
+
+def update_metadatas(db: Chroma, ids: list[str], metadatas: list[dict]):
+    "Replace the metadata of stored chunks, keeping their text and vectors."
+    db._collection.update(ids=ids, metadatas=metadatas)
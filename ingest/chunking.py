@@ -0,0 +1,222 @@
+"""
+Structure-aware chunking for ingestion.
+
+`StructuredSplitter` cuts a document into sections at its headings (Markdown
+`#` and underlined headings, and "CHAPTER I." style lines of plain-text
+books), then packs each section's sentences into chunks of about
+`chunk_tokens` tokens. Chunks never cross a section boundary, except that
+consecutive sections small enough to share a chunk are kept together, and
+they end at a paragraph break where one falls in the second half of the
+chunk. Only chunks cut inside a paragraph overlap the next one, by up to
+`overlap_tokens` tokens of whole sentences.
+
+Each chunk's text is a verbatim slice of the document starting at its
+`start_index`, so context assembly can still merge neighbouring chunks, and
+its `section` metadata holds the heading path, e.g. "A Game of Thrones > Bran (I)".
+
+HTML is rendered to Markdown by `ingest/loaders.py` first, so the same
+heading rules apply to both formats.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from langchain_core.documents import Document
+
+from shared.tokens import approximate_tokens
+
+# "recursive" (the original fixed-size character splitter) or "structured" (this module)
+CHUNKER = os.environ.get("CHUNKER", "recursive")
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))
+# Bump when the splitting rules change, so stored chunks are rebuilt
+CHUNKER_VERSION = 1
+
+SECTION_SEPARATOR = " > "
+
+_ATX_HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+_SETEXT_HEADING = re.compile(r"^([^\n]+)\n(=+|-+)[ \t]*$", re.MULTILINE)
+_CHAPTER_HEADING = re.compile(
+    r"^(?:CHAPTER|Chapter|BOOK|Book|PART|Part)[ \t]+(?:[IVXLCDM]+|\d+)\b[^\n]{0,80}$",
+    re.MULTILINE)
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"'’”)\]_*]*\s+")
+_WORD_END = re.compile(r"\s+")
+
+
+@dataclass
+class Section:
+    "A heading's span of the document text: `text[start:end]`, heading line included."
+    path: tuple[str, ...]
+    start: int
+    end: int
+
+
+def _headings(text: str) -> list[tuple[int, int, int, str]]:
+    "(start, end, level, title) of every heading, in document order."
+    headings = [(m.start(), m.end(), len(m.group(1)), m.group(2).strip())
+                for m in _ATX_HEADING.finditer(text)]
+    headings += [(m.start(), m.end(), 1 if m.group(2)[0] == "=" else 2, m.group(1).strip())
+                 for m in _SETEXT_HEADING.finditer(text) if m.group(1).strip()]
+    if not headings:
+        # Plain-text books: a chapter line, with the chapter's title on the next line
+        chapters = []
+        for m in _CHAPTER_HEADING.finditer(text):
+            title, end = m.group().strip(), m.end()
+            line_end = text.find("\n", end + 1)
+            line_end = line_end if line_end != -1 else len(text)
+            subtitle = text[end + 1:line_end].strip()
+            if subtitle and not _CHAPTER_HEADING.match(subtitle):
+                title, end = f"{title} {subtitle}", line_end
+            chapters.append((m.start(), end, title))
+        # Lines of a table of contents have no text of their own and are not headings
+        for (start, end, title), following in zip(chapters, chapters[1:] + [(len(text),)]):
+            if text[end:following[0]].strip():
+                headings.append((start, end, 1, title))
+    return sorted(headings)
+
+
+def split_sections(text: str) -> list[Section]:
+    """
+    The document's sections, with the text before the first heading as a section with no path.
+
+    A heading directly followed by a subheading opens the subheading's section
+    rather than a section of its own.
+    """
+    sections = []
+    stack: list[tuple[int, str]] = []
+    start, body, path = 0, 0, ()
+    for offset, end, level, title in _headings(text):
+        if text[body:offset].strip():
+            sections.append(Section(path, start, offset))
+            start = offset
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, title))
+        body, path = end, tuple(title for _, title in stack)
+    if text[body:].strip():
+        sections.append(Section(path, start, len(text)))
+    return sections
+
+
+def _spans(text: str, start: int, end: int, pattern: re.Pattern) -> Iterator[tuple[int, int]]:
+    "Non-blank spans of text[start:end] between matches of `pattern`, whitespace trimmed."
+    for m in [*pattern.finditer(text, start, end), None]:
+        stop = m.end() if m else end
+        span = text[start:stop]
+        stripped = span.strip()
+        if stripped:
+            left = start + len(span) - len(span.lstrip())
+            yield left, left + len(stripped)
+        start = stop
+
+
+class StructuredSplitter:
+    """
+    Splits documents along their headings into chunks of about `chunk_tokens` tokens.
+
+    Parameters
+    ----------
+    chunk_tokens : int
+        Target chunk size, as estimated by `approximate_tokens`.
+    overlap_tokens : int
+        Most tokens of whole sentences repeated at the start of a chunk that
+        continues a paragraph.
+    """
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    @property
+    def settings(self) -> dict:
+        "Everything that changes the chunks produced, for the ingestion fingerprint."
+        return {"chunker": "structured", "chunk_tokens": self.chunk_tokens,
+                "overlap_tokens": self.overlap_tokens, "version": CHUNKER_VERSION}
+
+    def _units(self, text: str, section: Section) -> list[tuple[int, int, bool]]:
+        "(start, end, starts_paragraph) of each sentence, long sentences cut at words."
+        units = []
+        for paragraph_start, paragraph_end in _spans(text, section.start, section.end,
+                                                     _PARAGRAPH_BREAK):
+            first = True
+            for start, end in _spans(text, paragraph_start, paragraph_end, _SENTENCE_END):
+                if approximate_tokens(text[start:end]) <= self.chunk_tokens:
+                    units.append((start, end, first))
+                    first = False
+                    continue
+                piece_start = start
+                for word_start, word_end in _spans(text, start, end, _WORD_END):
+                    if approximate_tokens(text[piece_start:word_end]) > self.chunk_tokens \
+                            and word_start > piece_start:
+                        units.append((piece_start, word_start, first))
+                        first, piece_start = False, word_start
+                units.append((piece_start, end, first))
+                first = False
+        return units
+
+    def _section_chunks(self, text: str, section: Section) -> list[tuple[int, int]]:
+        "(start, end) of the chunks of one section."
+        units = self._units(text, section)
+        chunks = []
+        first = 0
+        while first < len(units):
+            start = units[first][0]
+            last = first
+            while last + 1 < len(units) and \
+                    approximate_tokens(text[start:units[last + 1][1]]) <= self.chunk_tokens:
+                last += 1
+            if last + 1 == len(units):
+                chunks.append((start, units[last][1]))
+                break
+            # Prefer to end at a paragraph break in the second half of the chunk
+            for cut in range(last, first, -1):
+                if units[cut + 1][2] and \
+                        approximate_tokens(text[start:units[cut][1]]) * 2 >= self.chunk_tokens:
+                    last = cut
+                    break
+            chunks.append((start, units[last][1]))
+            following = last + 1
+            if not units[following][2]:
+                # Mid-paragraph: repeat the last sentences that fit in the overlap
+                while following - 1 > first and approximate_tokens(
+                        text[units[following - 1][0]:units[last][1]]) <= self.overlap_tokens:
+                    following -= 1
+            first = following
+        return chunks
+
+    def split_document(self, document: Document) -> list[Document]:
+        text = document.page_content
+        spans: list[tuple[int, int, tuple[str, ...]]] = []
+        # Whole sections since the last flush, which may still share a chunk
+        pending: list[tuple[int, int, tuple[str, ...]]] = []
+        for section in split_sections(text):
+            chunks = self._section_chunks(text, section)
+            if len(chunks) == 1 and pending and approximate_tokens(
+                    text[pending[0][0]:chunks[0][1]]) <= self.chunk_tokens:
+                pending.append((*chunks[0], section.path))
+                continue
+            if pending:
+                spans.append((pending[0][0], pending[-1][1], pending[0][2]))
+                pending = []
+            if len(chunks) == 1:
+                pending = [(*chunks[0], section.path)]
+            else:
+                spans.extend((start, end, section.path) for start, end in chunks)
+        if pending:
+            spans.append((pending[0][0], pending[-1][1], pending[0][2]))
+
+        documents = []
+        for start, end, path in spans:
+            metadata = {**document.metadata, "start_index": start}
+            if path:
+                metadata["section"] = SECTION_SEPARATOR.join(path)
+            documents.append(Document(page_content=text[start:end], metadata=metadata))
+        return documents
+
+    def split_documents(self, documents: Iterable[Document]) -> list[Document]:
+        return [chunk for document in documents for chunk in self.split_document(document)]
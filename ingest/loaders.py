@@ -0,0 +1,156 @@
+# Lazy, per-file parallel document loading for ingestion
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Iterator
+
+from langchain_community.document_loaders import (UnstructuredFileLoader,
+                                                  UnstructuredHTMLLoader,
+                                                  UnstructuredMarkdownLoader,
+                                                  UnstructuredPDFLoader)
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+PARSE_WORKERS = os.cpu_count() or 1
+
+LOADERS_BY_EXTENSION = {
+    ".html": UnstructuredHTMLLoader,
+    ".htm": UnstructuredHTMLLoader,
+    ".md": UnstructuredMarkdownLoader,
+    ".pdf": UnstructuredPDFLoader,
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MarkdownTextLoader(BaseLoader):
+    "Loads a Markdown or text file as is, keeping the headings the structured chunker splits on."
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        with open(self.file_path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        yield Document(page_content=text, metadata={"source": self.file_path})
+
+
+class _MarkdownRenderer(HTMLParser):
+    "Collects an HTML page's text as Markdown blocks: headings, paragraphs and list items."
+
+    BLOCKS = {"p", "div", "li", "tr", "br", "blockquote", "pre", "section", "article",
+              "header", "footer", "table", "ul", "ol", "dt", "dd",
+              "h1", "h2", "h3", "h4", "h5", "h6"}
+    SKIPPED = {"head", "script", "style", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: list[str] = []
+        self._text: list[str] = []
+        self._prefix = ""
+        self._skipping = 0
+
+    def _flush(self):
+        text = _WHITESPACE.sub(" ", "".join(self._text)).strip()
+        if text:
+            self.blocks.append(self._prefix + text)
+        self._text, self._prefix = [], ""
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self._flush()
+            if tag[0] == "h" and tag[1:].isdigit():
+                self._prefix = "#" * int(tag[1]) + " "
+            elif tag == "li":
+                self._prefix = "- "
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCKS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+class HTMLMarkdownLoader(BaseLoader):
+    "Loads an HTML file as Markdown text, with `<h1>`-`<h6>` as `#` headings."
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        with open(self.file_path, encoding="utf-8", errors="replace") as f:
+            renderer = _MarkdownRenderer()
+            renderer.feed(f.read())
+            renderer.close()
+        yield Document(page_content="\n\n".join(renderer.blocks),
+                       metadata={"source": self.file_path})
+
+
+# Used by the structured chunker, which needs the headings Unstructured drops
+STRUCTURED_LOADERS_BY_EXTENSION = {
+    ".html": HTMLMarkdownLoader,
+    ".htm": HTMLMarkdownLoader,
+    ".md": MarkdownTextLoader,
+    ".markdown": MarkdownTextLoader,
+    ".txt": MarkdownTextLoader,
+}
+
+
+def get_loader(path: str, structured: bool = False) -> BaseLoader:
+    """
+    Pick the loader for a file by extension, falling back to Unstructured's auto-detection.
+
+    With `structured`, Markdown, text and HTML files are loaded as Markdown, keeping their headings.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    loader_cls = STRUCTURED_LOADERS_BY_EXTENSION.get(extension) if structured else None
+    loader_cls = loader_cls or LOADERS_BY_EXTENSION.get(extension, UnstructuredFileLoader)
+    return loader_cls(path)
+
+
+def load_file(path: str, structured: bool = False) -> list[Document]:
+    "Parse a single file. Runs inside a parser process."
+    return list(get_loader(path, structured).lazy_load())
+
+
+def iter_documents(paths: list[str], workers: int = PARSE_WORKERS,
+                   max_pending: int | None = None,
+                   structured: bool = False) -> Iterator[Document]:
+    """
+    Yield the documents of `paths` lazily, parsing files in parallel.
+
+    Each file is parsed by one of `workers` processes and its documents are
+    yielded in the order of `paths`. No more than `max_pending` files (by
+    default two per worker) are parsed ahead of the consumer, so only a few
+    files are held in memory at once however large the corpus is.
+    `structured` is passed on to `get_loader`.
+    """
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        for path in paths:
+            yield from get_loader(path, structured).lazy_load()
+        return
+
+    max_pending = max_pending or 2 * workers
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(load_file, path, structured))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
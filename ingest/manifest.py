@@ -0,0 +1,145 @@
+# Ingestion manifest: per-file and per-chunk content hashes for incremental updates
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+
+from langchain_core.documents import Document
+
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    "Hash a source file's bytes."
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, text: str, occurrence: int = 0) -> str:
+    """
+    Build a stable chunk ID from the chunk's source and content.
+
+    The ID does not depend on the chunk's position, so inserting text earlier in
+    a file leaves the IDs of the unchanged chunks after it intact. `occurrence`
+    tells apart identical chunks within the same source.
+    """
+    key = f"{source}\0{occurrence}\0{text}".encode("utf-8")
+    return hashlib.sha256(key).hexdigest()
+
+
+def assign_chunk_ids(chunks: list[Document]) -> list[str]:
+    "Return the stable ID of every chunk, in order."
+    seen = defaultdict(int)
+    ids = []
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        key = (source, chunk.page_content)
+        ids.append(chunk_id(source, chunk.page_content, seen[key]))
+        seen[key] += 1
+    return ids
+
+
+class IngestManifest:
+    """
+    Record of what is currently stored in the vector DB.
+
+    For every source file the manifest keeps the file's content hash and the
+    IDs (content hashes) of its chunks, mapped to their `start_index`. A
+    `fingerprint` of the chunking settings is stored too; when it changes every
+    file counts as changed, because the same file would now produce different
+    chunks. `generation` is a timestamp taken whenever the stored chunks change,
+    so it also moves forward across a `--reset`, and caches built on top of the
+    DB can tell when they are stale.
+    """
+
+    def __init__(self, path: str, fingerprint: str, files: dict | None = None,
+                 generation: int = 0):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.files = files or {}
+        self.generation = generation
+        self.dirty = False
+
+    @classmethod
+    def load(cls, directory: str, fingerprint: str) -> "IngestManifest":
+        "Load the manifest stored in `directory`, or start an empty one."
+        path = os.path.join(directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls(path, fingerprint)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        manifest = cls(path, data.get("fingerprint", ""),
+                       data.get("files", {}), data.get("generation", 0))
+        if manifest.fingerprint != fingerprint:
+            manifest.fingerprint = fingerprint
+            # Forget the file hashes so every file is re-chunked, but keep the
+            # chunk IDs so their old chunks can still be deleted.
+            for entry in manifest.files.values():
+                entry["sha256"] = None
+            manifest.dirty = True
+        return manifest
+
+    def sources(self) -> set[str]:
+        return set(self.files)
+
+    def is_changed(self, source: str, sha256: str) -> bool:
+        entry = self.files.get(source)
+        return entry is None or entry["sha256"] != sha256
+
+    def chunks(self, source: str) -> dict[str, int]:
+        "Return the stored chunk IDs of `source` mapped to their start index."
+        return self.files.get(source, {}).get("chunks", {})
+
+    def set_file(self, source: str, sha256: str, chunks: dict[str, int]):
+        self.files[source] = {"sha256": sha256, "chunks": chunks}
+        self.dirty = True
+
+    def remove_file(self, source: str):
+        self.files.pop(source, None)
+        self.dirty = True
+
+    def save(self):
+        "Write the manifest atomically, bumping the generation if anything changed."
+        if not self.dirty:
+            return
+        self.generation = max(time.time_ns(), self.generation + 1)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "fingerprint": self.fingerprint,
+                "generation": self.generation,
+                "files": self.files,
+            }, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class GenerationWatcher:
+    """
+    Reads the manifest generation of a DB directory, cheaply enough to call per request.
+
+    The manifest is only re-read when its modification time changes, so
+    readers such as the answer cache notice a re-ingest without parsing JSON
+    on every lookup.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self._mtime = None
+        self._generation = 0
+
+    def current(self) -> int:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        if mtime != self._mtime:
+            with open(self.path, encoding="utf-8") as f:
+                self._generation = json.load(f).get("generation", 0)
+            self._mtime = mtime
+        return self._generation
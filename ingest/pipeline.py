@@ -0,0 +1,169 @@
+# Batched, multi-process embedding pipeline for ingestion
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from typing import Iterable, Iterator
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from ingest.chroma_writes import upsert_embedded
+from ingest.shards import ShardSet
+from shared.get_embedding_function import get_embedding_function
+
+EMBED_BATCH_SIZE = 64
+EMBED_WORKERS = os.cpu_count() or 1
+
+# Embedder owned by each worker process, created once by `_init_worker`.
+_worker_embedder = None
+
+
+def _init_worker():
+    global _worker_embedder
+    _worker_embedder = get_embedding_function()
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    return _worker_embedder.embed_documents(texts)
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """
+    Peak resident memory in MB of this process or, with RUSAGE_CHILDREN, of the
+    largest of its finished children (not their sum).
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss / scale
+
+
+@dataclass
+class IngestStats:
+    "Throughput and memory figures for one pipeline run."
+    chunks: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    # Of the largest finished child (embedding or parsing worker), peaking at its own time
+    child_peak_rss_mb: float = 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        children = (f", largest child process {self.child_peak_rss_mb:.0f} MB"
+                    if self.child_peak_rss_mb else "")
+        return (f"{self.chunks} chunks in {self.batches} batches, "
+                f"{self.seconds:.1f}s ({self.chunks_per_sec:.1f} chunks/sec), "
+                f"peak RSS {self.peak_rss_mb:.0f} MB{children}")
+
+
+def iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    "Group an iterable into lists of at most `size` items without materialising it."
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+_END_OF_STREAM = object()
+
+
+def prefetch(items: Iterable, maxsize: int) -> Iterator:
+    """
+    Run an upstream stage in a background thread behind a bounded queue.
+
+    The thread produces at most `maxsize` items ahead of the consumer and then
+    blocks, so neighbouring stages overlap without either buffering the whole
+    stream. Exceptions raised upstream are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+
+    def produce():
+        try:
+            for item in items:
+                buffer.put(item)
+        except BaseException as exc:
+            buffer.put(exc)
+        else:
+            buffer.put(_END_OF_STREAM)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while (item := buffer.get()) is not _END_OF_STREAM:
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def write_batch(db: Chroma | ShardSet, batch: list[tuple[str, Document]],
+                embeddings: list[list[float]]):
+    "Upsert one batch of pre-embedded chunks into Chroma, or into their shards of a `ShardSet`."
+    write = db.upsert if isinstance(db, ShardSet) else partial(upsert_embedded, db)
+    write(
+        ids=[id_ for id_, _ in batch],
+        embeddings=embeddings,
+        metadatas=[chunk.metadata for _, chunk in batch],
+        documents=[chunk.page_content for _, chunk in batch],
+    )
+
+
+def embed_and_write(db: Chroma | ShardSet, chunks: Iterable[tuple[str, Document]],
+                    batch_size: int = EMBED_BATCH_SIZE,
+                    workers: int = EMBED_WORKERS) -> IngestStats:
+    """
+    Embed `(id, chunk)` pairs in batches and upsert them into `db`.
+
+    Batches are embedded on a pool of `workers` processes, each holding its own
+    embedder, and written to Chroma in submission order. At most two batches
+    per worker are in flight; once that limit is reached the oldest batch is
+    written before more chunks are read from `chunks`, so memory is bounded by
+    the batch size rather than by the size of the input. With one worker, or
+    when `chunks` is a list that fits in one batch, everything runs in this
+    process instead of paying for a process pool.
+    """
+    if isinstance(chunks, list):
+        workers = min(workers, -(-len(chunks) // batch_size))
+    stats = IngestStats()
+    start = time.perf_counter()
+
+    def record(batch, embeddings):
+        write_batch(db, batch, embeddings)
+        stats.chunks += len(batch)
+        stats.batches += 1
+
+    if workers <= 1:
+        embedder = None
+        for batch in iter_batches(chunks, batch_size):
+            # Created on first use so an empty run never loads the model.
+            embedder = embedder or get_embedding_function()
+            record(batch, embedder.embed_documents(
+                [chunk.page_content for _, chunk in batch]))
+    else:
+        # Spawn rather than fork: the parent holds an open Chroma client.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker) as pool:
+            pending = deque()
+            for batch in iter_batches(chunks, batch_size):
+                texts = [chunk.page_content for _, chunk in batch]
+                pending.append((batch, pool.submit(_embed_batch, texts)))
+                if len(pending) >= 2 * workers:
+                    batch, future = pending.popleft()
+                    record(batch, future.result())
+            while pending:
+                batch, future = pending.popleft()
+                record(batch, future.result())
+
+    stats.seconds = time.perf_counter() - start
+    stats.peak_rss_mb = peak_rss_mb()
+    stats.child_peak_rss_mb = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return stats
@@ -0,0 +1,358 @@
+"""
+Sharded storage: one Chroma DB and BM25 index per corpus or per source file.
+
+With SHARD_BY=corpus (each top-level folder of the data folder, e.g. `books`
+and `personal`) or SHARD_BY=source (each file), `create_db.py` writes every
+shard to its own directory `<CHROMA_PATH>/shards/<name>/`, holding a Chroma
+DB and a BM25 index like an unsharded DB. A catalog (`shards.json`) records
+each shard's corpus, source files, file types and chunk count.
+
+At query time `ShardedVectorStore` and `ShardedLexicalIndex` search the shards
+concurrently and merge their top-k by score, so adding a corpus adds a shard
+searched in parallel rather than growing the index every query scans.
+Searches can be limited to the shards whose catalog metadata matches a
+`shard_filter`, e.g. `{"corpus": "books"}`, before anything is searched.
+
+SHARD_BY=none, the default, keeps a single DB in CHROMA_PATH itself.
+"""
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable, Iterable
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from ingest.bm25_index import BM25Index
+from shared.instrumentation import count
+
+# "none" (a single DB), "corpus" (one shard per top-level data folder) or "source" (one per file)
+SHARD_BY = os.environ.get("SHARD_BY", "none")
+SHARD_MODES = ("corpus", "source", "none")
+SHARD_SEARCH_THREADS = int(os.environ.get("SHARD_SEARCH_THREADS", "8"))
+
+SHARDS_DIR = "shards"
+CATALOG_FILE = "shards.json"
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]+")
+
+# Shards of one search are queried side by side on this pool
+_shard_pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_THREADS, thread_name_prefix="shard-search")
+
+
+def shard_name(source: str, data_path: str, shard_by: str = SHARD_BY) -> str:
+    "Name of the shard holding `source`, a file under `data_path`; empty when unsharded."
+    if shard_by == "none":
+        return ""
+    if shard_by not in SHARD_MODES:
+        raise ValueError(f"Unknown SHARD_BY {shard_by!r}, expected one of {SHARD_MODES}")
+    relative = os.path.relpath(source, data_path)
+    parts = relative.split(os.sep)
+    if shard_by == "corpus":
+        name = parts[0] if len(parts) > 1 else os.path.basename(os.path.abspath(data_path))
+    else:
+        name = "--".join(parts)
+    return _UNSAFE.sub("-", name).strip("-.") or "default"
+
+
+def shard_directory(directory: str, name: str) -> str:
+    return os.path.join(directory, SHARDS_DIR, name) if name else directory
+
+
+def load_catalog(directory: str) -> dict:
+    "The shard catalog of a DB directory; an unsharded DB has none and gets an empty one."
+    try:
+        with open(os.path.join(directory, CATALOG_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"shard_by": "none", "shards": {}}
+
+
+def is_sharded(directory: str) -> bool:
+    return load_catalog(directory)["shard_by"] != "none"
+
+
+def matches(metadata: dict, shard_filter: dict | None) -> bool:
+    """
+    Whether a shard's catalog metadata satisfies `shard_filter`.
+
+    Each filter value may be a single value or a list of accepted values; a
+    list in the metadata (such as `sources`) matches when any item is accepted.
+    """
+    for key, accepted in (shard_filter or {}).items():
+        accepted = set(accepted) if isinstance(accepted, (list, tuple, set)) else {accepted}
+        value = metadata.get(key)
+        values = set(value) if isinstance(value, list) else {value}
+        if not accepted & values:
+            return False
+    return True
+
+
+class ShardSet:
+    """
+    The shards of a DB directory during ingestion, opened on first use.
+
+    `create_db.py` syncs each file against the shard's Chroma DB and BM25 index
+    (`stores`), and the embedding pipeline writes batches through `upsert`,
+    which routes every chunk to its source's shard.
+    """
+
+    def __init__(self, directory: str, data_path: str, shard_by: str = SHARD_BY):
+        self.directory = directory
+        self.data_path = data_path
+        self.shard_by = shard_by
+        self._stores: dict[str, tuple[Any, BM25Index]] = {}
+
+    def shard_of(self, source: str) -> str:
+        return shard_name(source, self.data_path, self.shard_by)
+
+    def open(self, name: str):
+        "The (Chroma DB, BM25 index) of a shard."
+        if name not in self._stores:
+            from langchain_chroma import Chroma
+            path = shard_directory(self.directory, name)
+            # Embeddings are computed by the ingestion pipeline, not by Chroma.
+            self._stores[name] = Chroma(persist_directory=path), BM25Index(path)
+        return self._stores[name]
+
+    def stores(self, source: str):
+        return self.open(self.shard_of(source))
+
+    def opened(self) -> dict[str, tuple[Any, BM25Index]]:
+        return dict(self._stores)
+
+    def upsert(self, ids: list[str], embeddings: list[list[float]], metadatas: list[dict],
+               documents: list[str]):
+        "Write pre-embedded chunks into the shards of their sources."
+        from ingest.chroma_writes import upsert_embedded
+        by_shard: dict[str, list[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            by_shard.setdefault(self.shard_of(metadata["source"]), []).append(i)
+        for name, rows in by_shard.items():
+            db, _ = self.open(name)
+            upsert_embedded(db, [ids[i] for i in rows], [embeddings[i] for i in rows],
+                            [metadatas[i] for i in rows], [documents[i] for i in rows])
+
+    def commit(self, manifest_files: dict):
+        """
+        Commit the BM25 indexes and write the catalog from the manifest's files.
+
+        Shards left without any source file are deleted.
+        """
+        for _, lexical in self._stores.values():
+            lexical.commit()
+        if self.shard_by == "none":
+            return
+        shards: dict[str, dict] = {}
+        for source, entry in sorted(manifest_files.items()):
+            name = self.shard_of(source)
+            shard = shards.setdefault(name, {"corpus": shard_name(source, self.data_path, "corpus"),
+                                             "sources": [], "types": [], "chunks": 0})
+            shard["sources"].append(source)
+            extension = os.path.splitext(source)[1].lower()
+            if extension not in shard["types"]:
+                shard["types"].append(extension)
+            shard["chunks"] += len(entry.get("chunks", {}))
+        for name in set(load_catalog(self.directory)["shards"]) - set(shards):
+            self._stores.pop(name, None)
+            shutil.rmtree(shard_directory(self.directory, name), ignore_errors=True)
+
+        path = os.path.join(self.directory, CATALOG_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"shard_by": self.shard_by, "shards": shards}, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+
+class _CatalogView:
+    "Per-shard objects of a sharded DB, reopened when `create_db.py` rewrites the catalog."
+
+    def __init__(self, directory: str, open_shard: Callable[[str], Any]):
+        self.directory = directory
+        self._open_shard = open_shard
+        self._mtime = None
+        self._catalog: dict = {"shard_by": "none", "shards": {}}
+        self._opened: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(self.directory, CATALOG_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime:
+            self._catalog = load_catalog(self.directory)
+            self._opened = {name: shard for name, shard in self._opened.items()
+                            if name in self._catalog["shards"]}
+            self._mtime = mtime
+
+    def catalog(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return self._catalog
+
+    def select(self, shard_filter: dict | None = None) -> dict[str, Any]:
+        "The shards whose catalog metadata matches `shard_filter`, opened on first use."
+        with self._lock:
+            self._refresh()
+            selected = {}
+            for name, metadata in self._catalog["shards"].items():
+                if matches({"name": name, **metadata}, shard_filter):
+                    if name not in self._opened:
+                        self._opened[name] = self._open_shard(name)
+                    selected[name] = self._opened[name]
+            return selected
+
+
+def fan_out(function: Callable[[Any], Any], shards: Iterable[Any]) -> list:
+    "`function(shard)` for every shard, concurrently; a single shard runs in this thread."
+    shards = list(shards)
+    if len(shards) <= 1:
+        return [function(shard) for shard in shards]
+    futures = [_shard_pool.submit(copy_context().run, function, shard) for shard in shards]
+    return [future.result() for future in futures]
+
+
+def _search_shard(store: VectorStore, embeddings: list[list[float]], k: int,
+                  filter: dict | None) -> list[list[tuple[Document, float]]]:
+    "Each query's `k` nearest chunks of one shard with a score, higher is closer."
+    collection = getattr(store, "_collection", None)
+    if collection is None:  # MmapVectorStore, scored by cosine similarity
+        if filter:
+            raise ValueError("Metadata filters need VECTOR_STORE=chroma")
+        index = store.index
+        return [[(index.document(row), score) for row, score in hits]
+                for hits in store.search(embeddings, k, index)]
+    results = collection.query(query_embeddings=embeddings, n_results=k, where=filter,
+                                      include=["documents", "metadatas", "distances"])
+    return [
+        [(Document(page_content=text, metadata=metadata or {}, id=id_), -distance)
+         for text, metadata, id_, distance in zip(texts, metadatas, ids, distances)]
+        for texts, metadatas, ids, distances in zip(results["documents"], results["metadatas"],
+                                                    results["ids"], results["distances"])
+    ]
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    Read-only vector store searching the shards of a sharded DB in parallel.
+
+    Scores of the shards are comparable because every shard uses the same
+    embedder and distance; the merged results are the best `k` over all shards.
+    Extra keyword arguments of the search methods: `shard_filter` limits the
+    search to matching shards (see `matches`), and `filter` is a Chroma
+    metadata filter applied within each shard.
+
+    Parameters
+    ----------
+    directory : str
+        The DB directory (CHROMA_PATH).
+    embedding : Embeddings
+        Embeds queries; must be the model the shards were built with.
+    backend : str
+        "chroma", or "mmap" to search each shard's memory-mapped export in `index_path`.
+    """
+
+    def __init__(self, directory: str, embedding: Embeddings | None = None,
+                 backend: str = "chroma", index_path: str | None = None):
+        self.directory = directory
+        self._embedding = embedding
+        self.backend = backend
+        self.index_path = index_path
+        self.shards = _CatalogView(directory, self._open_shard)
+
+    def _open_shard(self, name: str) -> VectorStore:
+        if self.backend == "mmap":
+            from ingest.vector_index import MmapVectorStore
+            return MmapVectorStore(os.path.join(self.index_path, name), self._embedding)
+        from langchain_chroma import Chroma
+        return Chroma(persist_directory=shard_directory(self.directory, name),
+                      embedding_function=self._embedding)
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self._embedding
+
+    def search(self, embeddings: list[list[float]], k: int = 4,
+               shard_filter: dict | None = None,
+               filter: dict | None = None) -> list[list[tuple[Document, float]]]:
+        "Each query's `k` best (document, score) over the selected shards, best first."
+        shards = self.shards.select(shard_filter).values()
+        count("shards_searched", len(shards))
+        per_shard = fan_out(lambda store: _search_shard(store, embeddings, k, filter), shards)
+        return [heapq.nlargest(k, (hit for hits in shard_hits for hit in hits),
+                               key=lambda hit: hit[1])
+                for shard_hits in zip(*per_shard)] if per_shard else [[] for _ in embeddings]
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4,
+                                               **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.search([embedding], k, kwargs.get("shard_filter"), kwargs.get("filter"))[0]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4,
+                                    **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_by_vectors(self, embeddings: list[list[float]], k: int = 4,
+                                     **kwargs: Any) -> list[list[Document]]:
+        "The `k` nearest documents to each query vector, each shard queried once for the batch."
+        return [[doc for doc, _ in hits] for hits in
+                self.search(embeddings, k, kwargs.get("shard_filter"), kwargs.get("filter"))]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def _select_relevance_score_fn(self):
+        if self.backend == "mmap":
+            return lambda score: score  # cosine similarity
+        # Scores are negated squared L2 distances of normalized vectors
+        return lambda score: 1.0 + score / 2
+
+    def get_by_ids(self, ids) -> list[Document]:
+        ids = list(ids)
+        found = {doc.id: doc for docs in fan_out(lambda store: store.get_by_ids(ids),
+                                                 self.shards.select().values())
+                 for doc in docs}
+        return [found[id_] for id_ in ids if id_ in found]
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None,
+                  **kwargs: Any) -> list[str]:
+        raise NotImplementedError("Shards are written by create_db.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Shards are written by create_db.py")
+
+
+class ShardedLexicalIndex:
+    """
+    BM25 search over the shards of a sharded DB, in parallel.
+
+    Each shard scores with its own term statistics, so scores of different
+    shards are only approximately comparable; the merge keeps the best `k`.
+    """
+
+    def __init__(self, directory: str):
+        self.shards = _CatalogView(directory,
+                                   lambda name: BM25Index(shard_directory(directory, name)))
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self.shards.select().values())
+
+    def search(self, query: str, k: int = 20,
+               shard_filter: dict | None = None) -> list[tuple[str, float]]:
+        "Return up to `k` `(id, score)` pairs over the selected shards, best first."
+        hits = fan_out(lambda index: index.search(query, k),
+                       self.shards.select(shard_filter).values())
+        return heapq.nlargest(k, (hit for shard_hits in hits for hit in shard_hits),
+                              key=lambda hit: hit[1])
+
@@ -0,0 +1,327 @@
+"""
+Read-only vector store over memory-mapped NumPy matrices.
+
+An alternative to querying Chroma for a corpus that changes only when
+`create_db.py` runs: the chunk vectors are exported (`export_vector_index`)
+into a directory holding
+
+- `vectors.f32`: the unit-normalized vectors as one contiguous float32 matrix;
+- `vectors.i8` and `scales.npy` (int8 indexes only): the same vectors
+  quantized per row to int8, a quarter of the size;
+- `docs.jsonl` and `offsets.npy`: each chunk's ID, text and metadata, one
+  line per row, and the byte offsets where the lines start and end;
+- `ids.json`: the chunk IDs in row order;
+- `meta.json`: row count, dimension, dtype and the manifest generation.
+
+`MmapVectorStore` maps these files instead of loading them, so opening the
+store is nearly free and the OS page cache is shared between processes.
+Search is an exact dot-product top-k; on an int8 index the quantized matrix
+picks `rescore_factor * k` candidates, which are re-scored with their float32
+rows. Only the candidates' float32 rows and documents are read from disk.
+"""
+
+import json
+import mmap
+import os
+import shutil
+from typing import Any, Iterable
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+QUANTIZED_FILE = "vectors.i8"
+SCALES_FILE = "scales.npy"
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.json"
+
+DTYPES = ("float32", "int8")
+# Rows scored at a time: the float32 copy of an int8 block stays in the CPU cache
+SCORE_BLOCK_ROWS = 256
+RESCORE_FACTOR = 4
+
+
+def quantize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    "Symmetric per-row int8 quantization: `vectors ≈ quantized * scales[:, None]`."
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class VectorIndexWriter:
+    """
+    Writes an index directory row batch by row batch, so exports need little memory.
+
+    The files are written to `<path>.tmp` and swapped in by `close`; readers that
+    already mapped the previous index keep reading it until they reopen.
+    """
+
+    def __init__(self, path: str, dtype: str = "int8", generation: int = 0):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector index dtype {dtype!r}, expected one of {DTYPES}")
+        self.path = path
+        self.dtype = dtype
+        self.generation = generation
+        self.count = 0
+        self.dim = None
+        self._tmp = path + ".tmp"
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        os.makedirs(self._tmp)
+        self._vectors = open(os.path.join(self._tmp, VECTORS_FILE), "wb")
+        self._quantized = open(os.path.join(self._tmp, QUANTIZED_FILE), "wb") \
+            if dtype == "int8" else None
+        self._docs = open(os.path.join(self._tmp, DOCS_FILE), "wb")
+        self._scales, self._offsets, self._ids = [], [0], []
+
+    def add(self, ids: list[str], embeddings, texts: list[str], metadatas: list[dict | None]):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        vectors.tofile(self._vectors)
+        if self._quantized is not None:
+            quantized, scales = quantize(vectors)
+            quantized.tofile(self._quantized)
+            self._scales.append(scales)
+        for id_, text, metadata in zip(ids, texts, metadatas):
+            line = json.dumps({"id": id_, "text": text, "metadata": metadata or {}},
+                              ensure_ascii=False)
+            self._docs.write(line.encode("utf-8") + b"\n")
+            self._offsets.append(self._docs.tell())
+        self._ids.extend(ids)
+        self.count += len(ids)
+
+    def close(self):
+        for f in (self._vectors, self._quantized, self._docs):
+            if f is not None:
+                f.close()
+        if self._quantized is not None:
+            np.save(os.path.join(self._tmp, SCALES_FILE),
+                    np.concatenate(self._scales) if self._scales else np.zeros(0, np.float32))
+        np.save(os.path.join(self._tmp, OFFSETS_FILE), np.asarray(self._offsets, dtype=np.int64))
+        with open(os.path.join(self._tmp, IDS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self._ids, f)
+        with open(os.path.join(self._tmp, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": self.count, "dim": self.dim or 0, "dtype": self.dtype,
+                       "generation": self.generation}, f)
+
+        old = self.path + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old)
+        os.replace(self._tmp, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def index_meta(path: str) -> dict | None:
+    "`meta.json` of the index at `path`, or None if there is none."
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def export_vector_index(db, path: str, dtype: str = "int8", generation: int = 0,
+                        page_size: int = 1000) -> int:
+    "Copy every vector, text and metadata of a Chroma store into an index at `path`."
+    writer = VectorIndexWriter(path, dtype, generation)
+    offset = 0
+    while True:
+        page = db.get(limit=page_size, offset=offset,
+                      include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        writer.add(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    writer.close()
+    return writer.count
+
+
+class MappedIndex:
+    "The files of one index directory, mapped read-only."
+
+    def __init__(self, path: str):
+        meta_path = os.path.join(path, META_FILE)
+        self.mtime = os.stat(meta_path).st_mtime_ns
+        with open(meta_path, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        count, dim = self.meta["count"], self.meta["dim"]
+
+        def matrix(name, dtype):
+            if not count:
+                return np.zeros((0, dim), dtype=dtype)
+            return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(count, dim))
+
+        self.vectors = matrix(VECTORS_FILE, np.float32)
+        if self.meta["dtype"] == "int8":
+            self.quantized = matrix(QUANTIZED_FILE, np.int8)
+            self.scales = np.load(os.path.join(path, SCALES_FILE), mmap_mode="r")
+        else:
+            self.quantized = self.scales = None
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE))
+        with open(os.path.join(path, DOCS_FILE), "rb") as f:
+            self.docs = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else b""
+        self._ids_path = os.path.join(path, IDS_FILE)
+        self._row_by_id = None
+
+    def document(self, row: int) -> Document:
+        record = json.loads(self.docs[self.offsets[row]:self.offsets[row + 1]])
+        return Document(page_content=record["text"], metadata=record["metadata"],
+                        id=record["id"])
+
+    @property
+    def row_by_id(self) -> dict[str, int]:
+        if self._row_by_id is None:
+            with open(self._ids_path, encoding="utf-8") as f:
+                self._row_by_id = {id_: row for row, id_ in enumerate(json.load(f))}
+        return self._row_by_id
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Exact-search vector store over an index written by `VectorIndexWriter`.
+
+    The index is reopened when `meta.json` changes, i.e. after `create_db.py`
+    exported a new one; searches already running finish on the old one.
+
+    Parameters
+    ----------
+    path : str
+        Index directory.
+    embedding : Embeddings
+        Embeds queries for `similarity_search`; must be the model the index was built with.
+    rescore_factor : int
+        On int8 indexes, candidates re-scored in float32 per result.
+    """
+
+    def __init__(self, path: str, embedding: Embeddings | None = None,
+                 rescore_factor: int = RESCORE_FACTOR):
+        self.path = path
+        self._embedding = embedding
+        self.rescore_factor = rescore_factor
+        self._index = MappedIndex(path)
+
+    @property
+    def index(self) -> MappedIndex:
+        "The mapped files, reopened first if a newer index was exported."
+        try:
+            mtime = os.stat(os.path.join(self.path, META_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return self._index
+        if mtime != self._index.mtime:
+            self._index = MappedIndex(self.path)
+        return self._index
+
+    def __len__(self) -> int:
+        return self.index.meta["count"]
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self._embedding
+
+    @staticmethod
+    def _scores(queries: np.ndarray, matrix: np.ndarray,
+                scales: np.ndarray | None) -> np.ndarray:
+        "Dot products of each query with every row, block by block."
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            block_scores = queries @ block.T
+            if scales is not None:
+                block_scores *= scales[start:start + SCORE_BLOCK_ROWS]
+            scores[:, start:start + len(block)] = block_scores
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        "Indexes of the `k` highest scores of each row, best first."
+        if k >= scores.shape[1]:
+            return np.argsort(-scores, axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def search(self, queries, k: int = 4,
+               index: MappedIndex | None = None) -> list[list[tuple[int, float]]]:
+        "(row, cosine similarity) of the `k` nearest rows to each query vector."
+        index = index or self.index
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        if not index.meta["count"] or not k:
+            return [[] for _ in queries]
+
+        if index.quantized is None:
+            scores = self._scores(queries, index.vectors, None)
+            return [[(int(row), float(scores[i, row])) for row in rows]
+                    for i, rows in enumerate(self._top(scores, k))]
+
+        candidates = self._top(self._scores(queries, index.quantized, index.scales),
+                               k * self.rescore_factor)
+        results = []
+        for query, rows in zip(queries, candidates):
+            rows = np.sort(rows)  # sequential reads of the float32 rows
+            exact = np.asarray(index.vectors[rows]) @ query
+            best = np.argsort(-exact)[:k]
+            results.append([(int(rows[i]), float(exact[i])) for i in best])
+        return results
+
+    @staticmethod
+    def _check_options(kwargs: dict):
+        "Fail on search options this store cannot apply rather than silently ignoring them."
+        unsupported = sorted(name for name, value in kwargs.items() if value is not None)
+        if unsupported:
+            raise ValueError(f"MmapVectorStore does not support {', '.join(unsupported)}; "
+                             "metadata filters need VECTOR_STORE=chroma")
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4,
+                                               **kwargs: Any) -> list[tuple[Document, float]]:
+        self._check_options(kwargs)
+        index = self.index
+        return [(index.document(row), score)
+                for row, score in self.search([embedding], k, index)[0]]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4,
+                                    **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in
+                self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_by_vectors(self, embeddings: list[list[float]],
+                                     k: int = 4) -> list[list[Document]]:
+        "The `k` nearest documents to each query vector, scoring all queries in one pass."
+        index = self.index
+        return [[index.document(row) for row, _ in hits]
+                for hits in self.search(embeddings, k, index)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     **kwargs: Any) -> list[tuple[Document, float]]:
+        self._check_options(kwargs)
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        self._check_options(kwargs)
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already
+        return lambda score: score
+
+    def get_by_ids(self, ids) -> list[Document]:
+        index = self.index
+        return [index.document(index.row_by_id[id_]) for id_ in ids if id_ in index.row_by_id]
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None,
+                  **kwargs: Any) -> list[str]:
+        raise NotImplementedError(
+            "MmapVectorStore is read-only; update Chroma and export again with create_db.py")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("MmapVectorStore is read-only; build it with VectorIndexWriter")
@@ -1,20 +1,27 @@
 # Standard library imports
-from typing import Sequence
+import asyncio
+import time
+from typing import AsyncIterator, Iterator, Sequence
 
 # LangChain core components
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
-from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import (AIMessage, AIMessageChunk, BaseMessage,
+                                     HumanMessage)
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 # LangGraph imports
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, StateGraph
-from langgraph.graph.message import add_messages
 from typing_extensions import Annotated, TypedDict
 
 # Configuration
 import shared.config
-from agent.agent_tools_helper import call_model_with_tools
+from shared.components import registry
+from shared.conversation_memory import bounded_add_messages, create_checkpointer
+from shared.instrumentation import annotate, callbacks, count, span, trace_request
+from shared.metrics import LatencyRecorder
+from shared.query_router import route_query
+from agent.agent_tools_helper import acall_model_with_tools, call_model_with_tools
 # Import helper modules
-from rag.rag_helper import answer_question
+from rag.rag_helper import (astandalone_question, get_answer_cache,
+                            get_rag_chain, speculate, standalone_question)
 
 
 class State(TypedDict):
@@ -25,15 +32,16 @@ class State(TypedDict):
     ----------
     input : str
         The latest user query or input.
-    chat_history : Annotated[Sequence[BaseMessage], add_messages]
+    chat_history : Annotated[Sequence[BaseMessage], bounded_add_messages]
         A sequence of messages representing the chat history, including user and AI messages.
+        Only the most recent turns are kept (HISTORY_MAX_MESSAGES / HISTORY_MAX_TOKENS).
     context : str
         The retrieved context relevant to the current query.
     answer : str
         The generated response to the user's query.
     """
     input: str
-    chat_history: Annotated[Sequence[BaseMessage], add_messages]
+    chat_history: Annotated[Sequence[BaseMessage], bounded_add_messages]
     context: str
     answer: str
 
@@ -42,85 +50,291 @@ def determine_query_type(query_text: str) -> str:
     """
     Determine if query should use RAG (knowledge base) or tools (external service).
 
+    Decided by `shared.query_router.route_query`: a known user name routes to the tools,
+    otherwise the nearest intent centroid of the query embedding, or the keyword rules when
+    that is a close call.
+
     Returns: "rag" or "tools"
     """
-    tool_keywords = ["profile", "stats", "activity",
-                     "followers", "posts", "engagement", "recent activity"]
-    
-    # User names that have external service data
-    user_names = ["ana", "sarah", "james", "priya", "marco"]
-    
-    query_lower = query_text.lower()
-
-    # Check for tool-specific keywords
-    if any(keyword in query_lower for keyword in tool_keywords):
-        return "tools"
-    
-    # Check for user names (indicates interest in user data from tools)
-    if any(name in query_lower for name in user_names):
-        return "tools"
-    
-    return "rag"
+    return route_query(query_text).route
+
+
+def rag_update(state: State, response: dict) -> dict:
+    "State update for an answer produced by the RAG chain or the answer cache."
+    return {
+        "chat_history": [
+            HumanMessage(state["input"]),
+            AIMessage(response["answer"]),
+        ],
+        "context": response["context"],
+        "answer": response["answer"],
+    }
+
+
+def cache_answer(answer_cache, question: str, response: dict, start: float):
+    "Store a freshly generated answer and record the miss latency."
+    answer_cache.store(question, {
+        "answer": response["answer"],
+        "context": response["context"],
+    })
+    answer_cache.miss_latency.record(time.perf_counter() - start)
+
+
+def route(state: State) -> str:
+    "Query type of the latest input, recorded on the request trace."
+    with span("routing"):
+        decision = route_query(state["input"])
+    annotate(route=decision.route, routed_by=decision.method)
+    return decision.route
+
+
+def lookup_answer(answer_cache, question: str) -> dict | None:
+    "Cached answer to `question`, counting the hit or miss on the request trace."
+    with span("answer_cache"):
+        response = answer_cache.lookup(question)
+    count("answer_cache_hits" if response is not None else "answer_cache_misses")
+    return response
 
 
 def call_model(state: State):
     """Route to appropriate QA method based on query type."""
-    query_type = determine_query_type(state["input"])
+    query_type = route(state)
 
     if query_type == "tools":
         return call_model_with_tools(state)
     else:
-        # Original RAG implementation
-        rag_chain = answer_question()
-        response = rag_chain.invoke(state)
-
-        return {
-            "chat_history": [
-                HumanMessage(state["input"]),
-                AIMessage(response["answer"]),
-            ],
-            "context": response["context"],
-            "answer": response["answer"],
-        }
+        start = time.perf_counter()
+        answer_cache = get_answer_cache()
+        speculation = speculate(state)
+        try:
+            question = standalone_question(state)
+
+            # Cache hits skip retrieval and the answer LLM call entirely
+            response = lookup_answer(answer_cache, question) if answer_cache else None
+            if response is not None:
+                answer_cache.hit_latency.record(time.perf_counter() - start)
+            else:
+                rag_chain = get_rag_chain()
+                response = rag_chain.invoke(
+                    {**state, "standalone_question": question, "speculation": speculation})
+                if answer_cache:
+                    cache_answer(answer_cache, question, response, start)
+        finally:
+            # A no-op once retrieval used it; otherwise (a cache hit or an error) stop it
+            if speculation:
+                speculation.discard()
 
+        return rag_update(state, response)
 
-# Defines and compiles a stateful workflow for managing a conversational application.
+
+async def acall_model(state: State):
+    """Async counterpart of `call_model`, used by `app.ainvoke` and `app.astream`."""
+    query_type = route(state)
+
+    if query_type == "tools":
+        return await acall_model_with_tools(state)
+    else:
+        start = time.perf_counter()
+        answer_cache = get_answer_cache()
+        speculation = speculate(state)
+        try:
+            question = await astandalone_question(state)
+
+            # Cache lookups embed the question, which is CPU-bound
+            response = await asyncio.to_thread(lookup_answer, answer_cache, question) \
+                if answer_cache else None
+            if response is not None:
+                answer_cache.hit_latency.record(time.perf_counter() - start)
+            else:
+                rag_chain = get_rag_chain()
+                response = await rag_chain.ainvoke(
+                    {**state, "standalone_question": question, "speculation": speculation})
+                if answer_cache:
+                    await asyncio.to_thread(
+                        cache_answer, answer_cache, question, response, start)
+        finally:
+            # A no-op once retrieval used it; otherwise (a cache hit or an error) stop it
+            if speculation:
+                speculation.discard()
+
+        return rag_update(state, response)
+
+
+# Defines a stateful workflow for managing a conversational application.
 # Attributes
 # ----------
 # workflow : StateGraph
 #     A directed graph that defines the flow of tasks (nodes) and their connections (edges).
-# memory : MemorySaver
-#     A persistence mechanism that saves and restores the workflow's state in memory.
-# app : CompiledStateGraph
+# checkpointer : BaseCheckpointSaver (registry component)
+#     Saves and restores each session's state, keeping only recent sessions and their latest
+#     checkpoint (see `shared.conversation_memory`).
+# app : CompiledStateGraph (registry component, see `get_app`)
 #     The final compiled workflow, ready to execute with state management.
 workflow = StateGraph(state_schema=State)
 workflow.add_edge(START, "model")
-workflow.add_node("model", call_model)
+workflow.add_node("model", RunnableLambda(call_model, afunc=acall_model))
+
+registry.register("checkpointer", create_checkpointer)
+registry.register("app", lambda: workflow.compile(
+    checkpointer=registry.get("checkpointer")))
+
+
+def get_app():
+    "Return the compiled workflow, compiling it once on first use."
+    return registry.get("app")
+
 
-memory = MemorySaver()
-app = workflow.compile(checkpointer=memory)
+# Components built by `warm_up`, in order. The retriever opens the vector store.
+WARM_UP_COMPONENTS = ("llm", "app", "agent", "router", "question_rewriter", "rag_chain",
+                      "retriever", "router_centroids")
 
 
-def execute_user_query(query_text):
+def warm_up(background: bool = False):
     """
-    - The function uses a precompiled `app` to execute the workflow.
-    - A configuration dictionary is passed, which includes a `thread_id` for tracking.
-    - The `app.invoke` method processes the query, retrieves relevant context, and generates a response.
+    Build the workflow, the shared RAG chain and the ReAct agent ahead of the first request.
+
+    They are otherwise built lazily by the first query that needs them; calling this at
+    startup moves that cost out of the request path. With `background=True` they are built
+    on a daemon thread, so the caller (e.g. the Streamlit UI) can render immediately.
+    """
+    return registry.prewarm(WARM_UP_COMPONENTS, background=background)
+
+
+def session_config(thread_id: str) -> RunnableConfig:
+    """
+    Workflow config for the conversation identified by `thread_id`.
+
+    Inside `trace_request`, it also carries the callback timing the request's LLM, tool and
+    retriever runs (see `shared.instrumentation`).
     """
-    config: RunnableConfig = {
+    config = {
         "configurable": {
-            "thread_id": "thread-123",
+            "thread_id": thread_id,
         }
     }
+    if handlers := callbacks():
+        config["callbacks"] = handlers
+    return config
+
+
+def execute_user_query(query_text, thread_id: str = "thread-123"):
+    """
+    - The function uses the shared compiled `app` (see `get_app`) to execute the workflow.
+    - A configuration dictionary is passed, which includes a `thread_id` for tracking.
+    - The `app.invoke` method processes the query, retrieves relevant context, and generates a response.
+    - With TRACING=1 each stage of the query is timed and exported (see `shared.instrumentation`).
+    """
+    with trace_request(thread_id):
+        result = get_app().invoke(
+            input=query_text,
+            config=session_config(thread_id),
+        )
+
+    return result["answer"]
+
+
+async def aexecute_user_query(query_text, thread_id: str = "thread-123"):
+    """
+    Async counterpart of `execute_user_query`.
 
-    result = app.invoke(
-        input=query_text,
-        config=config,
-    )
+    - Uses `app.ainvoke`, so the RAG chain and the ReAct agent run on their async paths and one
+      event loop can serve many sessions while LLM calls are in flight.
+    - Outbound LLM calls are capped by `shared.llm.llm_limiter` (LLM_MAX_CONCURRENCY).
+    """
+    with trace_request(thread_id):
+        result = await get_app().ainvoke(
+            input=query_text,
+            config=session_config(thread_id),
+        )
 
     return result["answer"]
 
 
+# Time to first token and total time of streamed queries
+time_to_first_token = LatencyRecorder()
+stream_total_latency = LatencyRecorder()
+
+
+class AnswerStream:
+    """
+    Turns the workflow's `messages`/`values` stream into answer text.
+
+    Only answer text is kept: the question-reformulation call is tagged `nostream`, and
+    tool-calling turns of the agent are skipped. If no tokens were generated (e.g. an
+    answer-cache hit), `finish` returns the final answer whole.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.streamed_any = False
+        self.final_answer = ""
+
+    def text(self, namespace, mode, data) -> str:
+        "Answer text carried by one stream item, or an empty string."
+        if mode == "values":
+            if not namespace:
+                self.final_answer = data.get("answer", self.final_answer)
+            return ""
+
+        chunk, _metadata = data
+        if not isinstance(chunk, AIMessageChunk) or chunk.tool_call_chunks:
+            return ""
+        text = chunk.text
+        if text and not self.streamed_any:
+            time_to_first_token.record(time.perf_counter() - self.start)
+            self.streamed_any = True
+        return text
+
+    def finish(self) -> str:
+        "Text still owed to the caller once the stream has ended."
+        remainder = ""
+        if not self.streamed_any and self.final_answer:
+            time_to_first_token.record(time.perf_counter() - self.start)
+            remainder = self.final_answer
+        stream_total_latency.record(time.perf_counter() - self.start)
+        return remainder
+
+
+def stream_user_query(query_text, thread_id: str = "thread-123") -> Iterator[str]:
+    """
+    Stream the answer to a query token by token as the LLM produces it.
+
+    - Runs the same workflow as `execute_user_query`, using LangGraph's `messages` stream mode
+      with subgraphs so tokens from both the RAG answer chain and the ReAct agent come through.
+    - Time to first token and total time are recorded in `time_to_first_token` and
+      `stream_total_latency`.
+    """
+    answer_stream = AnswerStream()
+    with trace_request(thread_id):
+        for namespace, mode, data in get_app().stream(
+            input=query_text,
+            config=session_config(thread_id),
+            stream_mode=["messages", "values"],
+            subgraphs=True,
+        ):
+            if text := answer_stream.text(namespace, mode, data):
+                yield text
+        if remainder := answer_stream.finish():
+            yield remainder
+
+
+async def astream_user_query(query_text,
+                             thread_id: str = "thread-123") -> AsyncIterator[str]:
+    "Async counterpart of `stream_user_query`."
+    answer_stream = AnswerStream()
+    with trace_request(thread_id):
+        async for namespace, mode, data in get_app().astream(
+            input=query_text,
+            config=session_config(thread_id),
+            stream_mode=["messages", "values"],
+            subgraphs=True,
+        ):
+            if text := answer_stream.text(namespace, mode, data):
+                yield text
+        if remainder := answer_stream.finish():
+            yield remainder
+
+
 # Questions to test:
 # What is Ana's profile?
 # What are the names of the Stark children's direwolves?
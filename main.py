@@ -1,6 +1,33 @@
+import uuid
+
 import streamlit as st
 
-from langchain_helper import execute_user_query
+from langchain_helper import stream_user_query, warm_up
+from shared.instrumentation import METRICS_PORT, TRACING_ENABLED, serve_metrics
+
+
+@st.cache_resource
+def warm_up_runtime():
+    """
+    Build the chains once per server process, not once per script rerun.
+
+    They are built in the background so the page renders straight away; a question asked
+    before they are ready waits for them.
+    """
+    warm_up(background=True)
+    return True
+
+
+@st.cache_resource
+def start_metrics_server():
+    "Serve /metrics and /traces once per server process, when TRACING=1 and METRICS_PORT is set."
+    if TRACING_ENABLED and METRICS_PORT:
+        return serve_metrics(METRICS_PORT)
+    return None
+
+
+warm_up_runtime()
+start_metrics_server()
 
 st.title("Multi-Source AI Assistant (RAG + Tools)")
 
@@ -8,6 +35,10 @@ st.title("Multi-Source AI Assistant (RAG + Tools)")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Each browser session gets its own conversation in the workflow checkpointer
+if "thread_id" not in st.session_state:
+    st.session_state.thread_id = f"session-{uuid.uuid4()}"
+
 with st.chat_message("assistant"):
     st.write(
         """
@@ -32,11 +63,10 @@ if query_text := st.chat_input("Ask about Westeros… or real people"):
     st.session_state.messages.append({"role": "user", "content": query_text})
 
 if query_text:
-    response = execute_user_query({"input": query_text})
-
-    # Display assistant response in chat message container
+    # Stream the assistant response into the chat message container as it is generated
     with st.chat_message("assistant"):
-        st.markdown(response)
+        response = st.write_stream(
+            stream_user_query({"input": query_text}, st.session_state.thread_id))
 
     # Add assistant response to chat history
     st.session_state.messages.append(
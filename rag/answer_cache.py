@@ -0,0 +1,158 @@
+# Semantic answer cache for the RAG chain
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from shared.metrics import Counters, LatencyRecorder
+
+
+def normalize_question(question: str) -> str:
+    "Case-, whitespace- and trailing-punctuation-insensitive form used for exact matches."
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+class AnswerCache:
+    """
+    Cache of RAG answers keyed by the standalone question.
+
+    A lookup first tries an exact match on the normalized question, then a
+    nearest-neighbour search over the embeddings of cached questions, accepting
+    the best match if its cosine similarity reaches `threshold`. Entries expire
+    after `ttl_seconds` and the least recently used ones are evicted beyond
+    `max_entries`. The whole cache is dropped when `generation()` changes,
+    i.e. when the vector store has been re-ingested.
+
+    Parameters
+    ----------
+    embeddings : Embeddings
+        Embeds questions for the similarity search.
+    generation : Callable[[], int]
+        Returns the current version of the vector store.
+    threshold : float
+        Minimum cosine similarity for a semantic hit.
+    max_entries : int
+        LRU capacity.
+    ttl_seconds : float
+        Lifetime of an entry.
+    """
+
+    def __init__(self, embeddings: Embeddings, generation: Callable[[], int],
+                 threshold: float = 0.92, max_entries: int = 1024,
+                 ttl_seconds: float = 3600):
+        self.embeddings = embeddings
+        self.generation = generation
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # normalized question -> (unit vector, response, stored at)
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._generation = None
+        self._lock = threading.Lock()
+
+        self.counters = Counters("exact_hits", "semantic_hits", "misses",
+                                 "invalidations")
+        self.hit_latency = LatencyRecorder()
+        self.miss_latency = LatencyRecorder()
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_generation(self):
+        "Drop everything if the vector store changed. Caller holds the lock."
+        generation = self.generation()
+        if generation != self._generation:
+            if self._entries:
+                self.counters.increment("invalidations")
+            self._entries.clear()
+            self._matrix = None
+            self._generation = generation
+
+    def _expire(self, now: float):
+        "Remove entries past their TTL. Caller holds the lock."
+        expired = [key for key, (_, _, stored_at) in self._entries.items()
+                   if now - stored_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, question: str) -> dict | None:
+        """
+        Return the cached response for `question`, or None on a miss.
+
+        The response is the dict stored with `store`, typically holding
+        `answer` and `context`.
+        """
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._check_generation()
+            self._expire(now)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters.increment("exact_hits")
+                return self._entries[key][1]
+            if not self._entries:
+                self.counters.increment("misses")
+                return None
+
+        vector = self._embed(question)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack(
+                    [self._entries[k][0] for k in self._matrix_keys]) \
+                    if self._matrix_keys else None
+            if self._matrix is not None:
+                scores = self._matrix @ vector
+                best = int(np.argmax(scores))
+                best_key = self._matrix_keys[best]
+                if scores[best] >= self.threshold and best_key in self._entries:
+                    self._entries.move_to_end(best_key)
+                    self.counters.increment("semantic_hits")
+                    return self._entries[best_key][1]
+            self.counters.increment("misses")
+            return None
+
+    def store(self, question: str, response: dict):
+        "Cache `response` for `question`."
+        key = normalize_question(question)
+        vector = self._embed(question)
+        with self._lock:
+            self._check_generation()
+            self._entries[key] = (vector, response, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        "Hit rate and the latency saved by hits, estimated from the mean miss latency."
+        counters = self.counters.as_dict()
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        lookups = hits + counters["misses"]
+        saved = hits * max(0.0, self.miss_latency.mean - self.hit_latency.mean)
+        return {
+            **counters,
+            "entries": len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "hit_latency": self.hit_latency.summary(),
+            "miss_latency": self.miss_latency.summary(),
+            "latency_saved_s": saved,
+        }
@@ -0,0 +1,165 @@
+"""
+Context assembly between retrieval and generation.
+
+Chunks overlap their neighbours (by half with the recursive chunker), so
+neighbouring chunks retrieved for the same question often repeat each
+other's text. `assemble_context`
+merges overlapping or touching chunks of the same source (using their
+`start_index`), drops near-duplicate passages and keeps the best-ranked text
+that fits a token budget, so the prompt carries each passage once.
+"""
+
+import os
+import re
+
+from langchain_core.documents import Document
+
+from shared.instrumentation import span
+from shared.metrics import Counters
+from shared.tokens import CHARS_PER_TOKEN, approximate_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# A partial passage shorter than this is dropped rather than cut to fit the budget
+MIN_TRUNCATED_TOKENS = 50
+SHINGLE_WORDS = 5
+
+_WORD = re.compile(r"\w+")
+
+
+def _span_key(document: Document):
+    # Offsets are only comparable within one source document (and page, for PDFs)
+    return document.metadata.get("source"), document.metadata.get("page")
+
+
+def merge_adjacent(documents: list[Document]) -> list[tuple[int, Document]]:
+    """
+    Merge chunks of the same source whose character ranges overlap or touch.
+
+    Returns `(rank, document)` pairs, where rank is the best (lowest) retrieval
+    rank among the merged chunks, ordered by rank.
+    """
+    spans = {}
+    unplaced = []
+    for rank, document in enumerate(documents):
+        start = document.metadata.get("start_index")
+        if start is None:
+            unplaced.append((rank, document))
+        else:
+            spans.setdefault(_span_key(document), []).append((start, rank, document))
+
+    merged = list(unplaced)
+    for chunks in spans.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        start, rank, document = chunks[0]
+        text, count = document.page_content, 1
+        for next_start, next_rank, next_document in chunks[1:]:
+            offset = next_start - start
+            next_text = next_document.page_content
+            shared = text[offset:offset + len(next_text)]
+            # Merge only when the ranges touch and the shared characters agree
+            if offset <= len(text) and next_text.startswith(shared):
+                text += next_text[len(shared):]
+                rank, count = min(rank, next_rank), count + 1
+                continue
+            merged.append((rank, _merged_document(document, start, text, count)))
+            start, rank, document = next_start, next_rank, next_document
+            text, count = next_text, 1
+        merged.append((rank, _merged_document(document, start, text, count)))
+    return sorted(merged, key=lambda item: item[0])
+
+
+def _merged_document(first: Document, start: int, text: str, count: int) -> Document:
+    if count == 1 and text == first.page_content:
+        return first
+    metadata = {**first.metadata, "start_index": start, "merged_chunks": count}
+    return Document(page_content=text, metadata=metadata, id=first.id)
+
+
+def _shingles(text: str) -> set[tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def is_near_duplicate(shingles: set, kept: list[set], threshold: float) -> bool:
+    "True when most of a passage's shingles already appear in one kept passage."
+    return any(len(shingles & other) >= threshold * len(shingles) for other in kept if shingles)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    "Cut text to about `tokens` tokens, at a word boundary."
+    cut = text[:tokens * CHARS_PER_TOKEN]
+    if len(cut) < len(text) and " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + " …"
+
+
+class ContextAssembler:
+    """
+    Merges, deduplicates and budgets retrieved chunks.
+
+    Counters record the approximate prompt tokens before and after assembly
+    and how many chunks were merged, dropped as duplicates or cut to fit.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.counters = Counters("calls", "tokens_in", "tokens_out", "chunks_in",
+                                 "chunks_out", "merged", "duplicates", "truncated",
+                                 "over_budget")
+
+    def __call__(self, documents: list[Document]) -> list[Document]:
+        return self.assemble(documents)
+
+    def assemble(self, documents: list[Document]) -> list[Document]:
+        "Return the context to stuff into the prompt, best-ranked passage first."
+        with span("assemble_context", chunks=len(documents)):
+            return self._assemble(documents)
+
+    def _assemble(self, documents: list[Document]) -> list[Document]:
+        self.counters.increment("calls")
+        self.counters.increment("chunks_in", len(documents))
+        self.counters.increment(
+            "tokens_in", sum(approximate_tokens(d.page_content) for d in documents))
+
+        merged = merge_adjacent(documents)
+        self.counters.increment("merged", len(documents) - len(merged))
+
+        kept, kept_shingles, used = [], [], 0
+        for _, document in merged:
+            shingles = _shingles(document.page_content)
+            if is_near_duplicate(shingles, kept_shingles, self.duplicate_threshold):
+                self.counters.increment("duplicates")
+                continue
+
+            tokens = approximate_tokens(document.page_content)
+            remaining = self.token_budget - used
+            if self.token_budget and tokens > remaining:
+                if remaining < MIN_TRUNCATED_TOKENS:
+                    self.counters.increment("over_budget")
+                    continue
+                document = Document(
+                    page_content=truncate_to_tokens(document.page_content, remaining),
+                    metadata={**document.metadata, "truncated": True}, id=document.id)
+                tokens = approximate_tokens(document.page_content)
+                self.counters.increment("truncated")
+
+            kept.append(document)
+            kept_shingles.append(shingles)
+            used += tokens
+
+        self.counters.increment("chunks_out", len(kept))
+        self.counters.increment("tokens_out", used)
+        return kept
+
+    def stats(self) -> dict:
+        counters = self.counters.as_dict()
+        return {
+            **counters,
+            "token_reduction": 1 - counters["tokens_out"] / counters["tokens_in"]
+            if counters["tokens_in"] else 0.0,
+        }
@@ -0,0 +1,141 @@
+# Hybrid retrieval: vector similarity and BM25 keyword search fused by rank
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any
+
+from langchain_core.callbacks import (AsyncCallbackManagerForRetrieverRun,
+                                      CallbackManagerForRetrieverRun)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import ConfigDict
+
+from ingest.bm25_index import BM25Index
+from ingest.shards import ShardedLexicalIndex, ShardedVectorStore
+from shared.instrumentation import span
+
+# Constant from the original RRF paper (Cormack et al., 2009); damps the head of each list
+RRF_K = 60
+
+# Both searches of a query run side by side on this pool
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-search")
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], rrf_k: int = RRF_K) -> list[str]:
+    "Merge ranked ID lists, scoring each ID by the sum of 1 / (rrf_k + rank)."
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def similarity_search_many(vector_store: VectorStore, embeddings: list[list[float]],
+                           k: int, **kwargs: Any) -> list[list[Document]]:
+    "The `k` nearest documents to each query vector, in one query for the batch where supported."
+    if hasattr(vector_store, "similarity_search_by_vectors"):
+        return vector_store.similarity_search_by_vectors(embeddings, k=k, **kwargs)
+    collection = getattr(vector_store, "_collection", None)
+    if collection is None or not embeddings or kwargs:
+        return [vector_store.similarity_search_by_vector(embedding, k=k, **kwargs)
+                for embedding in embeddings]
+    results = collection.query(query_embeddings=embeddings, n_results=k,
+                               include=["documents", "metadatas"])
+    return [
+        [Document(page_content=text, metadata=metadata or {}, id=id_)
+         for text, metadata, id_ in zip(texts, metadatas, ids)]
+        for texts, metadatas, ids in zip(results["documents"], results["metadatas"],
+                                         results["ids"])
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever fusing vector search and BM25 search with reciprocal rank fusion.
+
+    Attributes
+    ----------
+    vector_store : VectorStore
+        The Chroma store; its document IDs are the chunk IDs in `lexical_index`.
+    lexical_index : BM25Index or ShardedLexicalIndex
+        Keyword index kept in sync with the store by `create_db.py`.
+    k : int
+        Number of documents returned.
+    fetch_k : int
+        Number of candidates taken from each search before fusion.
+    shard_filter : dict, optional
+        Searches only the shards of a sharded DB whose catalog metadata matches,
+        e.g. `{"corpus": "books"}`; `invoke(query, shard_filter=...)` overrides it.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_store: VectorStore
+    lexical_index: BM25Index | ShardedLexicalIndex
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = RRF_K
+    shard_filter: dict | None = None
+
+    def _shard_kwargs(self, shard_filter: dict | None) -> dict:
+        "Search arguments selecting shards; none at all without a filter, as unsharded stores take none."
+        shard_filter = shard_filter if shard_filter is not None else self.shard_filter
+        if not shard_filter:
+            return {}
+        if not isinstance(self.vector_store, ShardedVectorStore):
+            raise ValueError("shard_filter needs a sharded DB; this vector store is not sharded")
+        return {"shard_filter": shard_filter}
+
+    def _vector_search(self, query: str, shard_filter: dict | None = None) -> list[Document]:
+        # Embedded here rather than by the store, so the two stages are timed apart
+        with span("embed_query"):
+            embedding = self.vector_store.embeddings.embed_query(query)
+        with span("vector_search"):
+            return self.vector_store.similarity_search_by_vector(
+                embedding, k=self.fetch_k, **self._shard_kwargs(shard_filter))
+
+    def _lexical_search(self, query: str, shard_filter: dict | None = None) -> list[str]:
+        with span("keyword_search"):
+            return [id_ for id_, _ in self.lexical_index.search(
+                query, k=self.fetch_k, **self._shard_kwargs(shard_filter))]
+
+    def _fuse(self, vector_docs: list[Document], lexical_ids: list[str]) -> list[Document]:
+        with span("fuse"):
+            by_id = {doc.id: doc for doc in vector_docs}
+            fused = reciprocal_rank_fusion([list(by_id), lexical_ids], self.rrf_k)[:self.k]
+            # Keyword-only hits are fetched from the store by ID
+            missing = [id_ for id_ in fused if id_ not in by_id]
+            if missing:
+                by_id.update({doc.id: doc for doc in self.vector_store.get_by_ids(missing)})
+            return [by_id[id_] for id_ in fused if id_ in by_id]
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun,
+                                shard_filter: dict | None = None,
+                                **kwargs: Any) -> list[Document]:
+        # Run in a copy of this context so the keyword search joins the request's trace
+        lexical = _search_pool.submit(copy_context().run, self._lexical_search, query,
+                                      shard_filter)
+        vector_docs = self._vector_search(query, shard_filter)
+        return self._fuse(vector_docs, lexical.result())
+
+    def retrieve_many(self, queries: list[str], embeddings: list[list[float]],
+                      shard_filter: dict | None = None) -> list[list[Document]]:
+        "Documents for many queries at once, given their query vectors (see `batch_query`)."
+        with span("vector_search", queries=len(queries)):
+            vector_results = similarity_search_many(self.vector_store, embeddings, self.fetch_k,
+                                                    **self._shard_kwargs(shard_filter))
+        lexical = [_search_pool.submit(copy_context().run, self._lexical_search, query,
+                                       shard_filter)
+                   for query in queries]
+        return [self._fuse(vector_docs, future.result())
+                for vector_docs, future in zip(vector_results, lexical)]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       shard_filter: dict | None = None,
+                                       **kwargs: Any) -> list[Document]:
+        vector_docs, lexical_ids = await asyncio.gather(
+            asyncio.to_thread(self._vector_search, query, shard_filter),
+            asyncio.to_thread(self._lexical_search, query, shard_filter))
+        return await asyncio.to_thread(self._fuse, vector_docs, lexical_ids)
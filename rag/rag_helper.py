@@ -1,44 +1,65 @@
 # RAG (Retrieval-Augmented Generation) related logic
+import json
 import os
+import time
 
-from langchain_chroma import Chroma
-from langchain_classic.chains.combine_documents import \
-    create_stuff_documents_chain
-from langchain_classic.chains.history_aware_retriever import \
-    create_history_aware_retriever
-from langchain_classic.chains.retrieval import create_retrieval_chain
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langgraph.constants import TAG_NOSTREAM
 
 # Configuration
 import shared.config
-from shared.get_embedding_function import get_embedding_function
+from ingest.manifest import GenerationWatcher
+from ingest.shards import ShardedVectorStore
+from rag.answer_cache import AnswerCache
+from rag.context_assembly import ContextAssembler
+from rag.hybrid_retriever import HybridRetriever
+from rag.reformulation import ReformulationPolicy
+from rag.speculative_retrieval import Speculation, SpeculativeRetrieval
+from shared.components import (CHROMA_PATH, get_embeddings, get_lexical_index,
+                               get_llm, get_vector_store, registry)
+from shared.instrumentation import STAGE_TAG_PREFIX, count
 
-# Initialize ChromaDB and retriever
-CHROMA_PATH = "chroma"
-db = Chroma(persist_directory=CHROMA_PATH,
-            embedding_function=get_embedding_function())
-retriever = db.as_retriever(search_type="similarity")
+# Retrieval: "hybrid" fuses vector and BM25 keyword search, "vector" is similarity only
+RETRIEVER = os.environ.get("RETRIEVER", "hybrid")
+RETRIEVAL_K = int(os.environ.get("RETRIEVAL_K", "4"))
+HYBRID_FETCH_K = int(os.environ.get("HYBRID_FETCH_K", "20"))
+# JSON, e.g. {"corpus": "books"}: search only the matching shards of a sharded DB
+RETRIEVAL_SHARD_FILTER = json.loads(os.environ.get("RETRIEVAL_SHARD_FILTER") or "null")
 
-# Initialize LLM
-llm = ChatGoogleGenerativeAI(model="gemini-flash-latest",
-                             google_api_key=os.environ['GEMINI_API_KEY'])
+# Optional semantic answer cache, see `get_answer_cache`
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE", "0") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Merge overlapping chunks, drop duplicates and fit CONTEXT_TOKEN_BUDGET, see `ContextAssembler`
+CONTEXT_ASSEMBLY_ENABLED = os.environ.get("CONTEXT_ASSEMBLY", "1") != "0"
+context_assembler = ContextAssembler()
+
+# When to pay for the question-reformulation LLM call, see `ReformulationPolicy`
+reformulation_policy = ReformulationPolicy(
+    os.environ.get("RAG_REFORMULATION_POLICY", "heuristic"))
+
+# Retrieve for the raw input while the question is reformulated, see `SpeculativeRetrieval`
+SPECULATIVE_RETRIEVAL_ENABLED = os.environ.get("SPECULATIVE_RETRIEVAL", "0") == "1"
+SPECULATIVE_REUSE_THRESHOLD = float(os.environ.get("SPECULATIVE_REUSE_THRESHOLD", "0.95"))
 
 
 def contextualize_question():
     """
-    Create a history-aware retriever to reformulate user queries into standalone questions.
+    Create a chain that reformulates user queries into standalone questions.
 
-    This function generates a retriever that uses a language model (LLM) to reformulate a user's
+    This function builds a chain that uses a language model (LLM) to reformulate a user's
     latest question into a standalone question, ensuring it is understandable without requiring
-    the context of prior chat history. The retriever is configured using a specified prompt
-    template and associated components.
+    the context of prior chat history. Retrieval, caching and answering then all work on that
+    standalone question.
 
     Returns
     -------
-    history_aware_retriever : object
-        A retriever object capable of reformulating user queries into standalone questions
-        by leveraging the provided language model, retriever, and prompt.
+    question_rewriter : Runnable
+        A chain mapping `input` and `chat_history` to the standalone question as a string.
     """
     question_reformulation_prompt = """
     Given a chat history and the latest user question \
@@ -54,27 +75,109 @@ def contextualize_question():
         ]
     )
 
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, question_reformulation_template
-    )
+    # Tagged so its tokens never reach the user when the graph is streamed
+    question_rewriter = (
+        question_reformulation_template | get_llm() | StrOutputParser()
+    ).with_config(run_name="contextualize_question",
+                  tags=[TAG_NOSTREAM, STAGE_TAG_PREFIX + "reformulate"])
 
-    return history_aware_retriever
+    return question_rewriter
 
 
-def answer_question():
+def standalone_question(state) -> str:
     """
-    Creates a Retrieval-Augmented Generation (RAG) chain to answer user questions
-    by leveraging a history-aware retriever and a question-answering chain.
+    Return the standalone form of the user's latest question.
 
-    This function combines context retrieval and answer generation:
-    - Reformulates user queries into standalone questions if necessary.
-    - Retrieves relevant context from a knowledge base or vector database.
-    - Generates concise, depthful answers based on the retrieved context.
+    A `standalone_question` already present in `state` is reused. Otherwise
+    `reformulation_policy` decides whether the input can be used as is (no chat history, or
+    a question that is already self-contained) or needs an LLM reformulation.
+    """
+    if state.get("standalone_question"):
+        return state["standalone_question"]
+    start = time.perf_counter()
+    skip_reason = reformulation_policy.skip_reason(state)
+    if skip_reason:
+        question = state["input"]
+        count("reformulation_skipped")
+    else:
+        question = get_question_rewriter().invoke(state)
+    reformulation_policy.record(skip_reason, time.perf_counter() - start)
+    return question
+
+
+async def astandalone_question(state) -> str:
+    "Async counterpart of `standalone_question`."
+    if state.get("standalone_question"):
+        return state["standalone_question"]
+    start = time.perf_counter()
+    skip_reason = reformulation_policy.skip_reason(state)
+    if skip_reason:
+        question = state["input"]
+        count("reformulation_skipped")
+    else:
+        question = await get_question_rewriter().ainvoke(state)
+    reformulation_policy.record(skip_reason, time.perf_counter() - start)
+    return question
+
+
+def speculate(state) -> Speculation | None:
+    """
+    Start retrieving for the raw input when SPECULATIVE_RETRIEVAL=1 and the question
+    is about to be reformulated; pass the result to the RAG chain as `speculation`.
+    """
+    if not SPECULATIVE_RETRIEVAL_ENABLED or state.get("standalone_question") \
+            or reformulation_policy.skip_reason(state):
+        return None
+    return get_speculative_retrieval().start(state["input"])
+
+
+def retrieve_context(state, config):
+    "Chunks for the standalone question, from the request's `speculation` if it has one."
+    speculation = state.get("speculation")
+    if speculation is not None:
+        return speculation.result(state["standalone_question"], config)
+    return get_retriever().invoke(state["standalone_question"], config)
+
+
+async def aretrieve_context(state, config):
+    "Async counterpart of `retrieve_context`."
+    speculation = state.get("speculation")
+    if speculation is not None:
+        return await speculation.aresult(state["standalone_question"], config)
+    return await get_retriever().ainvoke(state["standalone_question"], config)
+
+
+def build_retriever():
+    "Build the retriever selected by RETRIEVER, returning RETRIEVAL_K chunks."
+    vector_store = get_vector_store()
+    if RETRIEVAL_SHARD_FILTER and not isinstance(vector_store, ShardedVectorStore):
+        # Both stores would only fail at query time: Chroma passes the filter on to its
+        # query, and the mmap index rejects it
+        raise ValueError(f"RETRIEVAL_SHARD_FILTER is set but the DB in {CHROMA_PATH} is not "
+                         "sharded; unset it or rebuild the DB with SHARD_BY=corpus or source")
+    if RETRIEVER == "vector":
+        search_kwargs = {"k": RETRIEVAL_K}
+        if RETRIEVAL_SHARD_FILTER:
+            search_kwargs["shard_filter"] = RETRIEVAL_SHARD_FILTER
+        return vector_store.as_retriever(
+            search_type="similarity", search_kwargs=search_kwargs)
+    if RETRIEVER != "hybrid":
+        raise ValueError(f"Unknown RETRIEVER {RETRIEVER!r}, expected 'hybrid' or 'vector'")
+    return HybridRetriever(vector_store=vector_store,
+                           lexical_index=get_lexical_index(),
+                           k=RETRIEVAL_K, fetch_k=HYBRID_FETCH_K,
+                           shard_filter=RETRIEVAL_SHARD_FILTER)
+
+
+def build_answer_chain():
+    """
+    Create the chain that answers a question from retrieved context.
 
     Returns
     -------
-    rag_chain : RetrievalAugmentedGenerationChain
-        A chain that reformulates questions, retrieves relevant context, and generates answers.
+    answer_chain : Runnable
+        A chain mapping `input`, `chat_history` and `context` (a list of Documents) to the
+        answer as a string.
     """
     answer_question_prompt = """
     Use the following pieces of retrieved context to answer the question. \
@@ -90,12 +193,113 @@ def answer_question():
         ]
     )
 
-    answer_question_chain = create_stuff_documents_chain(
-        llm, answer_question_template)
+    # Imported here: langchain_classic is slow to import and only this chain needs it
+    from langchain_classic.chains.combine_documents import \
+        create_stuff_documents_chain
+
+    return create_stuff_documents_chain(
+        get_llm(), answer_question_template).with_config(tags=[STAGE_TAG_PREFIX + "answer"])
+
+
+def answer_question():
+    """
+    Creates a Retrieval-Augmented Generation (RAG) chain to answer user questions
+    by leveraging question reformulation, a retriever and a question-answering chain.
+
+    This function combines context retrieval and answer generation:
+    - Reformulates user queries into standalone questions if necessary.
+    - Retrieves relevant context from a knowledge base or vector database.
+    - Merges overlapping chunks and fits the context to a token budget (`context_assembler`).
+    - Generates concise, depthful answers based on the retrieved context (`get_answer_chain`).
 
-    history_aware_retriever = contextualize_question()
+    Returns
+    -------
+    rag_chain : RetrievalAugmentedGenerationChain
+        A chain that reformulates questions, retrieves relevant context, and generates answers.
+        Its output holds `standalone_question`, `context` and `answer` next to the input keys.
+        A `speculation` in the input (see `speculate`) supplies the retrieval.
+    """
+    retriever = RunnableLambda(retrieve_context, afunc=aretrieve_context, name="retrieve")
+    if CONTEXT_ASSEMBLY_ENABLED:
+        retriever = retriever | RunnableLambda(context_assembler.assemble,
+                                               name="assemble_context")
 
-    rag_chain = create_retrieval_chain(
-        history_aware_retriever, answer_question_chain)
+    rag_chain = (
+        RunnablePassthrough.assign(
+            standalone_question=RunnableLambda(standalone_question,
+                                               afunc=astandalone_question))
+        .assign(context=retriever)
+        .assign(answer=get_answer_chain())
+    ).with_config(run_name="retrieval_chain")
 
     return rag_chain
+
+
+def build_speculative_retrieval():
+    "Build the speculative retrieval over the shared retriever and query embedder."
+    return SpeculativeRetrieval(get_retriever(), get_embeddings(), SPECULATIVE_REUSE_THRESHOLD)
+
+
+def build_answer_cache():
+    """
+    Build the semantic answer cache.
+
+    The cache embeds questions with the vector store's embedder and is invalidated whenever
+    `create_db.py` changes the store.
+    """
+    return AnswerCache(
+        get_embeddings(),
+        GenerationWatcher(CHROMA_PATH).current,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    )
+
+
+# The chains hold no per-request state, so a single instance of each is built
+# on first use and shared by every session and thread.
+registry.register("retriever", build_retriever)
+registry.register("answer_chain", build_answer_chain)
+registry.register("rag_chain", answer_question)
+registry.register("question_rewriter", contextualize_question)
+registry.register("answer_cache", build_answer_cache)
+registry.register("speculative_retrieval", build_speculative_retrieval)
+
+
+def get_rag_chain():
+    """
+    Return the shared RAG chain, building it once on first use.
+
+    Returns
+    -------
+    rag_chain : RetrievalAugmentedGenerationChain
+        The chain produced by `answer_question`, reused across requests.
+    """
+    return registry.get("rag_chain")
+
+
+def get_answer_chain():
+    "Return the shared answer-generation chain, building it once on first use."
+    return registry.get("answer_chain")
+
+
+def get_retriever():
+    "Return the shared retriever, building it once on first use."
+    return registry.get("retriever")
+
+
+def get_question_rewriter():
+    "Return the shared question-reformulation chain, building it once on first use."
+    return registry.get("question_rewriter")
+
+
+def get_answer_cache():
+    "Return the shared answer cache, or None unless ANSWER_CACHE=1."
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    return registry.get("answer_cache")
+
+
+def get_speculative_retrieval():
+    "Return the shared speculative retrieval, building it once on first use."
+    return registry.get("speculative_retrieval")
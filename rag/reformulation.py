@@ -0,0 +1,102 @@
+# Policy for when the question-reformulation LLM call can be skipped
+import re
+
+from shared.metrics import Counters, LatencyRecorder
+
+POLICIES = ("always", "history", "heuristic")
+
+# Words that usually point back at something said in an earlier turn.
+ANAPHORIC_WORDS = {
+    "he", "she", "it", "they", "him", "her", "them", "his", "hers", "its",
+    "their", "theirs", "himself", "herself", "itself", "themselves",
+    "this", "that", "these", "those", "there", "then", "former", "latter",
+    "same", "else", "also", "too", "another", "other", "others", "one", "ones",
+    "above", "previous", "earlier", "aforementioned",
+}
+FOLLOW_UP_PREFIXES = ("and ", "but ", "so ", "what about", "how about", "what else",
+                      "why", "how come", "and?", "more")
+MIN_SELF_CONTAINED_WORDS = 4
+
+_WORD = re.compile(r"[a-z']+")
+
+
+def is_self_contained(question: str) -> bool:
+    """
+    Cheap check for questions that can be answered without the chat history.
+
+    A question counts as self-contained when it is not a short fragment, does
+    not open like a follow-up ("and ...", "what about ...") and contains no
+    pronoun or other word that typically refers back to an earlier turn. The
+    check errs on the side of reformulating.
+    """
+    text = question.strip().lower()
+    words = _WORD.findall(text)
+    if len(words) < MIN_SELF_CONTAINED_WORDS:
+        return False
+    if text.startswith(FOLLOW_UP_PREFIXES):
+        return False
+    return not any(word.removesuffix("'s") in ANAPHORIC_WORDS for word in words)
+
+
+class ReformulationPolicy:
+    """
+    Decides whether the latest question needs an LLM reformulation.
+
+    Policies
+    --------
+    always
+        Reformulate on every turn, even without chat history.
+    history
+        Reformulate whenever there is chat history.
+    heuristic
+        Reformulate only when there is chat history and the question is not
+        `is_self_contained`.
+
+    Counters record how many reformulation calls were made and why others
+    were skipped; latencies of the standalone-question step are kept overall
+    and per outcome, so comparing policies shows the p50/p95 change.
+    """
+
+    def __init__(self, policy: str = "heuristic"):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown reformulation policy {policy!r}, expected one of {POLICIES}")
+        self.policy = policy
+        self.counters = Counters("llm_calls", "skipped_no_history",
+                                 "skipped_self_contained")
+        self.latency = LatencyRecorder()
+        self.rewrite_latency = LatencyRecorder()
+        self.skip_latency = LatencyRecorder()
+
+    def skip_reason(self, state) -> str | None:
+        "Return why the LLM call can be skipped, or None if it is needed."
+        if self.policy == "always":
+            return None
+        if not state.get("chat_history"):
+            return "skipped_no_history"
+        if self.policy == "heuristic" and is_self_contained(state["input"]):
+            return "skipped_self_contained"
+        return None
+
+    def record(self, reason: str | None, seconds: float):
+        "Count one standalone-question step and its latency."
+        self.latency.record(seconds)
+        if reason is None:
+            self.counters.increment("llm_calls")
+            self.rewrite_latency.record(seconds)
+        else:
+            self.counters.increment(reason)
+            self.skip_latency.record(seconds)
+
+    def stats(self) -> dict:
+        counters = self.counters.as_dict()
+        total = sum(counters.values())
+        avoided = total - counters["llm_calls"]
+        return {
+            "policy": self.policy,
+            **counters,
+            "avoided_rate": avoided / total if total else 0.0,
+            "latency": self.latency.summary(),
+            "rewrite_latency": self.rewrite_latency.summary(),
+            "skip_latency": self.skip_latency.summary(),
+        }
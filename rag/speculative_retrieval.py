@@ -0,0 +1,199 @@
+"""
+Speculative retrieval: search for the raw user input while the question is reformulated.
+
+When a follow-up question needs the reformulation LLM call,
+`SpeculativeRetrieval.start` begins retrieving for the input as typed on a
+thread pool, so the search overlaps the LLM call instead of waiting for it.
+Once the standalone question is known, `Speculation.result`
+
+- reuses the speculative documents if the standalone question is the input
+  up to case and punctuation, or if their query embeddings have a cosine
+  similarity of at least `threshold`;
+- otherwise searches for the standalone question and returns its documents
+  followed by the speculative ones it did not find. Context assembly then
+  trims the union to the token budget.
+
+The speculation is best effort: if its search fails, the request gets the
+documents of its standalone question alone, as without speculation, and the
+failed search is counted as wasted.
+
+Each request records the outcome, the time saved and the wasted search time
+on the request trace and in `stats()`. Time saved is measured against
+searching after the LLM call, and is negative when waiting for the
+speculative search delayed the answer.
+"""
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableConfig
+
+from rag.answer_cache import normalize_question
+from shared.instrumentation import annotate, callbacks, count, span
+from shared.metrics import Counters, LatencyRecorder
+
+# Speculative searches run here while the request thread waits for the LLM
+_speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative-retrieval")
+
+
+def union(first: list[Document], second: list[Document]) -> list[Document]:
+    "The documents of `first`, then those of `second` not in `first`."
+    seen = {doc.id or doc.page_content for doc in first}
+    return first + [doc for doc in second if (doc.id or doc.page_content) not in seen]
+
+
+class Speculation:
+    "The retrieval for one request's raw input, started before its question is reformulated."
+
+    def __init__(self, owner: "SpeculativeRetrieval", query: str, future: Future):
+        self.owner = owner
+        self.query = query
+        self._future = future
+        self._done = False
+
+    def _finish(self, outcome: str, saved: float, wasted: float):
+        self._done = True
+        self.owner.record(outcome, saved, wasted)
+        count(f"speculation_{outcome}")
+        annotate(speculation=outcome, speculation_saved_ms=round(saved * 1e3, 1),
+                 speculation_wasted_ms=round(wasted * 1e3, 1))
+
+    def result(self, question: str, config: RunnableConfig | None = None) -> list[Document]:
+        "Documents for the standalone `question`, reusing the speculative search where possible."
+        resolved = time.perf_counter()
+        if self.owner.is_near(self.query, question):
+            docs, start, end = self._future.result()
+            if docs is not None:
+                self._finish("reused", end - start - (time.perf_counter() - resolved), 0.0)
+                return docs
+            second = time.perf_counter()
+            docs = self.owner.retriever.invoke(question, config)
+            # The time spent waiting for the failed search is lost
+            self._finish("failed", resolved - second, end - start)
+            return docs
+        second = time.perf_counter()
+        docs = self.owner.retriever.invoke(question, config)
+        search = time.perf_counter() - second
+        speculative, start, end = self._future.result()
+        if speculative is None:
+            self._finish("failed", search - (time.perf_counter() - resolved), end - start)
+            return docs
+        self._finish("second_search", search - (time.perf_counter() - resolved), end - start)
+        return union(docs, speculative)
+
+    async def aresult(self, question: str,
+                      config: RunnableConfig | None = None) -> list[Document]:
+        "Async counterpart of `result`."
+        resolved = time.perf_counter()
+        # Embedding the two questions is CPU-bound
+        if await asyncio.to_thread(self.owner.is_near, self.query, question):
+            docs, start, end = await asyncio.wrap_future(self._future)
+            if docs is not None:
+                self._finish("reused", end - start - (time.perf_counter() - resolved), 0.0)
+                return docs
+            second = time.perf_counter()
+            docs = await self.owner.retriever.ainvoke(question, config)
+            # The time spent waiting for the failed search is lost
+            self._finish("failed", resolved - second, end - start)
+            return docs
+        second = time.perf_counter()
+        docs = await self.owner.retriever.ainvoke(question, config)
+        search = time.perf_counter() - second
+        speculative, start, end = await asyncio.wrap_future(self._future)
+        if speculative is None:
+            self._finish("failed", search - (time.perf_counter() - resolved), end - start)
+            return docs
+        self._finish("second_search", search - (time.perf_counter() - resolved), end - start)
+        return union(docs, speculative)
+
+    def discard(self):
+        "Give up on the speculative search, e.g. when the answer cache answered the request."
+        if self._done:
+            return
+        if self._future.cancel():
+            self._finish("discarded", 0.0, 0.0)
+            return
+        # Already running: its time is wasted once it finishes
+        self._done = True
+        count("speculation_discarded")
+        annotate(speculation="discarded")
+        self._future.add_done_callback(self._record_discarded)
+
+    def _record_discarded(self, future: Future):
+        _, start, end = future.result()
+        self.owner.record("discarded", 0.0, end - start)
+
+
+class SpeculativeRetrieval:
+    """
+    Starts retrievals for raw user input ahead of reformulation, and keeps their statistics.
+
+    Parameters
+    ----------
+    retriever : BaseRetriever
+        The retriever of the RAG chain.
+    embeddings : Embeddings
+        The query embedder, used to compare the input with the standalone
+        question; a cached embedder makes the comparison nearly free, as both
+        questions are embedded for searching anyway.
+    threshold : float
+        Minimum cosine similarity between the two for the speculative
+        documents to be reused.
+    """
+
+    def __init__(self, retriever: BaseRetriever, embeddings: Embeddings, threshold: float = 0.95):
+        self.retriever = retriever
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.counters = Counters("reused", "second_search", "failed", "discarded")
+        self.saved = LatencyRecorder()
+        self.wasted = LatencyRecorder()
+
+    def _search(self, query: str,
+                config: RunnableConfig) -> tuple[list[Document] | None, float, float]:
+        "The documents for `query`, or None if the search failed, with its start and end."
+        start = time.perf_counter()
+        try:
+            with span("speculative_retrieval"):
+                docs = self.retriever.invoke(query, config)
+        except Exception:
+            # Best effort: the request searches for its standalone question instead
+            docs = None
+        return docs, start, time.perf_counter()
+
+    def start(self, query: str) -> Speculation:
+        "Start retrieving for `query` in the background."
+        config = {"callbacks": callbacks(), "run_name": "speculative_retrieval"}
+        future = _speculation_pool.submit(copy_context().run, self._search, query, config)
+        return Speculation(self, query, future)
+
+    def is_near(self, query: str, question: str) -> bool:
+        "Whether the speculative results for `query` can stand in for those of `question`."
+        if normalize_question(query) == normalize_question(question):
+            return True
+        vectors = np.array([self.embeddings.embed_query(query),
+                            self.embeddings.embed_query(question)])
+        a, b = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return float(a @ b) >= self.threshold
+
+    def record(self, outcome: str, saved: float, wasted: float):
+        "Count one request's outcome, time saved and wasted search time."
+        self.counters.increment(outcome)
+        if outcome != "discarded":
+            self.saved.record(saved)
+        self.wasted.record(wasted)
+
+    def stats(self) -> dict:
+        counters = self.counters.as_dict()
+        total = sum(counters.values())
+        return {
+            **counters,
+            "reuse_rate": counters["reused"] / total if total else 0.0,
+            "saved": self.saved.summary(),
+            "wasted": self.wasted.summary(),
+        }
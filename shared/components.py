@@ -0,0 +1,140 @@
+"""
+Registry of lazily built, process-wide components.
+
+The embedder, the Chroma store, the BM25 index, the chat model, the chains
+and the compiled workflow are expensive to create, so none of them is built at
+import time. Each is registered with a factory and built on first `get`,
+exactly once even when several threads ask for it concurrently. `prewarm` builds components
+ahead of the first request, optionally on a background thread.
+
+Only the shared components are registered here; the RAG chain, the agent and
+the workflow register themselves in the modules that define them.
+"""
+
+import os
+import threading
+import time
+from typing import Callable
+
+CHROMA_PATH = os.environ.get("CHROMA_PATH", "chroma")
+# "chroma", or "mmap" for the memory-mapped export of the Chroma vectors (see ingest/vector_index.py)
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+VECTOR_INDEX_PATH = os.environ.get("VECTOR_INDEX_PATH", os.path.join(CHROMA_PATH, "vectors"))
+
+
+class ComponentRegistry:
+    "Named components built on first use by their registered factory."
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.build_seconds = {}
+
+    def register(self, name: str, factory: Callable[[], object]):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks[name] = threading.RLock()
+
+    def get(self, name: str):
+        "Return the component, building it if this is the first request for it."
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        # One lock per component, so building one never waits on another
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.build_seconds[name] = time.perf_counter() - start
+        return self._instances[name]
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: str):
+        "Drop a built component; the next `get` builds it again."
+        with self._locks[name]:
+            self._instances.pop(name, None)
+            self.build_seconds.pop(name, None)
+
+    def prewarm(self, names, background: bool = False) -> threading.Thread | None:
+        """
+        Build the named components now instead of on first use.
+
+        With `background=True` they are built on a daemon thread, which is returned;
+        requests that need a component still being built wait for it.
+        """
+        def build():
+            for name in names:
+                self.get(name)
+
+        if not background:
+            build()
+            return None
+        thread = threading.Thread(target=build, name="prewarm", daemon=True)
+        thread.start()
+        return thread
+
+
+registry = ComponentRegistry()
+
+
+def _build_embeddings():
+    from shared.get_embedding_function import get_embedding_function
+    return get_embedding_function()
+
+
+def _build_vector_store():
+    if VECTOR_STORE not in ("chroma", "mmap"):
+        raise ValueError(f"Unknown VECTOR_STORE {VECTOR_STORE!r}, expected 'chroma' or 'mmap'")
+    from ingest.shards import ShardedVectorStore, is_sharded
+    if is_sharded(CHROMA_PATH):
+        return ShardedVectorStore(CHROMA_PATH, get_embeddings(), VECTOR_STORE, VECTOR_INDEX_PATH)
+    if VECTOR_STORE == "mmap":
+        from ingest.vector_index import MmapVectorStore
+        return MmapVectorStore(VECTOR_INDEX_PATH, get_embeddings())
+    # Imported on first use: chromadb is slow to import and the tools path never needs it
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=CHROMA_PATH, embedding_function=get_embeddings())
+
+
+def _build_lexical_index():
+    from ingest.bm25_index import BM25Index
+    from ingest.shards import ShardedLexicalIndex, is_sharded
+    if is_sharded(CHROMA_PATH):
+        return ShardedLexicalIndex(CHROMA_PATH)
+    return BM25Index(CHROMA_PATH)
+
+
+def _build_llm():
+    from shared.llm import create_llm
+    return create_llm()
+
+
+registry.register("embeddings", _build_embeddings)
+registry.register("vector_store", _build_vector_store)
+registry.register("lexical_index", _build_lexical_index)
+registry.register("llm", _build_llm)
+
+
+def get_embeddings():
+    "The query embedder (cached GPT4All embeddings)."
+    return registry.get("embeddings")
+
+
+def get_vector_store():
+    "The vector store selected by VECTOR_STORE (over all shards of a sharded DB), queried with `get_embeddings`."
+    return registry.get("vector_store")
+
+
+def get_lexical_index():
+    "The BM25 keyword index over the chunks in the vector store (over all shards of a sharded DB)."
+    return registry.get("lexical_index")
+
+
+def get_llm():
+    "The chat model shared by the RAG chains and the agent."
+    return registry.get("llm")
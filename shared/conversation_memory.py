@@ -0,0 +1,250 @@
+"""
+Bounded conversation memory for the LangGraph workflow.
+
+Two things keep memory and prompt sizes flat as the app serves more sessions:
+
+- `bounded_add_messages`, the reducer for `chat_history`, keeps only the most
+  recent turns of a conversation (HISTORY_MAX_MESSAGES / HISTORY_MAX_TOKENS).
+- The checkpointers built by `create_checkpointer` keep only the latest
+  checkpoint of each thread and, every SESSION_EVICT_EVERY checkpoints, delete
+  threads that have been idle for SESSION_IDLE_SECONDS, or the least recently
+  used ones beyond MAX_SESSIONS.
+
+CHECKPOINTER selects in-process storage ("memory", the default) or a SQLite
+file ("sqlite", at CHECKPOINT_DB_PATH) that survives restarts.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph.message import add_messages
+
+# Configuration
+import shared.config
+
+CHECKPOINTER = os.environ.get("CHECKPOINTER", "memory")
+CHECKPOINT_DB_PATH = os.environ.get("CHECKPOINT_DB_PATH", ".cache/checkpoints.sqlite3")
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "4000"))
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", "3600"))
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "1000"))
+# Checkpoints saved between two eviction passes
+SESSION_EVICT_EVERY = int(os.environ.get("SESSION_EVICT_EVERY", "100"))
+
+
+def trim_history(messages: Sequence[BaseMessage], max_messages: int = HISTORY_MAX_MESSAGES,
+                 max_tokens: int = HISTORY_MAX_TOKENS) -> list[BaseMessage]:
+    """
+    Keep the most recent messages within a message and token budget.
+
+    A limit of 0 disables it. The kept history always starts on a human message, so a
+    question is never separated from its answer.
+    """
+    kept = list(messages[-max_messages:] if max_messages else messages)
+    if max_tokens:
+        tokens = 0
+        for i in range(len(kept) - 1, -1, -1):
+            tokens += count_tokens_approximately([kept[i]])
+            if tokens > max_tokens:
+                kept = kept[i + 1:]
+                break
+    while kept and not isinstance(kept[0], HumanMessage):
+        kept.pop(0)
+    return kept
+
+
+def bounded_add_messages(left, right):
+    "`add_messages` followed by `trim_history`; used as the `chat_history` reducer."
+    return trim_history(add_messages(left, right))
+
+
+class SessionEvictionMixin:
+    """
+    Keeps one checkpoint per thread and evicts idle sessions.
+
+    Subclasses implement `_prune(thread_id, checkpoint_id)`, which deletes every
+    checkpoint and pending write of the thread except those of `checkpoint_id`. Nested
+    namespaces (the ReAct agent running as a subgraph) are only needed while a run is
+    in progress, so they are pruned as well.
+    """
+
+    def _init_sessions(self, idle_seconds: float, max_sessions: int, evict_every: int):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self.evict_every = evict_every
+        self.last_seen = OrderedDict()
+        self.evictions = 0
+        self._puts_since_eviction = 0
+        # Reentrant: evictions delete threads while holding it
+        self._sessions_lock = threading.RLock()
+
+    def _touch(self, thread_id: str):
+        with self._sessions_lock:
+            self.last_seen[thread_id] = time.monotonic()
+            self.last_seen.move_to_end(thread_id)
+
+    def evict_idle(self) -> int:
+        "Delete threads idle for longer than `idle_seconds` or beyond `max_sessions`."
+        evicted = 0
+        deadline = time.monotonic() - self.idle_seconds
+        # Each thread is checked and deleted under the lock, so a request touching it
+        # meanwhile either keeps it alive or waits until it is gone, never losing new history
+        with self._sessions_lock:
+            while self.last_seen:
+                thread_id, seen = next(iter(self.last_seen.items()))
+                if seen > deadline and len(self.last_seen) <= self.max_sessions:
+                    break
+                self.delete_thread(thread_id)
+                evicted += 1
+            self.evictions += evicted
+            self._puts_since_eviction = 0
+        return evicted
+
+    def get_tuple(self, config):
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        if not config["configurable"].get("checkpoint_ns"):
+            self._prune(thread_id, checkpoint["id"], checkpoint["channel_versions"])
+        self._touch(thread_id)
+        with self._sessions_lock:
+            self._puts_since_eviction += 1
+            due = self._puts_since_eviction >= self.evict_every
+        if due:
+            self.evict_idle()
+        return result
+
+    def delete_thread(self, thread_id: str):
+        with self._sessions_lock:
+            self.last_seen.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+
+class BoundedMemorySaver(SessionEvictionMixin, InMemorySaver):
+    "In-process checkpointer holding only the latest checkpoint of recent sessions."
+
+    def __init__(self, idle_seconds: float = SESSION_IDLE_SECONDS,
+                 max_sessions: int = MAX_SESSIONS, evict_every: int = SESSION_EVICT_EVERY,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self._init_sessions(idle_seconds, max_sessions, evict_every)
+        # Per-thread indexes, so pruning does not scan every session's entries
+        self._blob_keys = defaultdict(set)
+        self._write_keys = defaultdict(set)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"]
+        for channel, version in new_versions.items():
+            self._blob_keys[configurable["thread_id"]].add(
+                (configurable["thread_id"], configurable["checkpoint_ns"], channel, version))
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        configurable = config["configurable"]
+        self._write_keys[configurable["thread_id"]].add(
+            (configurable["thread_id"], configurable.get("checkpoint_ns", ""),
+             configurable["checkpoint_id"]))
+        super().put_writes(config, writes, task_id, task_path)
+
+    def _prune(self, thread_id: str, checkpoint_id: str, channel_versions: dict):
+        namespaces = self.storage[thread_id]
+        for checkpoint_ns in list(namespaces):
+            if checkpoint_ns:
+                del namespaces[checkpoint_ns]
+        root = namespaces[""]
+        for old_id in [i for i in root if i != checkpoint_id]:
+            del root[old_id]
+
+        live_blobs = {(thread_id, "", channel, version)
+                      for channel, version in channel_versions.items()}
+        blob_keys = self._blob_keys[thread_id]
+        for key in blob_keys - live_blobs:
+            self.blobs.pop(key, None)
+        blob_keys &= live_blobs
+
+        write_keys = self._write_keys[thread_id]
+        for key in [k for k in write_keys if k != (thread_id, "", checkpoint_id)]:
+            self.writes.pop(key, None)
+            write_keys.discard(key)
+
+    def delete_thread(self, thread_id: str):
+        with self._sessions_lock:
+            self.last_seen.pop(thread_id, None)
+            self.storage.pop(thread_id, None)
+            for key in self._blob_keys.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            for key in self._write_keys.pop(thread_id, ()):
+                self.writes.pop(key, None)
+
+
+def create_sqlite_saver(path: str = CHECKPOINT_DB_PATH, idle_seconds: float = SESSION_IDLE_SECONDS,
+                        max_sessions: int = MAX_SESSIONS, evict_every: int = SESSION_EVICT_EVERY):
+    """
+    SQLite-backed checkpointer with the same pruning and eviction as `BoundedMemorySaver`.
+
+    Needs the `langgraph-checkpoint-sqlite` package. Threads already in the file are
+    treated as seen at startup, so sessions left behind by a previous run are evicted
+    once they have been idle for `idle_seconds`.
+    """
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class BoundedSqliteSaver(SessionEvictionMixin, SqliteSaver):
+        # SqliteSaver only implements the sync interface; the async methods run it in a
+        # worker thread so `app.ainvoke` and `app.astream` work with the same saver.
+
+        def _prune(self, thread_id, checkpoint_id, channel_versions):
+            with self.cursor() as cur:
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? "
+                        "AND NOT (checkpoint_ns = '' AND checkpoint_id = ?)",
+                        (str(thread_id), checkpoint_id))
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            checkpoints = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for checkpoint in checkpoints:
+                yield checkpoint
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            await asyncio.to_thread(self.delete_thread, thread_id)
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    saver = BoundedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    saver._init_sessions(idle_seconds, max_sessions, evict_every)
+    saver.setup()
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT DISTINCT thread_id FROM checkpoints")
+        for (thread_id,) in cur.fetchall():
+            saver._touch(thread_id)
+    return saver
+
+
+def create_checkpointer():
+    "Build the workflow checkpointer selected by CHECKPOINTER."
+    if CHECKPOINTER == "sqlite":
+        return create_sqlite_saver()
+    if CHECKPOINTER != "memory":
+        raise ValueError(f"Unknown CHECKPOINTER {CHECKPOINTER!r}, expected 'memory' or 'sqlite'")
+    return BoundedMemorySaver()
@@ -0,0 +1,186 @@
+"""
+Persistent embedding cache.
+
+Vectors are keyed by model name, call kind (query or document) and the SHA-256
+of the text, stored as float32 blobs in SQLite, and fronted by an in-memory LRU
+layer bounded by bytes. The wrapped embedder is only built when a text misses
+both layers, so fully cached runs never load the model.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable
+
+from langchain_core.embeddings import Embeddings
+
+from shared.instrumentation import count
+
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+def _pack(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from memory or disk.
+
+    Parameters
+    ----------
+    model_name : str
+        Part of every cache key, so vectors from different models never mix.
+    factory : Callable[[], Embeddings]
+        Builds the wrapped embedder on the first cache miss.
+    path : str
+        SQLite file holding the vectors; shared safely between processes.
+    memory_bytes : int
+        Budget for the in-memory LRU layer; least recently used vectors are
+        evicted once it is exceeded.
+    """
+
+    def __init__(self, model_name: str, factory: Callable[[], Embeddings],
+                 path: str = EMBEDDING_CACHE_PATH,
+                 memory_bytes: int = EMBEDDING_CACHE_MEMORY_BYTES):
+        self.model_name = model_name
+        self._factory = factory
+        self._embeddings = None
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._memory_limit = memory_bytes
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        "The wrapped embedder, built on first use."
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._factory()
+        return self._embeddings
+
+    def _key(self, kind: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    def _remember(self, key: str, blob: bytes):
+        "Insert into the LRU layer and evict down to the byte budget. Caller holds the lock."
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = blob
+        self._memory_size += len(blob)
+        while self._memory_size > self._memory_limit and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _lookup(self, keys: list[str]) -> tuple[dict[str, bytes], set[str]]:
+        "Cached vectors of `keys`, and which of the keys were found in memory."
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            in_memory = set(found)
+
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            # Stay well under SQLite's limit on bound parameters.
+            for start in range(0, len(missing), 500):
+                part = missing[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = blob
+                    self._remember(key, blob)
+        return found, in_memory
+
+    def _store(self, items: dict[str, bytes]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                items.items())
+            self._db.commit()
+            for key, blob in items.items():
+                self._remember(key, blob)
+
+    def _embed(self, kind: str, texts: list[str],
+               compute: Callable[[list[str]], list[list[float]]]) -> list[list[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        found, in_memory = self._lookup(keys)
+
+        # Counted per position, so a text repeated in a batch counts as often as it appears
+        memory_hits = sum(key in in_memory for key in keys)
+        disk_hits = sum(key in found for key in keys) - memory_hits
+        misses = len(keys) - memory_hits - disk_hits
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += disk_hits
+            self.misses += misses
+        count("embedding_cache_hits", memory_hits + disk_hits)
+        count("embedding_cache_misses", misses)
+
+        # Each distinct missing text is embedded once
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            vectors = compute(list(missing.values()))
+            computed = {key: _pack(vector)
+                        for key, vector in zip(missing, vectors)}
+            self._store(computed)
+            found.update(computed)
+        return [_unpack(found[key]) for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed("document", texts,
+                           lambda misses: self.embeddings.embed_documents(misses))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed("query", [text],
+                           lambda misses: [self.embeddings.embed_query(misses[0])])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Query vectors for many texts, with one call to the model for all misses.
+
+        The wrapped models embed queries and documents alike (GPT4All does), so
+        misses go through `embed_documents`, which batches them.
+        """
+        return self._embed("query", texts,
+                           lambda misses: self.embeddings.embed_documents(misses))
+
+    def stats(self) -> dict:
+        "Hit and miss counters since this instance was created."
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_bytes": self._memory_size,
+            }
@@ -0,0 +1,167 @@
+"""
+Micro-batching embedding service.
+
+`EmbeddingService` puts the texts of concurrent `embed_query` and
+`embed_documents` calls on a queue. One worker thread takes a request, then
+gathers more for up to `max_wait_ms` or until `max_batch_size` texts are
+waiting. It embeds them all with one batched inference call and hands each
+caller its own vectors. Under load, callers share model calls instead of
+queueing for the model one text at a time; a caller alone waits at most
+`max_wait_ms` longer. A request with `max_batch_size` texts or more (an
+ingestion batch) is never kept waiting, and a model call never embeds more
+than `max_batch_size` texts: larger requests are embedded in slices.
+
+The worker is also the only thread using the model, so models that are not
+thread-safe can be shared by every request of the process.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from langchain_core.embeddings import Embeddings
+
+from shared.metrics import Counters, LatencyRecorder
+
+EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_MAX_WAIT_MS", "2"))
+
+
+def embed_many(model: Embeddings, texts: list[str]) -> list[list[float]]:
+    "The default inference: the model's own `embed_documents`."
+    return model.embed_documents(texts)
+
+
+class EmbeddingService(Embeddings):
+    """
+    Embeddings that coalesce concurrent callers into batched model calls.
+
+    Parameters
+    ----------
+    factory : Callable[[], Embeddings]
+        Builds the model, on the worker thread before the first batch. If it
+        fails, the callers of that batch get the error and the next batch
+        tries again.
+    infer : Callable[[Embeddings, list[str]], list[list[float]]]
+        Embeds a batch of texts with the model in one call. Queries and
+        documents are embedded alike, as GPT4All does.
+    max_batch_size : int
+        Most texts gathered into one batch.
+    max_wait_ms : float
+        Longest time the first request of a batch waits for others.
+    """
+
+    def __init__(self, factory: Callable[[], Embeddings],
+                 infer: Callable[[Embeddings, list[str]], list[list[float]]] = embed_many,
+                 max_batch_size: int = EMBEDDING_BATCH_MAX_SIZE,
+                 max_wait_ms: float = EMBEDDING_BATCH_MAX_WAIT_MS):
+        self._factory = factory
+        self._infer = infer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self._queue: queue.Queue = queue.Queue()
+        # A request that did not fit in the last batch; it starts the next one
+        self._carried = None
+        self._worker = None
+        self._lock = threading.Lock()
+        self.counters = Counters("requests", "texts", "batches")
+        self.queue_latency = LatencyRecorder()
+        self.batch_latency = LatencyRecorder()
+
+    def _submit(self, texts: list[str]) -> Future:
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True,
+                                                name="embedding-service")
+                self._worker.start()
+        self._queue.put((texts, future, time.perf_counter()))
+        return future
+
+    def _gather(self) -> list[tuple[list[str], Future, float]]:
+        """
+        The next batch of requests: the oldest one, then any arriving within `max_wait`
+        that fit in `max_batch_size` texts.
+        """
+        first, self._carried = self._carried or self._queue.get(), None
+        batch = [first]
+        size = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                request = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if size + len(request[0]) > self.max_batch_size:
+                self._carried = request
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _embed(self, model: Embeddings, texts: list[str]) -> list[list[float]]:
+        "Vectors of `texts`, in model calls of at most `max_batch_size` texts."
+        return [vector for start in range(0, len(texts), self.max_batch_size)
+                for vector in self._infer(model, texts[start:start + self.max_batch_size])]
+
+    def _run(self):
+        model = None
+        while True:
+            # Requests whose callers were cancelled (e.g. an asyncio timeout) are dropped
+            batch = [request for request in self._gather()
+                     if request[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [text for request_texts, _, _ in batch for text in request_texts]
+            start = time.perf_counter()
+            for _, _, queued in batch:
+                self.queue_latency.record(start - queued)
+            try:
+                if model is None:
+                    model = self._factory()
+                vectors = self._embed(model, texts)
+            except BaseException as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+            self.batch_latency.record(time.perf_counter() - start)
+            self.counters.increment("requests", len(batch))
+            self.counters.increment("texts", len(texts))
+            self.counters.increment("batches")
+            offset = 0
+            for request_texts, future, _ in batch:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._submit(list(texts)).result()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._submit([text]).result()[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        # Awaits the worker directly rather than holding an executor thread while queued
+        return await asyncio.wrap_future(self._submit(list(texts)))
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await asyncio.wrap_future(self._submit([text])))[0]
+
+    def stats(self) -> dict:
+        "Batch counts and sizes, time spent queued and time per batched model call."
+        counters = self.counters.as_dict()
+        batches = counters["batches"]
+        return {
+            **counters,
+            "mean_batch_size": counters["texts"] / batches if batches else 0.0,
+            "queue_latency": self.queue_latency.summary(),
+            "batch_latency": self.batch_latency.summary(),
+        }
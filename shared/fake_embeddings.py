@@ -0,0 +1,40 @@
+"""
+Deterministic local embedder for tests and offline benchmarks.
+
+Texts are embedded as L2-normalised hashed bags of words (the hashing trick),
+so texts sharing words are close and results are identical across processes
+and machines, without downloading a model.
+"""
+
+import hashlib
+import math
+import re
+
+from langchain_core.embeddings import Embeddings
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    "Bag-of-words embeddings hashed into `size` dimensions."
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for word in _WORD.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.size] += 1.0 if value >> 63 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
@@ -0,0 +1,148 @@
+"""
+Deterministic local chat model for tests, load tests and offline benchmarks.
+
+It answers by echoing the latest human message, sleeps to simulate provider
+latency (asynchronously on the async path, so concurrency behaves like a real
+network call), streams word by word, and supports tool binding so the ReAct
+agent path can be exercised without a network connection. It can also fail
+with rate-limit errors and be slow now and then, to exercise retries and
+hedging in `shared.llm`.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import (AIMessage, AIMessageChunk, BaseMessage,
+                                     HumanMessage, ToolMessage)
+from langchain_core.outputs import (ChatGeneration, ChatGenerationChunk,
+                                    ChatResult)
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+_POSSESSIVE_NAME = re.compile(r"\b([A-Z][a-z]+)'s\b")
+
+
+class FakeRateLimitError(Exception):
+    "A 429 from the fake provider."
+    code = 429
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers deterministically after a fixed delay.
+
+    With tools bound, the first turn after a human message calls every tool
+    whose name ends in a word found in the question (e.g. `get_user_stats` for
+    "stats"), passing the possessive name in the question ("Ana's") as
+    `user_id`. Later turns answer with the tool results.
+    """
+
+    latency: float = 0.2
+    "Seconds before the first token."
+    token_latency: float = 0.0
+    "Extra seconds per streamed token."
+    error_rate: float = 0.0
+    "Fraction of calls failing with `FakeRateLimitError` before the first token."
+    tail_rate: float = 0.0
+    "Fraction of calls taking `tail_latency` instead of `latency`."
+    tail_latency: float = 2.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _respond(self, messages: list[BaseMessage], tools: list[dict] | None) -> AIMessage:
+        human_index = max((i for i, m in enumerate(messages)
+                           if isinstance(m, HumanMessage)), default=-1)
+        question = messages[human_index].text if human_index >= 0 else ""
+        tool_results = [m.text for m in messages[human_index + 1:]
+                        if isinstance(m, ToolMessage)]
+
+        if tools and not tool_results:
+            match = _POSSESSIVE_NAME.search(question)
+            user_id = match.group(1) if match else "unknown"
+            words = set(re.findall(r"[a-z]+", question.lower()))
+            tool_calls = [
+                {"name": tool["function"]["name"], "args": {"user_id": user_id},
+                 "id": f"call_{i}"}
+                for i, tool in enumerate(tools)
+                if tool["function"]["name"].rsplit("_", 1)[-1] in words
+            ]
+            if tool_calls:
+                return AIMessage(content="", tool_calls=tool_calls)
+
+        if tool_results:
+            return AIMessage(content="Based on the service data: " + " ".join(tool_results))
+        return AIMessage(content=f"Fake answer to: {question}")
+
+    @staticmethod
+    def _usage(messages: list[BaseMessage], message: AIMessage) -> dict:
+        "Token usage, counting one token per word."
+        input_tokens = sum(len(m.text.split()) for m in messages)
+        output_tokens = len(message.text.split()) + len(message.tool_calls)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _answer(self, messages: list[BaseMessage], tools: list[dict] | None) -> AIMessage:
+        message = self._respond(messages, tools)
+        message.usage_metadata = self._usage(messages, message)
+        return message
+
+    def _delay(self) -> float:
+        "Seconds before the first token of this call; raises for a simulated rate limit."
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (fake provider)")
+        return self.tail_latency if self.tail_rate and random.random() < self.tail_rate \
+            else self.latency
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay())
+        message = self._answer(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        message = self._answer(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> list[AIMessageChunk]:
+        if message.tool_calls:
+            chunks = [AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]),
+                 "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)])]
+        else:
+            chunks = [AIMessageChunk(content=token)
+                      for token in re.findall(r"\S+\s*", message.text)]
+        # Like Gemini, every chunk reports its share of the usage: the prompt with the
+        # first chunk and the output tokens with the chunk that produced them
+        usage = message.usage_metadata
+        for i, chunk in enumerate(chunks):
+            input_tokens = usage["input_tokens"] if i == 0 else 0
+            output_tokens = usage["output_tokens"] - (len(chunks) - 1) if i == 0 else 1
+            chunk.usage_metadata = {"input_tokens": input_tokens,
+                                    "output_tokens": output_tokens,
+                                    "total_tokens": input_tokens + output_tokens}
+        return chunks
+
+    def _stream(self, messages, stop=None, run_manager=None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._delay())
+        for chunk in self._chunks(self._answer(messages, kwargs.get("tools"))):
+            yield ChatGenerationChunk(message=chunk)
+            time.sleep(self.token_latency)
+
+    async def _astream(self, messages, stop=None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._delay())
+        for chunk in self._chunks(self._answer(messages, kwargs.get("tools"))):
+            yield ChatGenerationChunk(message=chunk)
+            await asyncio.sleep(self.token_latency)
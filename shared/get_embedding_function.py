@@ -1,11 +1,53 @@
+import os
+
 from langchain_community.embeddings import GPT4AllEmbeddings
 
+from shared.embedding_cache import CachedEmbeddings
+from shared.embedding_service import EmbeddingService
+from shared.fake_embeddings import HashingEmbeddings
 
-def get_embedding_function():
-    "Get the embedding function for the vector DB."
+EMBEDDING_MODEL = "all-MiniLM-L6-v2.gguf2.f16.gguf"
+# "gpt4all" (default) or "fake" for the deterministic offline `HashingEmbeddings`.
+EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "gpt4all")
+# Set EMBEDDING_CACHE=0 to always call the model directly.
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE", "1") != "0"
+# Set EMBEDDING_BATCHING=0 to call the model from each caller's thread, one call per caller.
+EMBEDDING_BATCHING_ENABLED = os.environ.get("EMBEDDING_BATCHING", "1") != "0"
+
+
+def get_gpt4all_embeddings():
+    "Build the GPT4All embedder itself, loading the model."
     gpt4all_embeddings = GPT4AllEmbeddings(
-        model_name="all-MiniLM-L6-v2.gguf2.f16.gguf",
+        model_name=EMBEDDING_MODEL,
         gpt4all_kwargs={'allow_download': 'True'},
         client=None
     )
     return gpt4all_embeddings
+
+
+def embed_gpt4all_batch(model: GPT4AllEmbeddings, texts: list[str]) -> list[list[float]]:
+    "Embed many texts in one GPT4All call; `GPT4AllEmbeddings.embed_documents` makes one per text."
+    return [list(map(float, vector)) for vector in model.client.embed(texts)]
+
+
+def get_batched_gpt4all_embeddings():
+    "The GPT4All embedder behind an `EmbeddingService`, which batches concurrent calls."
+    return EmbeddingService(get_gpt4all_embeddings, embed_gpt4all_batch)
+
+
+def get_embedding_function(cached: bool = EMBEDDING_CACHE_ENABLED,
+                           batched: bool = EMBEDDING_BATCHING_ENABLED):
+    "Get the embedding function for the vector DB."
+    if EMBEDDING_PROVIDER == "fake":
+        return HashingEmbeddings()
+    factory = get_batched_gpt4all_embeddings if batched else get_gpt4all_embeddings
+    if not cached:
+        return factory()
+    return CachedEmbeddings(EMBEDDING_MODEL, factory)
+
+
+def embed_queries(embeddings, texts: list[str]) -> list[list[float]]:
+    "Query vectors for all texts, with one call to the model where the embedder supports it."
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
@@ -0,0 +1,433 @@
+"""
+Per-request instrumentation of the query hot path.
+
+With TRACING=1 every query gets a `RequestTrace` holding timed spans for each
+stage (routing, answer-cache lookup, reformulation, query embedding, vector
+and keyword search, context assembly, the answer LLM call, agent LLM turns and
+tool calls), token counts and cache hits. Finished traces go to the exporters
+named in TRACE_EXPORTERS:
+
+- `log`: one summary line per request on the `rag.trace` logger;
+- `ring`: the last TRACE_RING_SIZE traces in memory (`ring_buffer.recent()`);
+- `prometheus`: counters and histograms in the Prometheus text format,
+  served on METRICS_PORT by `serve_metrics`.
+
+LLM, tool and retriever runs are timed by a LangChain callback handler
+attached to the request; the other stages call `span` and `count`. Without an
+active trace (TRACING=0, the default) both return immediately, so the hot
+path pays one context-variable lookup per stage and no handler is attached.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACING_ENABLED = os.environ.get("TRACING", "0") == "1"
+TRACE_EXPORTERS = os.environ.get("TRACE_EXPORTERS", "log,ring,prometheus")
+TRACE_RING_SIZE = int(os.environ.get("TRACE_RING_SIZE", "256"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# Local only by default, as traces carry user questions; "0.0.0.0" serves other hosts
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# Tags of the form "stage:<name>" name the stage of the LLM calls below them
+STAGE_TAG_PREFIX = "stage:"
+
+# Histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+logger = logging.getLogger("rag.trace")
+
+_current_trace = ContextVar("current_trace", default=None)
+_NO_SPAN = nullcontext()
+
+
+class RequestTrace:
+    """
+    Spans, counts and attributes recorded for one query.
+
+    Stages may run on worker threads (LangGraph runs sync nodes on an executor),
+    so recording is thread-safe.
+    """
+
+    def __init__(self, thread_id: str | None = None):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.thread_id = thread_id
+        self.started_at = time.time()
+        self.duration = None
+        self.error = None
+        self.attributes = {}
+        self.spans = []
+        self.counts = Counter()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.callback = TraceCallbackHandler(self)
+
+    def add_span(self, name: str, start: float, end: float, attributes: dict | None = None):
+        "Record a stage that ran between two `time.perf_counter()` readings."
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": (start - self._start) * 1e3,
+                "duration_ms": (end - start) * 1e3,
+                **(attributes or {}),
+            })
+
+    @contextmanager
+    def span(self, name: str, attributes: dict | None = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter(), attributes)
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def finish(self, error: BaseException | None = None):
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.error = type(error).__name__
+
+    def stage_seconds(self) -> dict:
+        "Total seconds spent in each stage (a stage may run several times)."
+        totals = Counter()
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] += span["duration_ms"] / 1e3
+        return dict(totals)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "thread_id": self.thread_id,
+                "started_at": self.started_at,
+                "duration_ms": (self.duration or 0.0) * 1e3,
+                "error": self.error,
+                "attributes": dict(self.attributes),
+                "counts": dict(self.counts),
+                "spans": list(self.spans),
+            }
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Times the LLM, tool and retriever runs of one request and adds up token usage.
+
+    LLM spans are named after the closest "stage:<name>" tag (e.g. `reformulate`,
+    `answer`); calls of the ReAct agent's model node are `agent_llm`.
+    """
+
+    # Recording is cheap and thread-safe, so async runs need no executor hop
+    run_inline = True
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._runs = {}
+
+    @staticmethod
+    def _stage(default: str, tags, metadata) -> str:
+        for tag in tags or ():
+            if tag.startswith(STAGE_TAG_PREFIX):
+                return tag[len(STAGE_TAG_PREFIX):]
+        if (metadata or {}).get("langgraph_node") == "agent":
+            return "agent_llm"
+        return default
+
+    def _begin(self, run_id, name: str):
+        self._runs[run_id] = (name, time.perf_counter())
+
+    def _end(self, run_id, attributes: dict | None = None) -> str | None:
+        name, start = self._runs.pop(run_id, (None, None))
+        if name is not None:
+            self.trace.add_span(name, start, time.perf_counter(), attributes)
+        return name
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None,
+                            metadata=None, **kwargs):
+        self._begin(run_id, self._stage("llm", tags, metadata))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, tags=None, metadata=None, **kwargs):
+        self._begin(run_id, self._stage("llm", tags, metadata))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        name = self._end(run_id, {"input_tokens": input_tokens,
+                                  "output_tokens": output_tokens})
+        if name is not None:
+            self.trace.count(f"{name}_calls")
+            self.trace.count("input_tokens", input_tokens)
+            self.trace.count("output_tokens", output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, {"error": type(error).__name__})
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._begin(run_id, f"tool:{(serialized or {}).get('name', 'unknown')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        if self._end(run_id) is not None:
+            self.trace.count("tool_calls")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, {"error": type(error).__name__})
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._begin(run_id, "retrieve")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, {"documents": len(documents)})
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, {"error": type(error).__name__})
+
+
+def current_trace() -> RequestTrace | None:
+    "The trace of the request being served, if tracing is on."
+    return _current_trace.get()
+
+
+def span(name: str, **attributes):
+    "Context manager timing one stage of the current request; a no-op without a trace."
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(name, attributes)
+
+
+def count(name: str, amount: int = 1):
+    "Add to a per-request count (cache hits, skipped calls, ...); a no-op without a trace."
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(name, amount)
+
+
+def annotate(**attributes):
+    "Attach attributes (e.g. the route taken) to the current request."
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def callbacks() -> list:
+    "LangChain callbacks for the current request, to pass in a run's config."
+    trace = _current_trace.get()
+    return [trace.callback] if trace is not None else []
+
+
+@contextmanager
+def trace_request(thread_id: str | None = None, enabled: bool | None = None):
+    """
+    Trace one query: yields its `RequestTrace` (or None when tracing is off) and
+    exports it when the block exits.
+    """
+    if not (TRACING_ENABLED if enabled is None else enabled):
+        yield None
+        return
+    trace = RequestTrace(thread_id)
+    token = _current_trace.set(trace)
+    error = None
+    try:
+        yield trace
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        try:
+            _current_trace.reset(token)
+        except ValueError:
+            # A streaming generator closed from another context
+            pass
+        trace.finish(error)
+        export(trace)
+
+
+class LogExporter:
+    "Logs one line per request: total time, time per stage, tokens and counts."
+
+    def __init__(self, log: logging.Logger = logger):
+        self.log = log
+
+    def export(self, trace: RequestTrace):
+        stages = " ".join(f"{name}={seconds * 1e3:.1f}ms"
+                          for name, seconds in trace.stage_seconds().items())
+        counts = " ".join(f"{name}={value}" for name, value in sorted(trace.counts.items()))
+        attributes = " ".join(f"{key}={value}" for key, value in trace.attributes.items())
+        self.log.info("request=%s thread=%s total=%.1fms %s %s %s%s", trace.request_id,
+                      trace.thread_id, trace.duration * 1e3, attributes, stages, counts,
+                      f" error={trace.error}" if trace.error else "")
+
+
+class RingBufferExporter:
+    "Keeps the most recent traces in memory, as dicts."
+
+    def __init__(self, capacity: int = TRACE_RING_SIZE):
+        self._traces = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def export(self, trace: RequestTrace):
+        record = trace.as_dict()
+        with self._lock:
+            self._traces.append(record)
+
+    def recent(self, limit: int | None = None) -> list[dict]:
+        "The last `limit` traces (all kept traces by default), oldest first."
+        with self._lock:
+            traces = list(self._traces)
+        return traces[-limit:] if limit else traces
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class PrometheusExporter:
+    """
+    Aggregates traces into Prometheus counters and histograms.
+
+    `render` returns the text exposition format, served by `serve_metrics`.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._requests = Counter()
+        self._events = Counter()
+        self._request_seconds = _Histogram(buckets)
+        self._stage_seconds = {}
+        self._lock = threading.Lock()
+
+    def export(self, trace: RequestTrace):
+        with self._lock:
+            route = trace.attributes.get("route", "unknown")
+            self._requests[(route, "error" if trace.error else "ok")] += 1
+            self._request_seconds.observe(trace.duration)
+            for stage, seconds in trace.stage_seconds().items():
+                self._stage_seconds.setdefault(stage, _Histogram(self.buckets)).observe(seconds)
+            self._events.update(trace.counts)
+
+    def _histogram_lines(self, name: str, histogram: _Histogram, **labels) -> list[str]:
+        lines = [f"{name}_bucket{_labels(**labels, le=bound)} {count}"
+                 for bound, count in zip(histogram.buckets, histogram.counts)]
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+        suffix = _labels(**labels) if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram.sum}")
+        lines.append(f"{name}_count{suffix} {histogram.count}")
+        return lines
+
+    def render(self) -> str:
+        with self._lock:
+            lines = ["# HELP rag_requests_total Queries served, by route and outcome.",
+                     "# TYPE rag_requests_total counter"]
+            lines += [f"rag_requests_total{_labels(route=route, status=status)} {value}"
+                      for (route, status), value in sorted(self._requests.items())]
+            lines += ["# HELP rag_request_duration_seconds End-to-end query latency.",
+                      "# TYPE rag_request_duration_seconds histogram"]
+            lines += self._histogram_lines("rag_request_duration_seconds",
+                                           self._request_seconds)
+            lines += ["# HELP rag_stage_duration_seconds Time per query spent in each stage.",
+                      "# TYPE rag_stage_duration_seconds histogram"]
+            for stage, histogram in sorted(self._stage_seconds.items()):
+                lines += self._histogram_lines("rag_stage_duration_seconds", histogram,
+                                               stage=stage)
+            lines += ["# HELP rag_events_total Tokens, LLM and tool calls and cache events.",
+                      "# TYPE rag_events_total counter"]
+            lines += [f"rag_events_total{_labels(event=event)} {value}"
+                      for event, value in sorted(self._events.items())]
+        return "\n".join(lines) + "\n"
+
+
+# Exporters receiving every finished trace; `add_exporter` plugs in others
+exporters = []
+ring_buffer = RingBufferExporter()
+prometheus = PrometheusExporter()
+_BUILTIN_EXPORTERS = {"log": LogExporter, "ring": lambda: ring_buffer,
+                      "prometheus": lambda: prometheus}
+
+
+def add_exporter(exporter):
+    "Send finished traces to `exporter`, any object with an `export(trace)` method."
+    exporters.append(exporter)
+
+
+def configure_exporters(names: str = TRACE_EXPORTERS):
+    "Replace the exporters with the comma-separated built-ins in `names`."
+    exporters.clear()
+    for name in filter(None, (name.strip() for name in names.split(","))):
+        if name not in _BUILTIN_EXPORTERS:
+            raise ValueError(f"Unknown trace exporter {name!r}, "
+                             f"expected one of {sorted(_BUILTIN_EXPORTERS)}")
+        add_exporter(_BUILTIN_EXPORTERS[name]())
+    if "log" in names and not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+        logger.setLevel(logging.INFO)
+
+
+def export(trace: RequestTrace):
+    for exporter in exporters:
+        try:
+            exporter.export(trace)
+        except Exception:
+            # Instrumentation must never fail a query
+            logger.exception("trace exporter %r failed", exporter)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus.render(), "text/plain; version=0.0.4"
+        elif self.path == "/traces":
+            body, content_type = json.dumps(ring_buffer.recent()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    "Serve /metrics (Prometheus text) and /traces (recent traces as JSON) on a daemon thread."
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+if TRACING_ENABLED:
+    configure_exporters()
@@ -0,0 +1,518 @@
+"""
+Chat model construction and the gateway every outbound LLM call goes through.
+
+Every chat model in the application is built by `create_llm`, which picks the
+provider from LLM_PROVIDER ("gemini" by default, or "fake" for the local
+`FakeChatModel`) and wraps it so that each call passes `llm_gateway`:
+
+- at most LLM_MAX_CONCURRENCY calls are in flight at once;
+- calls are started within LLM_RPM requests and LLM_TPM tokens per minute
+  (token buckets; a call's tokens are estimated up front and corrected with
+  the usage the provider reports);
+- rate-limit, server and connection errors are retried up to LLM_MAX_RETRIES
+  times after a jittered exponential backoff, or after the delay the server
+  asks for;
+- with LLM_HEDGE_AFTER_MS set, a non-streaming call still running after that
+  long is duplicated and the first answer wins;
+- latency, retries, hedges and throttling are recorded (`llm_stats`).
+
+The Gemini client keeps a pool of up to LLM_POOL_CONNECTIONS keep-alive HTTP
+connections for sync calls and another for async ones; it is built once per
+process (`shared.components.get_llm`).
+"""
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import copy_context
+
+# Configuration
+import shared.config
+from shared.fake_llm import FakeChatModel
+from shared.instrumentation import count, span
+from shared.metrics import Counters, LatencyRecorder
+
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "gemini")
+LLM_MODEL = "gemini-flash-latest"
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+# Requests and tokens per minute; 0 for no limit
+LLM_RPM = float(os.environ.get("LLM_RPM", "0"))
+LLM_TPM = float(os.environ.get("LLM_TPM", "0"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_MS = float(os.environ.get("LLM_RETRY_BASE_MS", "500"))
+LLM_RETRY_MAX_MS = float(os.environ.get("LLM_RETRY_MAX_MS", "20000"))
+# Duplicate a call still running after this long; 0 to never hedge
+LLM_HEDGE_AFTER_MS = float(os.environ.get("LLM_HEDGE_AFTER_MS", "0"))
+LLM_TIMEOUT_S = float(os.environ.get("LLM_TIMEOUT_S", "60"))
+LLM_POOL_CONNECTIONS = int(os.environ.get("LLM_POOL_CONNECTIONS", str(2 * LLM_MAX_CONCURRENCY)))
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "200"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_MESSAGE = re.compile(
+    r"\b(429|500|502|503|504)\b|RESOURCE_EXHAUSTED|UNAVAILABLE|DEADLINE_EXCEEDED")
+_RETRY_DELAY = re.compile(r"retry_?delay\W+(?:seconds\W+)?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of concurrent LLM calls.
+
+    Threads share one semaphore. Asyncio semaphores are bound to an event
+    loop, so each running loop gets its own, created on first use.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._thread_semaphore = threading.BoundedSemaphore(limit)
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self):
+        with self._thread_semaphore:
+            yield
+
+    @asynccontextmanager
+    async def ahold(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._loop_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._loop_semaphores[loop] = asyncio.Semaphore(self.limit)
+        async with semaphore:
+            yield
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units a minute, in bursts of up to a minute's worth.
+
+    Takers may overdraw the bucket: `reserve` always takes its amount and returns how
+    long the taker must wait for the balance to be covered, which serves callers in
+    the order they reserved. A falsy `per_minute` means no limit.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_second = per_minute / 60
+        self.capacity = per_minute
+        self._balance = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._balance = min(self.capacity,
+                            self._balance + (now - self._updated) * self.per_second)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        "Take `amount`; seconds to wait before using it."
+        if not self.per_second:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._balance -= amount
+            return max(0.0, -self._balance / self.per_second)
+
+    def try_take(self, amount: float) -> bool:
+        "Take `amount` only if it is available now."
+        if not self.per_second:
+            return True
+        with self._lock:
+            self._refill()
+            if self._balance < amount:
+                return False
+            self._balance -= amount
+            return True
+
+    def adjust(self, amount: float):
+        "Take `amount` more (or give back a negative amount) after the fact."
+        if self.per_second:
+            with self._lock:
+                self._balance -= amount
+
+
+def estimate_tokens(messages) -> int:
+    "Rough prompt size in tokens (four characters each), before the provider reports usage."
+    if isinstance(messages, str):
+        return len(messages) // 4 + 1
+    return sum(len(getattr(m, "text", "") or "") for m in messages) // 4 + 1
+
+
+def reported_tokens(result) -> int | None:
+    "Total tokens of a `ChatResult` or message chunk, if the provider reported usage."
+    message = result.generations[0].message if hasattr(result, "generations") else \
+        getattr(result, "message", None)
+    usage = getattr(message, "usage_metadata", None)
+    return usage["total_tokens"] if usage else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether `error` is a rate limit, server error, timeout or dropped connection.
+
+    The errors it wraps (`__cause__`) are checked too. A status code decides when there
+    is one; otherwise the error messages are searched for one.
+    """
+    import httpx
+    chain = []
+    while error is not None:
+        chain.append(error)
+        error = error.__cause__
+    for error in chain:
+        if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+            return True
+        status = getattr(error, "code", None) or getattr(error, "status_code", None)
+        if isinstance(status, int):
+            return status in RETRYABLE_STATUS
+    return any(_RETRYABLE_MESSAGE.search(str(error)) for error in chain)
+
+
+def retry_delay(attempt: int, error: BaseException | None = None) -> float:
+    "Seconds before retry number `attempt` (from 0): the server's retry delay, or full jitter."
+    match = _RETRY_DELAY.search(str(error)) if error is not None else None
+    if match:
+        return float(match.group(1))
+    ceiling = min(LLM_RETRY_MAX_MS, LLM_RETRY_BASE_MS * 2 ** attempt) / 1000
+    return random.uniform(0, ceiling)
+
+
+class LLMGateway:
+    """
+    Concurrency cap, rate limits, retries, hedging and latency metrics for LLM calls.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        Calls in flight at once.
+    rpm, tpm : float
+        Requests and tokens started per minute; 0 for no limit.
+    max_retries : int
+        Retries of a call failing with a retryable error (`is_retryable`).
+    hedge_after : float
+        Seconds after which a non-streaming call still running is duplicated; 0 to
+        never hedge. A hedge is only sent if the rate limits allow it right away.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, rpm: float = LLM_RPM,
+                 tpm: float = LLM_TPM, max_retries: int = LLM_MAX_RETRIES,
+                 hedge_after: float = LLM_HEDGE_AFTER_MS / 1000):
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.counters = Counters("calls", "errors", "retries", "hedges", "hedge_wins",
+                                 "throttled")
+        self.latency = LatencyRecorder()
+        "Duration of successful calls, including retries and waits."
+        self.throttle_latency = LatencyRecorder()
+        self._hedge_pool = ThreadPoolExecutor(2 * max_concurrency, thread_name_prefix="llm-hedge")
+
+    def _admission_delay(self, tokens: int) -> float:
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if delay:
+            self.counters.increment("throttled")
+            self.throttle_latency.record(delay)
+        return delay
+
+    def _can_hedge(self, tokens: int) -> bool:
+        if not self.requests.try_take(1):
+            return False
+        if not self.tokens.try_take(tokens):
+            self.requests.adjust(-1)
+            return False
+        self.counters.increment("hedges")
+        count("llm_hedges")
+        return True
+
+    def _settle(self, estimated: int, reported: int | None):
+        "Correct a call's token reservation to the usage the provider reported, if any."
+        if reported is not None:
+            self.tokens.adjust(reported - estimated)
+
+    def _refund(self, tokens: int):
+        "Give back the reservation of an attempt that failed before any output, as it is retried."
+        self.requests.adjust(-1)
+        self.tokens.adjust(-tokens)
+
+    def _failed(self, attempt: int, error: Exception) -> float | None:
+        "Delay before retrying after `error`, or None to give up."
+        self.counters.increment("errors")
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        self.counters.increment("retries")
+        count("llm_retries")
+        return retry_delay(attempt, error)
+
+    def _held(self, call, started: threading.Event | None = None):
+        with self.limiter.hold():
+            if started is not None:
+                started.set()
+            return call()
+
+    def _hedged(self, call, tokens: int):
+        "Run `call`, starting a duplicate if it is slow; the first success wins."
+        started = threading.Event()
+        primary = self._hedge_pool.submit(copy_context().run, self._held, call, started)
+        # Time spent waiting for a concurrency slot does not count towards the hedge delay
+        started.wait()
+        done, _ = wait_futures([primary], timeout=self.hedge_after)
+        if done or not self._can_hedge(tokens):
+            return primary.result()
+        hedge = self._hedge_pool.submit(copy_context().run, self._held, call)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.counters.increment("hedge_wins")
+                    return future.result()
+        return primary.result()
+
+    async def _aheld(self, call, started: asyncio.Event | None = None):
+        async with self.limiter.ahold():
+            if started is not None:
+                started.set()
+            return await call()
+
+    async def _ahedged(self, call, tokens: int):
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(self._aheld(call, started))
+        try:
+            await started.wait()
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done or not self._can_hedge(tokens):
+            return await primary
+        hedge = asyncio.ensure_future(self._aheld(call))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters.increment("hedge_wins")
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def call(self, call, messages):
+        "Run `call()` (one model request for `messages`) under the gateway's policies."
+        tokens = estimate_tokens(messages)
+        start = time.perf_counter()
+        self.counters.increment("calls")
+        for attempt in range(self.max_retries + 1):
+            delay = self._admission_delay(tokens)
+            if delay:
+                with span("llm_throttle"):
+                    time.sleep(delay)
+            try:
+                result = self._hedged(call, tokens) if self.hedge_after \
+                    else self._held(call)
+            except Exception as e:
+                delay = self._failed(attempt, e)
+                if delay is None:
+                    raise
+                self._refund(tokens)
+                time.sleep(delay)
+                continue
+            self._settle(tokens, reported_tokens(result))
+            self.latency.record(time.perf_counter() - start)
+            return result
+
+    async def acall(self, call, messages):
+        "Async counterpart of `call`; `call()` returns an awaitable."
+        tokens = estimate_tokens(messages)
+        start = time.perf_counter()
+        self.counters.increment("calls")
+        for attempt in range(self.max_retries + 1):
+            delay = self._admission_delay(tokens)
+            if delay:
+                with span("llm_throttle"):
+                    await asyncio.sleep(delay)
+            try:
+                result = await (self._ahedged(call, tokens) if self.hedge_after
+                                else self._aheld(call))
+            except Exception as e:
+                delay = self._failed(attempt, e)
+                if delay is None:
+                    raise
+                self._refund(tokens)
+                await asyncio.sleep(delay)
+                continue
+            self._settle(tokens, reported_tokens(result))
+            self.latency.record(time.perf_counter() - start)
+            return result
+
+    def stream(self, stream, messages):
+        """
+        Yield from `stream()` under the gateway's policies.
+
+        Only failures before the first chunk are retried, and streams are never hedged.
+        Chunks report their share of the usage (as Gemini's do), so the reservation is
+        settled once, with their sum, when the stream ends or fails.
+        """
+        tokens = estimate_tokens(messages)
+        start = time.perf_counter()
+        self.counters.increment("calls")
+        for attempt in range(self.max_retries + 1):
+            delay = self._admission_delay(tokens)
+            if delay:
+                with span("llm_throttle"):
+                    time.sleep(delay)
+            started = False
+            usage = None
+            try:
+                with self.limiter.hold():
+                    for chunk in stream():
+                        started = True
+                        reported = reported_tokens(chunk)
+                        if reported is not None:
+                            usage = (usage or 0) + reported
+                        yield chunk
+            except Exception as e:
+                delay = None if started else self._failed(attempt, e)
+                if delay is None:
+                    raise
+                self._refund(tokens)
+                time.sleep(delay)
+                continue
+            finally:
+                self._settle(tokens, usage)
+            self.latency.record(time.perf_counter() - start)
+            return
+
+    async def astream(self, stream, messages):
+        "Async counterpart of `stream`."
+        tokens = estimate_tokens(messages)
+        start = time.perf_counter()
+        self.counters.increment("calls")
+        for attempt in range(self.max_retries + 1):
+            delay = self._admission_delay(tokens)
+            if delay:
+                with span("llm_throttle"):
+                    await asyncio.sleep(delay)
+            started = False
+            usage = None
+            try:
+                async with self.limiter.ahold():
+                    async for chunk in stream():
+                        started = True
+                        reported = reported_tokens(chunk)
+                        if reported is not None:
+                            usage = (usage or 0) + reported
+                        yield chunk
+            except Exception as e:
+                delay = None if started else self._failed(attempt, e)
+                if delay is None:
+                    raise
+                self._refund(tokens)
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                self._settle(tokens, usage)
+            self.latency.record(time.perf_counter() - start)
+            return
+
+    def stats(self) -> dict:
+        return {
+            **self.counters.as_dict(),
+            "latency": self.latency.summary(),
+            "throttle_wait": self.throttle_latency.summary(),
+        }
+
+
+llm_gateway = LLMGateway()
+# The concurrency cap on its own, for callers that only need a slot
+llm_limiter = llm_gateway.limiter
+
+
+def llm_stats() -> dict:
+    "Calls, errors, retries, hedges, throttling and latency of all LLM calls so far."
+    return llm_gateway.stats()
+
+
+class GatewayMixin:
+    "Sends every call to the model through `llm_gateway`."
+
+    def _generate(self, messages, *args, **kwargs):
+        generate = super()._generate
+        return llm_gateway.call(lambda: generate(messages, *args, **kwargs), messages)
+
+    async def _agenerate(self, messages, *args, **kwargs):
+        agenerate = super()._agenerate
+        return await llm_gateway.acall(lambda: agenerate(messages, *args, **kwargs), messages)
+
+    def _stream(self, messages, *args, **kwargs):
+        stream = super()._stream
+        yield from llm_gateway.stream(lambda: stream(messages, *args, **kwargs), messages)
+
+    async def _astream(self, messages, *args, **kwargs):
+        astream = super()._astream
+        async for chunk in llm_gateway.astream(lambda: astream(messages, *args, **kwargs),
+                                               messages):
+            yield chunk
+
+
+class GatewayFakeChatModel(GatewayMixin, FakeChatModel):
+    pass
+
+
+def create_llm():
+    """
+    Build the chat model for the configured provider.
+
+    Called once per process by `shared.components.get_llm`; use that instead.
+    """
+    if LLM_PROVIDER == "fake":
+        return GatewayFakeChatModel(latency=FAKE_LLM_LATENCY_MS / 1000)
+    # Imported here: the Google client library takes over a second to import
+    import httpx
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    class GatewayChatGoogleGenerativeAI(GatewayMixin, ChatGoogleGenerativeAI):
+        pass
+
+    class PooledTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+        "Keep-alive connection pools of the given size for both the sync and async clients."
+
+        def __init__(self, limits: httpx.Limits):
+            self._sync = httpx.HTTPTransport(limits=limits)
+            self._async = httpx.AsyncHTTPTransport(limits=limits)
+
+        def handle_request(self, request):
+            return self._sync.handle_request(request)
+
+        async def handle_async_request(self, request):
+            return await self._async.handle_async_request(request)
+
+        def close(self):
+            self._sync.close()
+
+        async def aclose(self):
+            await self._async.aclose()
+
+    limits = httpx.Limits(max_connections=LLM_POOL_CONNECTIONS,
+                          max_keepalive_connections=LLM_POOL_CONNECTIONS, keepalive_expiry=60)
+    # The same client args build the SDK's sync and async clients. Passing `limits`
+    # alone would only size the sync pool: with aiohttp installed, async calls go
+    # through an unbounded aiohttp session unless a transport is given.
+    # The gateway retries, so the SDK's own retries are off (1 means a single attempt)
+    return GatewayChatGoogleGenerativeAI(model=LLM_MODEL,
+                                         google_api_key=os.environ['GEMINI_API_KEY'],
+                                         max_retries=1, timeout=LLM_TIMEOUT_S,
+                                         client_args={"transport": PooledTransport(limits)})
@@ -0,0 +1,69 @@
+"""
+Lightweight in-process metrics shared by the caches and pipelines.
+
+Counters are plain thread-safe integers; latencies keep a bounded window of
+recent samples, which is enough for p50/p95/p99 on a single process.
+"""
+
+import threading
+from collections import deque
+
+
+def percentile(samples: list[float], q: float) -> float:
+    "Nearest-rank percentile of `samples` for `q` in [0, 100]."
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class LatencyRecorder:
+    "Keeps the most recent `window` latency samples, in seconds."
+
+    def __init__(self, window: int = 2048):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict:
+        "Count, mean and p50/p95/p99 in milliseconds."
+        with self._lock:
+            samples = list(self._samples)
+        return {
+            "count": self.count,
+            "mean_ms": self.mean * 1e3,
+            "p50_ms": percentile(samples, 50) * 1e3,
+            "p95_ms": percentile(samples, 95) * 1e3,
+            "p99_ms": percentile(samples, 99) * 1e3,
+        }
+
+
+class Counters:
+    "A thread-safe set of named integer counters."
+
+    def __init__(self, *names: str):
+        self._values = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def __getitem__(self, name: str) -> int:
+        return self._values.get(name, 0)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(self._values)
@@ -0,0 +1,277 @@
+"""
+Routing of user queries between the RAG chain ("rag") and the tool-calling
+agent ("tools").
+
+`QueryRouter` decides in three steps:
+
+1. a known user name in the query (an Aho-Corasick automaton over the names
+   in `agent.external_tools.USER_NAME_TO_ID`) routes to the tools;
+2. otherwise the query embedding is compared with the centroid of each
+   intent's example questions (`INTENT_EXAMPLES`); the nearest intent wins if
+   it beats the best intent of the other route by at least ROUTER_MIN_MARGIN
+   in cosine similarity;
+3. below that margin, the keyword rules (`keyword_route`) decide.
+
+The embedding is the query embedding retrieval needs anyway (the embedding
+cache serves it again to the retriever); the centroid comparison itself is a
+single small matrix-vector product.
+"""
+
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from agent.external_tools import USER_NAME_TO_ID
+from shared.components import get_embeddings, registry
+from shared.instrumentation import span
+from shared.metrics import Counters, LatencyRecorder
+
+# "embedding" (names, then intent centroids, then keywords) or "keyword" (keywords only)
+ROUTER = os.environ.get("ROUTER", "embedding")
+ROUTER_MIN_MARGIN = float(os.environ.get("ROUTER_MIN_MARGIN", "0.02"))
+
+TOOL_KEYWORDS = ["profile", "stats", "activity",
+                 "followers", "posts", "engagement", "recent activity"]
+
+# Example questions of each intent, and the route serving it. Each intent is
+# represented by the normalized mean of its examples' embeddings.
+INTENT_EXAMPLES = {
+    "books": ("rag", [
+        "Which direwolf belongs to Arya Stark?",
+        "What does the Hatter say about time at the tea party?",
+        "Where does Alice go after she shrinks?",
+        "Which house rules Winterfell in the story?",
+        "Why does the Queen of Hearts want to cut off heads?",
+        "Describe the chapter where the king arrives at the castle.",
+        "What does the Cheshire Cat tell Alice about the way to go?",
+        "Who is the father of Jon Snow in the book?",
+        "What is the Night's Watch and who joins it?",
+        "Summarize the plot of the novel.",
+        "Who is Sansa Stark?",
+        "Who is the Red Queen?",
+        "What did the Hound do to the butcher's boy?",
+        "How did King Robert die?",
+        "What is the name of Arya's sword?",
+        "What titles does Daenerys Targaryen claim?",
+        "How did Bran lose the use of his legs?",
+        "What did the Mock Turtle sing to Alice?",
+        "Who is Lord Tywin Lannister?",
+        "What is Alice's sister reading by the river bank?",
+    ]),
+    "profile": ("tools", [
+        "What is the user's profile?",
+        "Show me the email address and location of this user",
+        "Which company does the user work for?",
+        "When did this person join and what is their bio?",
+        "What is their personal website?",
+    ]),
+    "stats": ("tools", [
+        "How many followers does the user have?",
+        "What are the user's statistics?",
+        "How many posts has this person published?",
+        "What is the engagement rate of the account?",
+        "How many accounts is the user following?",
+    ]),
+    "activity": ("tools", [
+        "What has the user been up to recently?",
+        "Show the latest actions of this account",
+        "List the recent activity of the user",
+        "What did this person post or comment on last week?",
+        "Show the user's activity feed",
+    ]),
+}
+
+
+def keyword_route(query_text: str, names=USER_NAME_TO_ID) -> str:
+    "The original rules: tool keywords or a known user name route to the tools."
+    query_lower = query_text.lower()
+    if any(keyword in query_lower for keyword in TOOL_KEYWORDS):
+        return "tools"
+    if any(name.lower() in query_lower for name in names):
+        return "tools"
+    return "rag"
+
+
+def _is_boundary(text: str, index: int) -> bool:
+    return index < 0 or index >= len(text) or not text[index].isalnum()
+
+
+class NameMatcher:
+    """
+    Finds known names in a text in one pass, whatever the number of names (Aho-Corasick).
+
+    Matching is case-insensitive and on whole words: "Ana" matches "Ana's" but not "banana".
+
+    Parameters
+    ----------
+    names : dict[str, str]
+        Name to user ID.
+    """
+
+    def __init__(self, names: dict[str, str]):
+        # Trie of the lowercased names: transitions, failure links and, per node,
+        # the (length, user ID) of every name ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        for name, user_id in {name.lower(): user_id for name, user_id in names.items()}.items():
+            node = 0
+            for char in name:
+                if char not in self._goto[node]:
+                    self._goto[node][char] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                node = self._goto[node][char]
+            self._outputs[node].append((len(name), user_id))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def find(self, text: str) -> list[tuple[int, int, str]]:
+        "`(start, end, user_id)` of every whole-word name in `text`."
+        text = text.lower()
+        matches = []
+        node = 0
+        for end, char in enumerate(text, start=1):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, user_id in self._outputs[node]:
+                start = end - length
+                if _is_boundary(text, start - 1) and _is_boundary(text, end):
+                    matches.append((start, end, user_id))
+        return matches
+
+    def user_ids(self, text: str) -> list[str]:
+        "User IDs named in `text`, in order of first mention."
+        return list(dict.fromkeys(user_id for _, _, user_id in self.find(text)))
+
+
+@dataclass
+class RouteDecision:
+    "Where a query goes and why."
+    route: str
+    method: str
+    "How it was decided: `name`, `centroid` or `fallback` (keyword rules)."
+    intent: str | None = None
+    margin: float | None = None
+    "Similarity lead of the chosen route over the other (centroid and fallback only)."
+    user_ids: list[str] = field(default_factory=list)
+
+
+class QueryRouter:
+    """
+    Routes queries by user names, then nearest intent centroid, then keywords.
+
+    Parameters
+    ----------
+    embeddings : Embeddings, optional
+        Embeds queries and the intent examples; the shared embedder by default. It and the
+        centroids are only looked up when first needed, so queries naming a user never load
+        the embedding model.
+    intents : dict[str, tuple[str, list[str]]]
+        Intent name to its route and example questions.
+    names : dict[str, str]
+        User names recognised in queries, to user ID.
+    min_margin : float
+        Minimum lead in cosine similarity of the best intent over the best intent of the
+        other route; closer calls go to `keyword_route`.
+    """
+
+    def __init__(self, embeddings=None, intents=INTENT_EXAMPLES, names=USER_NAME_TO_ID,
+                 min_margin: float = ROUTER_MIN_MARGIN):
+        self._embeddings = embeddings
+        self.intents = intents
+        self.names = names
+        self.min_margin = min_margin
+        self.name_matcher = NameMatcher(names)
+        self._intent_names = list(intents)
+        self._intent_routes = np.array([intents[name][0] for name in self._intent_names])
+        self._centroids = None
+        self.counters = Counters("name", "centroid", "fallback")
+        self.classify_latency = LatencyRecorder()
+        "Time to route once the query embedding is known."
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    @property
+    def centroids(self) -> np.ndarray:
+        "Unit centroid of each intent's example embeddings, one row per intent."
+        if self._centroids is None:
+            # Imported here: it is loaded with the embedder, which exists by now
+            from shared.get_embedding_function import embed_queries
+            rows = []
+            for name in self._intent_names:
+                vectors = np.asarray(embed_queries(self.embeddings, self.intents[name][1]),
+                                     dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                centroid = vectors.mean(axis=0)
+                rows.append(centroid / np.linalg.norm(centroid))
+            self._centroids = np.stack(rows)
+        return self._centroids
+
+    def route(self, query: str, embedding: list[float] | None = None) -> RouteDecision:
+        "Route `query`, embedding it unless its `embedding` is given."
+        user_ids = self.name_matcher.user_ids(query)
+        if user_ids:
+            self.counters.increment("name")
+            return RouteDecision("tools", "name", user_ids=user_ids)
+        if embedding is None:
+            with span("embed_query"):
+                embedding = self.embeddings.embed_query(query)
+        return self.classify(query, embedding)
+
+    def classify(self, query: str, embedding: list[float]) -> RouteDecision:
+        "Route by the query's embedding, falling back to keywords on a close call."
+        centroids = self.centroids
+        start = time.perf_counter()
+        vector = np.asarray(embedding, dtype=np.float32)
+        scores = centroids @ vector / (np.linalg.norm(vector) or 1.0)
+        best = int(np.argmax(scores))
+        route = self._intent_routes[best]
+        others = scores[self._intent_routes != route]
+        margin = float(scores[best] - others.max()) if others.size else float("inf")
+
+        if margin >= self.min_margin:
+            decision = RouteDecision(str(route), "centroid", self._intent_names[best], margin)
+        else:
+            decision = RouteDecision(keyword_route(query, self.names), "fallback",
+                                     self._intent_names[best], margin)
+        self.classify_latency.record(time.perf_counter() - start)
+        self.counters.increment(decision.method)
+        return decision
+
+
+registry.register("router", QueryRouter)
+# Separate so `warm_up` can embed the intent examples once the embedder is loaded
+registry.register("router_centroids", lambda: get_router().centroids)
+
+
+def get_router() -> QueryRouter:
+    "Return the shared query router, building it once on first use."
+    return registry.get("router")
+
+
+def route_query(query_text: str, embedding: list[float] | None = None) -> RouteDecision:
+    "Route with the shared `QueryRouter`, or with the keyword rules alone if ROUTER=keyword."
+    if ROUTER == "keyword":
+        return RouteDecision(keyword_route(query_text), "keyword")
+    if ROUTER != "embedding":
+        raise ValueError(f"Unknown ROUTER {ROUTER!r}, expected 'embedding' or 'keyword'")
+    return get_router().route(query_text, embedding)
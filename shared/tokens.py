@@ -0,0 +1,15 @@
+"""
+Token estimates shared by ingestion (chunk sizes) and RAG (context budgets).
+
+Neither needs exact counts for a particular model, so text is measured at
+about four characters per token, without loading a tokenizer.
+"""
+
+import math
+
+CHARS_PER_TOKEN = 4
+
+
+def approximate_tokens(text: str) -> int:
+    "Token estimate of `text` (about four characters per token)."
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
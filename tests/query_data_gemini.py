@@ -1,11 +1,10 @@
 import argparse
-import os
 
 from langchain_community.vectorstores import Chroma
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import GoogleGenerativeAI
 
 import shared.config
+from shared.components import get_llm
 from shared.get_embedding_function import get_embedding_function
 
 CHROMA_PATH = "chroma"
@@ -47,9 +46,7 @@ def query_rag(query_text: str):
     prompt = prompt_template.format(context=context_text, question=query_text)
     # print(prompt)
 
-    model = GoogleGenerativeAI(
-        model="gemini-flash-latest", google_api_key=os.environ['GEMINI_API_KEY'])
-    response_text = model.invoke(prompt)
+    response_text = get_llm().invoke(prompt).text
 
     sources = [doc.metadata.get("source", None) for doc, _score in results]
     formatted_response = f"Response: {response_text}\nSources: {sources}"
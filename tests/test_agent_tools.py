@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.tools import tool
+
+from agent import agent_tools_helper
+from shared.components import registry
+from shared.fake_llm import FakeChatModel
+from shared.metrics import Counters
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(agent_tools_helper, "get_llm", lambda: FakeChatModel(latency=0))
+    monkeypatch.setattr(agent_tools_helper, "tool_path_counters", Counters(
+        *agent_tools_helper.tool_path_counters.as_dict()))
+    for name in ("agent", "tool_summarizer"):
+        registry.reset(name)
+    yield
+    for name in ("agent", "tool_summarizer"):
+        registry.reset(name)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What are Ana's stats and profile?", ["get_user_profile", "get_user_stats"]),
+    ("Who is Marco?", ["get_user_profile"]),
+    ("What has sarah been up to lately?", ["get_recent_activity"]),
+    ("Compare the followers of Ana and Sarah", None),
+    ("What is Ana's favourite colour?", None),
+    ("How many followers does the Hatter have?", None),
+])
+def test_plan_tool_calls(question, expected):
+    plan = agent_tools_helper.plan_tool_calls(question)
+    if expected is None:
+        assert plan is None
+    else:
+        assert sorted(call["name"] for call in plan.tool_calls) == expected
+        assert {call["args"]["user_id"] for call in plan.tool_calls} in (
+            {"user_001"}, {"user_002"}, {"user_004"}, {"user_005"})
+
+
+def test_tool_calls_of_one_turn_run_concurrently(monkeypatch):
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow(name):
+        @tool(name)
+        def slow_tool(user_id: str) -> str:
+            "Slow lookup."
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return f"{name}:{user_id}"
+        return slow_tool
+
+    monkeypatch.setattr(agent_tools_helper, "tools_by_name", {
+        name: slow(name) for name in agent_tools_helper.TOOL_INTENTS})
+    plan = agent_tools_helper.plan_tool_calls("Ana's profile, stats and recent activity")
+    results = agent_tools_helper.run_tool_calls(plan)
+    assert peak[0] == 3
+    assert [result.tool_call_id for result in results] == [
+        call["id"] for call in plan.tool_calls]
+    assert asyncio.run(agent_tools_helper.arun_tool_calls(plan))[0].text == \
+        "get_user_profile:user_001"
+
+
+def test_fast_path_makes_one_llm_call(fake_llm):
+    response = agent_tools_helper.call_model_with_tools({"input": "Show Ana's profile and stats"})
+    assert response["answer"].startswith("Based on the service data:")
+    assert "ana.muller@tech.com" in response["answer"]
+    assert [m.type for m in response["messages"]] == ["human", "ai", "tool", "tool", "ai"]
+
+    # Two users: the agent decides, with a tool-calling turn and an answering turn
+    asyncio.run(agent_tools_helper.acall_model_with_tools(
+        {"input": "What are the stats of Ana and Sarah?"}))
+    stats = agent_tools_helper.tool_path_stats()
+    assert (stats["fast_path"], stats["agent"]) == (1, 1)
+    assert stats["llm_calls"] == 3 and stats["tool_turns"] == 2
+    assert stats["llm_calls_per_query"] == 1.5
+
+
+def test_fast_path_can_be_disabled(fake_llm, monkeypatch):
+    monkeypatch.setattr(agent_tools_helper, "TOOL_FAST_PATH_ENABLED", False)
+    agent_tools_helper.call_model_with_tools({"input": "Show Ana's profile and stats"})
+    assert agent_tools_helper.tool_path_stats()["llm_calls"] == 2
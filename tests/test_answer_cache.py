@@ -0,0 +1,50 @@
+from langchain_core.embeddings import Embeddings
+
+from rag.answer_cache import AnswerCache
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    VOCABULARY = ["stark", "direwolves", "names", "children", "alice", "rabbit"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        words = text.lower().replace("?", "").replace("'s", "").split()
+        return [float(word in words) for word in self.VOCABULARY]
+
+
+def make_cache(generation=lambda: 1, **kwargs):
+    return AnswerCache(BagOfWordsEmbeddings(), generation, threshold=0.9, **kwargs)
+
+
+def test_exact_and_semantic_hits():
+    cache = make_cache()
+    cache.store("What are the names of the Stark children's direwolves?",
+                {"answer": "Ghost, Nymeria, ..."})
+
+    assert cache.lookup("what are the names of the stark children's direwolves")
+    assert cache.lookup("Names of the direwolves of the Stark children?")
+    assert cache.lookup("Who followed the rabbit, Alice?") is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_ttl_and_lru_eviction():
+    cache = make_cache(max_entries=1)
+    cache.store("stark direwolves", {"answer": "a"})
+    cache.store("alice rabbit", {"answer": "b"})
+    assert cache.lookup("stark direwolves") is None
+
+    expiring = make_cache(ttl_seconds=-1)
+    expiring.store("stark direwolves", {"answer": "a"})
+    assert expiring.lookup("stark direwolves") is None
+
+
+def test_reingest_invalidates_cache():
+    generation = [1]
+    cache = make_cache(lambda: generation[0])
+    cache.store("stark direwolves", {"answer": "a"})
+    generation[0] = 2
+    assert cache.lookup("stark direwolves") is None
+    assert cache.stats()["invalidations"] == 1
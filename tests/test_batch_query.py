@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_chroma import Chroma
+
+import batch_query
+from ingest.bm25_index import BM25Index
+from rag import rag_helper
+from rag.hybrid_retriever import HybridRetriever, similarity_search_many
+from shared.fake_embeddings import HashingEmbeddings
+from shared.query_router import RouteDecision, keyword_route
+
+CHUNKS = {
+    "c1": "Nymeria smashes Joff to the ground and mangles his arm.",
+    "c2": "Jon was feeding Ghost under the table when Benjen approaches.",
+    "c3": "The Mad Hatter and the March Hare were having tea under a tree.",
+}
+
+
+def test_similarity_search_many_matches_single_searches():
+    embeddings = HashingEmbeddings(size=64)
+    documents = [Document(text, id=id_) for id_, text in CHUNKS.items()]
+    vectors = embeddings.embed_queries(["Jon feeding Ghost", "Mad Hatter tea"])
+    for store in (InMemoryVectorStore(embeddings),
+                  Chroma(collection_name="batch-test", embedding_function=embeddings)):
+        store.add_documents(documents)
+        many = similarity_search_many(store, vectors, k=2)
+        assert [[d.id for d in docs] for docs in many] == [
+            [d.id for d in store.similarity_search_by_vector(vector, k=2)] for vector in vectors]
+        assert many[0][0].id == "c2" and many[1][0].id == "c3"
+
+
+def test_answer_questions_batches_retrieval(tmp_path, monkeypatch):
+    embeddings = HashingEmbeddings(size=64)
+    store = InMemoryVectorStore(embeddings)
+    store.add_documents([Document(text, id=id_) for id_, text in CHUNKS.items()])
+    index = BM25Index(str(tmp_path))
+    index.add(CHUNKS.items())
+    retriever = HybridRetriever(vector_store=store, lexical_index=index, k=1, fetch_k=3)
+
+    embedded = []
+    monkeypatch.setattr(batch_query, "get_embeddings", lambda: embeddings)
+    routed = []
+    monkeypatch.setattr(batch_query, "route_query", lambda question, vector: routed.append(
+        vector) or RouteDecision(keyword_route(question), "keyword"))
+    monkeypatch.setattr(embeddings, "embed_queries",
+                        lambda texts: embedded.append(texts) or embeddings.embed_documents(texts))
+    monkeypatch.setattr(rag_helper, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(rag_helper, "get_answer_chain", lambda: RunnableLambda(
+        lambda inputs: inputs["context"][0].page_content))
+
+    questions = ["Who feeds Ghost?", "Who mangles Joff's arm?", "Who has tea?", "Who is Ana?"]
+    monkeypatch.setattr(batch_query, "acall_model_with_tools",
+                        lambda state: asyncio.sleep(0, {"answer": "from the tools"}))
+    results = batch_query.answer_questions(questions, batch_size=2, concurrency=2)
+    assert [result["route"] for result in results] == ["rag", "rag", "rag", "tools"]
+    assert [result["answer"] for result in results] == [
+        CHUNKS["c2"], CHUNKS["c1"], CHUNKS["c3"], "from the tools"]
+    # One embedding call per chunk of questions, whose vectors are also used for routing
+    assert embedded == [questions[:2], questions[2:]]
+    assert len(routed) == 4 and all(len(vector) == 64 for vector in routed)
+
+
+def test_stopping_early_cancels_outstanding_work(monkeypatch):
+    cancelled = []
+
+    async def block(name):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    async def aprepare(items):
+        if items[0]["id"] >= 4:
+            await block("prepare")
+        return items
+
+    async def answer(item, semaphore, rate_limiter):
+        if item["id"] > 0:
+            await block(item["id"])
+        return item
+
+    monkeypatch.setattr(batch_query, "aprepare", aprepare)
+    monkeypatch.setattr(batch_query, "answer", answer)
+
+    async def first_result():
+        results = batch_query.aanswer_questions([{"id": i} for i in range(6)], batch_size=2)
+        first = await anext(results)
+        await results.aclose()
+        return first, list(cancelled)
+
+    first, cancelled_on_close = asyncio.run(first_result())
+    assert first == {"id": 0}
+    # The other answers in flight and the chunk being prepared are cancelled by the close
+    assert sorted(cancelled_on_close, key=str) == [1, 2, 3, "prepare"]
+
+
+def test_rate_limiter_spaces_calls():
+    async def starts():
+        limiter = batch_query.RateLimiter(rate=50)
+        times = []
+        for _ in range(4):
+            await limiter.wait()
+            times.append(time.perf_counter())
+        return times
+
+    times = asyncio.run(starts())
+    assert times[-1] - times[0] >= 3 / 50 * 0.9
+
+
+def test_resume_skips_answered_and_tolerates_cut_lines(tmp_path):
+    output = tmp_path / "answers.jsonl"
+    output.write_text(json.dumps({"id": "a", "answer": "x"}) + "\n"
+                      + json.dumps({"id": "b", "error": "Timeout"}) + "\n"
+                      + '{"id": "c", "ans', encoding="utf-8")
+    assert batch_query.answered_ids(str(output)) == {"a"}
+    assert batch_query.ends_mid_line(str(output))
+
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text('{"id": "a", "question": "q1"}\n\n{"question": "q2"}\n',
+                         encoding="utf-8")
+    assert batch_query.read_questions(str(questions)) == [
+        {"id": "a", "question": "q1"}, {"id": 3, "question": "q2"}]
@@ -0,0 +1,94 @@
+import hashlib
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from create_db import SPLITTER_SETTINGS, load_documents, splitter_fingerprint
+from ingest.chunking import StructuredSplitter, split_sections
+from ingest.loaders import HTMLMarkdownLoader
+from shared.tokens import approximate_tokens
+
+SENTENCE = "Alice wondered how far down the rabbit hole she had fallen by now. "
+MARKDOWN = (
+    "Preface text.\n\n"
+    "# Book\n\nIntro.\n\n"
+    "## Chapter One\n\n" + SENTENCE * 40 + "\n\n" + SENTENCE * 3 + "\n\n"
+    "## Chapter Two\n\nShort.\n\n"
+    "### Scene\n\nShorter.\n\n"
+    "# Appendix\n\nThe end.\n"
+)
+BOOK = (
+    "Contents\n\nCHAPTER I. Down the Rabbit-Hole\nCHAPTER II. The Pool of Tears\n\n"
+    "CHAPTER I.\nDown the Rabbit-Hole\n\nAlice was beginning to get very tired.\n\n"
+    "CHAPTER II.\nThe Pool of Tears\n\n“Curiouser and curiouser!” cried Alice.\n"
+)
+
+
+def chunk(text, **options):
+    return StructuredSplitter(**options).split_document(Document(text, metadata={"source": "s"}))
+
+
+def test_sections_follow_heading_levels():
+    paths = [section.path for section in split_sections(MARKDOWN)]
+    assert paths == [(), ("Book",), ("Book", "Chapter One"), ("Book", "Chapter Two"),
+                     ("Book", "Chapter Two", "Scene"), ("Appendix",)]
+    assert [section.path for section in split_sections("Title\n=====\n\nText.\n")] == [("Title",)]
+
+
+def test_chapter_lines_are_headings_but_contents_lines_are_not():
+    sections = split_sections(BOOK)
+    assert [section.path for section in sections] == [
+        (), ("CHAPTER I. Down the Rabbit-Hole",), ("CHAPTER II. The Pool of Tears",)]
+    assert BOOK[sections[1].start:].startswith("CHAPTER I.\nDown")
+
+
+def test_chunks_are_sized_verbatim_and_keep_to_sections():
+    chunks = chunk(MARKDOWN, chunk_tokens=100, overlap_tokens=20)
+    for document in chunks:
+        start = document.metadata["start_index"]
+        assert MARKDOWN[start:start + len(document.page_content)] == document.page_content
+        assert approximate_tokens(document.page_content) <= 100
+
+    chapter = [d for d in chunks if d.metadata.get("section") == "Book > Chapter One"]
+    assert len(chapter) > 1 and "Chapter Two" not in "".join(d.page_content for d in chapter)
+    # The chapter's last paragraph starts a chunk, without overlap
+    assert chapter[-1].page_content == (SENTENCE * 3).strip()
+    # Mid-paragraph cuts repeat the last sentence of the previous chunk
+    assert chapter[1].page_content.startswith(chapter[0].page_content[-len(SENTENCE) + 1:])
+
+    # Small consecutive sections share one chunk, labelled with the first
+    tail = chunks[-1]
+    assert tail.page_content.startswith("## Chapter Two") and tail.page_content.endswith("The end.")
+    assert tail.metadata["section"] == "Book > Chapter Two"
+    assert chunks[0].page_content.startswith("Preface") and "section" not in chunks[0].metadata
+
+
+def test_long_sentences_are_cut_at_words():
+    chunks = chunk("word " * 500, chunk_tokens=50, overlap_tokens=0)
+    assert len(chunks) > 1 and all(approximate_tokens(d.page_content) <= 50 for d in chunks)
+    assert " ".join(d.page_content for d in chunks).split() == ["word"] * 500
+    with pytest.raises(ValueError):
+        StructuredSplitter(chunk_tokens=10, overlap_tokens=10)
+
+
+def test_html_is_loaded_as_markdown(tmp_path):
+    path = tmp_path / "book.html"
+    path.write_text("<html><head><title>T</title><style>p {}</style></head><body>"
+                    "<h1>A Game of Thrones</h1><h2>Bran (I)</h2><p>Bran <i>sees</i>\n the"
+                    " execution.</p><ul><li>Summer</li></ul><script>x()</script></body></html>")
+    [document] = HTMLMarkdownLoader(str(path)).load()
+    assert document.page_content == (
+        "# A Game of Thrones\n\n## Bran (I)\n\nBran sees the execution.\n\n- Summer")
+    assert [d.metadata["section"] for d in chunk(document.page_content)] == [
+        "A Game of Thrones > Bran (I)"]
+
+
+def test_fingerprint_per_chunker(tmp_path):
+    recursive = hashlib.sha256(json.dumps(SPLITTER_SETTINGS, sort_keys=True).encode()).hexdigest()
+    assert splitter_fingerprint("recursive") == recursive
+    assert splitter_fingerprint("structured") != recursive
+
+    (tmp_path / "notes.md").write_text("# Notes\n\nKept *as is*.\n")
+    [document] = load_documents([str(tmp_path / "notes.md")], workers=1, chunker="structured")
+    assert document.page_content == "# Notes\n\nKept *as is*.\n"
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from shared.components import ComponentRegistry
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_components_are_built_once_on_first_use():
+    registry = ComponentRegistry()
+    calls = []
+
+    def slow_factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry.register("thing", slow_factory)
+    assert not registry.is_built("thing")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("thing")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert "thing" in registry.build_seconds
+
+    registry.reset("thing")
+    assert registry.get("thing") is not results[0]
+    assert len(calls) == 2
+
+
+def test_prewarm_in_background():
+    registry = ComponentRegistry()
+    registry.register("a", lambda: "a")
+    registry.register("b", lambda: registry.get("a") + "b")
+
+    thread = registry.prewarm(["b"], background=True)
+    thread.join()
+    assert registry.is_built("a") and registry.get("b") == "ab"
+    assert registry.prewarm(["a"]) is None
+
+
+def test_tools_path_never_loads_vector_store():
+    # Run in a fresh interpreter so nothing is imported yet
+    script = (
+        "import sys, langchain_helper\n"
+        "langchain_helper.execute_user_query({'input': \"What are Ana's stats?\"}, 't')\n"
+        "print(sorted(m for m in ('chromadb', 'langchain_chroma', 'gpt4all',\n"
+        "             'langchain_google_genai') if m in sys.modules))\n"
+    )
+    env = {**os.environ, "LLM_PROVIDER": "fake", "FAKE_LLM_LATENCY_MS": "0"}
+    result = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,55 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from rag.context_assembly import (ContextAssembler, approximate_tokens,
+                                  merge_adjacent)
+
+TEXT = " ".join(f"Sentence {i} tells part {i} of the story of the Stark direwolves."
+                for i in range(60))
+
+
+def split(text=TEXT, source="got.html"):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=100,
+                                              add_start_index=True)
+    return splitter.split_documents([Document(text, metadata={"source": source})])
+
+
+def test_merge_adjacent_rebuilds_source_text():
+    chunks = split()
+    # Retrieved out of order, with a gap between chunks 4 and 8
+    retrieved = [chunks[3], chunks[1], chunks[2], chunks[8]]
+    merged = merge_adjacent(retrieved)
+
+    assert [rank for rank, _ in merged] == [0, 3]
+    document = merged[0][1]
+    start = chunks[1].metadata["start_index"]
+    assert document.page_content == TEXT[start:start + len(document.page_content)]
+    assert document.metadata["merged_chunks"] == 3
+    assert merged[1][1] is chunks[8]
+
+
+def test_merge_keeps_sources_apart_and_handles_containment():
+    got, other = split(), split(source="other.html")
+    contained = Document(got[1].page_content[10:60], metadata={
+        "source": "got.html", "start_index": got[1].metadata["start_index"] + 10})
+    merged = merge_adjacent([got[1], other[2], contained])
+    assert [d.page_content for _, d in merged] == [got[1].page_content, other[2].page_content]
+
+
+def test_assembler_drops_duplicates_and_fits_budget():
+    chunks = split()
+    copy = Document(chunks[20].page_content, metadata={"source": "copy.md"})
+    assembler = ContextAssembler(token_budget=120, duplicate_threshold=0.8)
+    context = assembler([chunks[20], copy, chunks[21], chunks[30], chunks[35]])
+
+    assert sum(approximate_tokens(d.page_content) for d in context) <= 120
+    assert context[0].page_content.startswith(chunks[20].page_content)
+    assert all(d.metadata.get("source") != "copy.md" for d in context)
+
+    stats = assembler.stats()
+    assert stats["duplicates"] == 1 and stats["merged"] == 1
+    assert stats["tokens_out"] < stats["tokens_in"]
+
+    truncated = ContextAssembler(token_budget=60)([chunks[20], chunks[21]])
+    assert len(truncated) == 1 and truncated[0].metadata["truncated"]
+    assert approximate_tokens(truncated[0].page_content) <= 60
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph import START, StateGraph
+from typing_extensions import Annotated, TypedDict
+
+from shared.conversation_memory import (BoundedMemorySaver, bounded_add_messages,
+                                        create_sqlite_saver, trim_history)
+
+
+class State(TypedDict):
+    input: str
+    chat_history: Annotated[Sequence[BaseMessage], bounded_add_messages]
+
+
+def echo(state: State):
+    return {"chat_history": [HumanMessage(state["input"]), AIMessage(state["input"])]}
+
+
+def build_app(checkpointer):
+    workflow = StateGraph(state_schema=State)
+    workflow.add_edge(START, "model")
+    workflow.add_node("model", echo)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def config(thread_id):
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def turns(n):
+    return [m for i in range(n) for m in (HumanMessage(f"q{i}"), AIMessage(f"a{i}"))]
+
+
+def test_trim_history_by_messages_and_tokens():
+    history = turns(5)
+    assert trim_history(history, max_messages=4, max_tokens=0) == history[-4:]
+    # An odd cap would split a turn; the leading answer is dropped.
+    assert trim_history(history, max_messages=3, max_tokens=0) == history[-2:]
+    assert trim_history(history, max_messages=0, max_tokens=0) == history
+
+    long_turn = [HumanMessage("word " * 400), AIMessage("ok")]
+    assert trim_history(history + long_turn, max_messages=0, max_tokens=200) == []
+    assert trim_history(long_turn + history, max_messages=0, max_tokens=200) == history
+
+
+def test_memory_saver_keeps_latest_checkpoint_and_evicts_sessions():
+    saver = BoundedMemorySaver(idle_seconds=3600, max_sessions=3, evict_every=1)
+    app = build_app(saver)
+
+    app.invoke({"input": "q0"}, config("a"))
+    blobs_per_thread = len(saver.blobs)
+    for i in range(1, 4):
+        app.invoke({"input": f"q{i}"}, config("a"))
+    assert len(list(app.get_state_history(config("a")))) == 1
+    assert len(app.get_state(config("a")).values["chat_history"]) == 8
+    assert len(saver.blobs) == blobs_per_thread
+
+    for thread_id in "bcd":
+        app.invoke({"input": "hi"}, config(thread_id))
+    assert "a" not in saver.storage
+    assert set(saver.last_seen) == {"b", "c", "d"}
+    assert saver.evictions == 1
+
+    saver.idle_seconds = 0
+    assert saver.evict_idle() == 3
+    assert not saver.storage and not saver.blobs and not saver.writes
+
+
+def test_sessions_are_evicted_every_n_checkpoints():
+    saver = BoundedMemorySaver(idle_seconds=3600, max_sessions=1, evict_every=10)
+    app = build_app(saver)
+    for thread_id in "abc":
+        app.invoke({"input": "hi"}, config(thread_id))
+    # Each run saves three checkpoints, so no eviction pass has run yet
+    assert set(saver.storage) == {"a", "b", "c"} and saver.evictions == 0
+
+    # A thread touched again is no longer among the least recently used ones
+    app.get_state(config("a"))
+    app.invoke({"input": "hi"}, config("a"))
+    assert set(saver.storage) == set(saver.last_seen) == {"a"} and saver.evictions == 2
+
+
+def test_sqlite_saver_persists_and_supports_async(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    app = build_app(create_sqlite_saver(path, idle_seconds=3600, max_sessions=10))
+    app.invoke({"input": "q0"}, config("a"))
+    asyncio.run(app.ainvoke({"input": "q1"}, config("a")))
+
+    saver = create_sqlite_saver(path, idle_seconds=3600, max_sessions=10)
+    reopened = build_app(saver)
+    history = reopened.get_state(config("a")).values["chat_history"]
+    assert [m.text for m in history] == ["q0", "q0", "q1", "q1"]
+    assert saver.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone() == (1,)
+    assert "a" in saver.last_seen
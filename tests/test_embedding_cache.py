@@ -0,0 +1,63 @@
+from langchain_core.embeddings import Embeddings
+
+from shared.embedding_cache import CachedEmbeddings
+from shared.instrumentation import trace_request
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return [float(len(text)), 1.5]
+
+
+def test_repeated_texts_are_embedded_once(tmp_path):
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings("fake", lambda: model, str(tmp_path / "cache.sqlite3"))
+
+    assert cache.embed_documents(["ab", "abc"]) == [[2.0, 0.5], [3.0, 0.5]]
+    assert cache.embed_documents(["abc", "abcd"]) == [[3.0, 0.5], [4.0, 0.5]]
+    assert cache.embed_query("ab") == [2.0, 1.5]
+    assert model.texts == ["ab", "abc", "abcd", "ab"]
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_duplicate_texts_are_counted_per_position(tmp_path):
+    model = CountingEmbeddings()
+    cache = CachedEmbeddings("fake", lambda: model, str(tmp_path / "cache.sqlite3"))
+
+    with trace_request(enabled=True) as trace:
+        cache.embed_documents(["a", "a"])
+        cache.embed_documents(["a", "b", "b"])
+    assert model.texts == ["a", "b"]
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 0, 4)
+    # The request trace (and the Prometheus counters fed from it) agree with stats()
+    assert trace.counts["embedding_cache_hits"] == 1
+    assert trace.counts["embedding_cache_misses"] == 4
+
+
+def test_vectors_persist_and_model_is_not_loaded_on_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    CachedEmbeddings("fake", CountingEmbeddings, path).embed_documents(["ab"])
+
+    def fail():
+        raise AssertionError("model should not be loaded")
+
+    reopened = CachedEmbeddings("fake", fail, path)
+    assert reopened.embed_documents(["ab"]) == [[2.0, 0.5]]
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_memory_layer_is_bounded(tmp_path):
+    # Two float32 values take 8 bytes, so only two vectors fit in 16 bytes.
+    cache = CachedEmbeddings("fake", CountingEmbeddings,
+                             str(tmp_path / "cache.sqlite3"), memory_bytes=16)
+    cache.embed_documents(["a", "bb", "ccc"])
+    assert cache.stats()["memory_bytes"] == 16
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from shared import get_embedding_function as embedding_module
+from shared.embedding_service import EmbeddingService
+from shared.fake_embeddings import HashingEmbeddings
+
+QUESTIONS = [f"Question number {i} about the direwolves" for i in range(16)]
+
+
+class CountingModel(HashingEmbeddings):
+    "Records the size of every call and takes `delay` seconds per call."
+
+    def __init__(self, delay: float = 0.0):
+        super().__init__(size=32)
+        self.delay = delay
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(len(texts))
+        time.sleep(self.delay)
+        if "fail" in texts:
+            raise RuntimeError("model error")
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_share_batches():
+    model = CountingModel(delay=0.02)
+    service = EmbeddingService(lambda: model, max_batch_size=8, max_wait_ms=50)
+    start = threading.Barrier(len(QUESTIONS))
+
+    def query(text):
+        start.wait()
+        return service.embed_query(text)
+
+    with ThreadPoolExecutor(len(QUESTIONS)) as pool:
+        vectors = list(pool.map(query, QUESTIONS))
+
+    # Every caller gets the vector of its own text
+    assert vectors == HashingEmbeddings(size=32).embed_documents(QUESTIONS)
+    assert sum(model.calls) == 16 and max(model.calls) <= 8 and len(model.calls) < 16
+    stats = service.stats()
+    assert stats["requests"] == 16 and stats["batches"] == len(model.calls)
+    assert stats["mean_batch_size"] > 1
+
+
+def test_full_batches_do_not_wait():
+    model = CountingModel()
+    service = EmbeddingService(lambda: model, max_batch_size=4, max_wait_ms=5000)
+    start = time.perf_counter()
+    assert len(service.embed_documents(QUESTIONS[:4])) == 4
+    assert service.embed_documents([]) == []
+    assert time.perf_counter() - start < 1 and model.calls == [4]
+
+
+def test_batches_never_exceed_the_size_limit():
+    model = CountingModel()
+    service = EmbeddingService(lambda: model, max_batch_size=4, max_wait_ms=200)
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(service.embed_documents, QUESTIONS[:3])
+        time.sleep(0.05)
+        # Does not fit with the first request, so it closes that batch and starts the next
+        second = pool.submit(service.embed_documents, QUESTIONS[3:6])
+        assert first.result() + second.result() == HashingEmbeddings(size=32).embed_documents(
+            QUESTIONS[:6])
+    assert model.calls[0] == 3 and sum(model.calls) == 6 and max(model.calls) <= 4
+
+    # A request larger than a batch is embedded in slices
+    model.calls.clear()
+    assert len(service.embed_documents(QUESTIONS[:10])) == 10
+    assert model.calls == [4, 4, 2]
+
+
+def test_errors_reach_the_callers_of_the_batch():
+    service = EmbeddingService(lambda: CountingModel(), max_wait_ms=0)
+    with pytest.raises(RuntimeError, match="model error"):
+        service.embed_documents(["fine", "fail"])
+    assert len(service.embed_query("still working")) == 32
+
+    # A model that fails to load fails its batch; the next batch loads it again
+    loads = iter([lambda: 1 / 0, CountingModel])
+    flaky = EmbeddingService(lambda: next(loads)(), max_wait_ms=0)
+    with pytest.raises(ZeroDivisionError):
+        flaky.embed_query("no model yet")
+    assert len(flaky.embed_query("model loaded")) == 32
+
+
+def test_async_callers_are_batched():
+    model = CountingModel(delay=0.01)
+    service = EmbeddingService(lambda: model, max_batch_size=16, max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(*(service.aembed_query(text) for text in QUESTIONS))
+
+    assert asyncio.run(main()) == HashingEmbeddings(size=32).embed_documents(QUESTIONS)
+    assert model.calls == [16]
+
+
+def test_gpt4all_is_batched_through_its_client(monkeypatch):
+    class Client:
+        def embed(self, texts):
+            assert isinstance(texts, list)
+            return [[float(len(text))] for text in texts]
+
+    class Model:
+        client = Client()
+
+    assert embedding_module.embed_gpt4all_batch(Model(), ["a", "bcd"]) == [[1.0], [3.0]]
+
+    # The model itself is only loaded by the first embedding call
+    monkeypatch.setattr(embedding_module, "EMBEDDING_PROVIDER", "gpt4all")
+    service = embedding_module.get_embedding_function(cached=False, batched=True)
+    assert isinstance(service, EmbeddingService)
+    assert service._infer is embedding_module.embed_gpt4all_batch
@@ -0,0 +1,60 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from ingest.bm25_index import BM25Index, tokenize
+from rag.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+
+CHUNKS = {
+    "c1": "Nymeria smashes Joff to the ground and mangles his arm.",
+    "c2": "Cersei decrees that Lady be killed since Nymeria has not been found.",
+    "c3": "Jon was feeding Ghost under the table when Benjen approaches.",
+    "c4": "The Mad Hatter and the March Hare were having tea under a tree.",
+}
+
+
+def test_tokenize():
+    assert tokenize("Where is Arya's wolf, Nymeria?") == ["arya", "wolf", "nymeria"]
+
+
+def test_bm25_search_add_remove_and_persist(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(CHUNKS.items())
+    assert len(index) == 4
+
+    ids = [id_ for id_, _ in index.search("Nymeria Joff", k=10)]
+    assert ids == ["c1", "c2"]
+    assert index.search("the and of") == []
+
+    index.remove(["c1"])
+    index.add([("c3", "Ghost is Jon's direwolf.")])
+    index.commit()
+
+    reopened = BM25Index(str(tmp_path))
+    assert len(reopened) == 3
+    assert [id_ for id_, _ in reopened.search("Nymeria")] == ["c2"]
+    assert [id_ for id_, _ in reopened.search("direwolf")] == ["c3"]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]])
+    # "c" is in both lists, so it beats the top of either list alone.
+    assert fused[0] == "c"
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_hybrid_retriever_adds_keyword_hits(tmp_path):
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=16))
+    store.add_documents([Document(text, id=id_) for id_, text in CHUNKS.items()])
+    index = BM25Index(str(tmp_path))
+    index.add(CHUNKS.items())
+
+    retriever = HybridRetriever(vector_store=store, lexical_index=index, k=4, fetch_k=4)
+    documents = retriever.invoke("Ghost")
+    assert documents[0].id == "c3"
+    assert len(documents) == 4
+
+    retriever.k = 1
+    assert [d.id for d in asyncio.run(retriever.ainvoke("Ghost"))] == ["c3"]
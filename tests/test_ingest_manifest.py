@@ -0,0 +1,38 @@
+from langchain_core.documents import Document
+
+from ingest.manifest import IngestManifest, assign_chunk_ids
+
+
+def chunk(text: str, source: str = "books/a.md", start_index: int = 0):
+    return Document(page_content=text,
+                    metadata={"source": source, "start_index": start_index})
+
+
+def test_chunk_ids_do_not_depend_on_position():
+    before = assign_chunk_ids([chunk("one", start_index=0),
+                               chunk("two", start_index=10)])
+    after = assign_chunk_ids([chunk("new", start_index=0),
+                              chunk("one", start_index=5),
+                              chunk("two", start_index=15)])
+    assert after[1:] == before
+
+
+def test_identical_chunks_get_distinct_ids():
+    ids = assign_chunk_ids([chunk("same"), chunk("same"),
+                            chunk("same", source="books/b.md")])
+    assert len(set(ids)) == 3
+
+
+def test_manifest_round_trip_and_fingerprint_change(tmp_path):
+    manifest = IngestManifest.load(str(tmp_path), "settings-v1")
+    assert manifest.is_changed("books/a.md", "abc")
+    manifest.set_file("books/a.md", "abc", {"id-1": 0})
+    manifest.save()
+
+    reloaded = IngestManifest.load(str(tmp_path), "settings-v1")
+    assert reloaded.generation == manifest.generation > 0
+    assert not reloaded.is_changed("books/a.md", "abc")
+
+    rechunked = IngestManifest.load(str(tmp_path), "settings-v2")
+    assert rechunked.is_changed("books/a.md", "abc")
+    assert rechunked.chunks("books/a.md") == {"id-1": 0}
@@ -0,0 +1,48 @@
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from ingest.chroma_writes import update_metadatas
+from ingest.pipeline import iter_batches, prefetch, write_batch
+
+
+def test_iter_batches_is_lazy_and_keeps_remainder():
+    consumed = []
+
+    def numbers():
+        for i in range(5):
+            consumed.append(i)
+            yield i
+
+    batches = iter_batches(numbers(), 2)
+    assert next(batches) == [0, 1]
+    assert consumed == [0, 1]
+    assert list(batches) == [[2, 3], [4]]
+
+
+def test_prefetch_preserves_order_and_reraises():
+    assert list(prefetch(iter(range(100)), maxsize=3)) == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError("parse failed")
+
+    stream = prefetch(failing(), maxsize=1)
+    assert next(stream) == 1
+    with pytest.raises(ValueError):
+        next(stream)
+
+
+def test_writes_keep_precomputed_vectors(tmp_path):
+    # No embedding function: nothing may be embedded again
+    db = Chroma(persist_directory=str(tmp_path))
+    batch = [("a", Document("alpha", metadata={"start_index": 0})),
+             ("b", Document("beta", metadata={"start_index": 5}))]
+    write_batch(db, batch, [[1.0, 0.0], [0.0, 1.0]])
+    update_metadatas(db, ["b"], [{"start_index": 9}])
+
+    stored = db.get(ids=["a", "b"], include=["documents", "metadatas", "embeddings"])
+    rows = dict(zip(stored["ids"], zip(stored["documents"], stored["metadatas"],
+                                       stored["embeddings"].tolist())))
+    assert rows == {"a": ("alpha", {"start_index": 0}, [1.0, 0.0]),
+                    "b": ("beta", {"start_index": 9}, [0.0, 1.0])}
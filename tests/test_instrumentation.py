@@ -0,0 +1,105 @@
+import asyncio
+import urllib.request
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from shared import instrumentation
+from shared.fake_llm import FakeChatModel
+from shared.instrumentation import (PrometheusExporter, RingBufferExporter, count,
+                                    span, trace_request)
+
+
+@pytest.fixture
+def ring(monkeypatch):
+    ring = RingBufferExporter(capacity=2)
+    monkeypatch.setattr(instrumentation, "exporters", [ring])
+    return ring
+
+
+def test_disabled_tracing_is_a_no_op(ring):
+    with trace_request("t", enabled=False) as trace:
+        assert trace is None
+        assert span("stage") is span("other")
+        count("hits")
+    assert ring.recent() == []
+
+
+def test_trace_records_spans_counts_and_llm_usage(ring):
+    llm = FakeChatModel(latency=0).with_config(tags=["stage:answer"])
+    with trace_request("t", enabled=True) as trace:
+        with span("routing", route="rag"):
+            pass
+        count("answer_cache_misses")
+        llm.invoke([HumanMessage("Who is Nymeria?")],
+                   config={"callbacks": instrumentation.callbacks()})
+
+    [record] = ring.recent()
+    assert record["thread_id"] == "t"
+    assert [s["name"] for s in record["spans"]] == ["routing", "answer"]
+    assert record["spans"][0]["route"] == "rag"
+    assert record["counts"] == {"answer_cache_misses": 1, "answer_calls": 1,
+                                "input_tokens": 3, "output_tokens": 6}
+    assert instrumentation.current_trace() is None
+
+
+def test_trace_follows_async_tasks_and_threads(ring):
+    async def task():
+        await asyncio.sleep(0)
+        count("task")
+
+    async def query():
+        with trace_request("t", enabled=True):
+            await asyncio.gather(asyncio.to_thread(count, "threaded"),
+                                 asyncio.create_task(task()))
+
+    asyncio.run(query())
+    assert ring.recent()[0]["counts"] == {"threaded": 1, "task": 1}
+
+
+def test_errors_are_recorded_and_exporter_failures_are_contained(ring):
+    class Broken:
+        def export(self, trace):
+            raise RuntimeError("exporter down")
+
+    instrumentation.exporters.insert(0, Broken())
+    with pytest.raises(KeyError):
+        with trace_request("t", enabled=True):
+            raise KeyError("boom")
+    assert ring.recent()[0]["error"] == "KeyError"
+
+
+def test_ring_buffer_keeps_latest_traces(ring):
+    for thread_id in "abc":
+        with trace_request(thread_id, enabled=True):
+            pass
+    assert [record["thread_id"] for record in ring.recent()] == ["b", "c"]
+    assert [record["thread_id"] for record in ring.recent(1)] == ["c"]
+
+
+def test_prometheus_text(monkeypatch):
+    prometheus = PrometheusExporter(buckets=(0.5, 1))
+    monkeypatch.setattr(instrumentation, "exporters", [prometheus])
+    with trace_request("t", enabled=True) as trace:
+        instrumentation.annotate(route="tools")
+        trace.add_span("agent_llm", 0.0, 0.75)
+        count("tool_calls", 2)
+
+    text = prometheus.render()
+    assert 'rag_requests_total{route="tools",status="ok"} 1' in text
+    assert 'rag_stage_duration_seconds_bucket{stage="agent_llm",le="0.5"} 0' in text
+    assert 'rag_stage_duration_seconds_bucket{stage="agent_llm",le="1"} 1' in text
+    assert 'rag_stage_duration_seconds_count{stage="agent_llm"} 1' in text
+    assert 'rag_events_total{event="tool_calls"} 2' in text
+
+
+def test_metrics_endpoint_is_local_by_default():
+    server = instrumentation.serve_metrics(port=0)
+    try:
+        assert server.server_address[0] == "127.0.0.1"
+        direct = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        with direct.open(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            assert response.status == 200
+    finally:
+        server.shutdown()
+        server.server_close()
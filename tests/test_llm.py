@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from shared import llm
+from shared.fake_llm import FakeChatModel, FakeRateLimitError
+from shared.llm import (ConcurrencyLimiter, LLMGateway, TokenBucket, is_retryable,
+                        retry_delay)
+
+
+def test_limiter_caps_concurrent_async_calls():
+    limiter = ConcurrencyLimiter(3)
+    active = peak = 0
+
+    async def call():
+        nonlocal active, peak
+        async with limiter.ahold():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(10)))
+
+    asyncio.run(run())
+    # A second event loop gets its own semaphore.
+    asyncio.run(run())
+    assert peak == 3
+
+
+def test_fake_model_answers_and_calls_tools():
+    @tool
+    def get_user_stats(user_id: str) -> str:
+        "Stats for a user."
+        return f"{user_id}: 3 runs"
+
+    model = FakeChatModel(latency=0)
+    assert model.invoke("Who is the Hatter?").text == "Fake answer to: Who is the Hatter?"
+
+    bound = model.bind_tools([get_user_stats])
+    question = HumanMessage("What are Ana's stats?")
+    call = bound.invoke([question])
+    assert call.tool_calls[0]["name"] == "get_user_stats"
+    assert call.tool_calls[0]["args"] == {"user_id": "Ana"}
+
+    result = ToolMessage("Ana: 3 runs", tool_call_id=call.tool_calls[0]["id"])
+    answer = bound.invoke([question, call, result])
+    assert answer.text == "Based on the service data: Ana: 3 runs"
+
+
+def test_fake_model_streams_words():
+    model = FakeChatModel(latency=0)
+    chunks = [chunk.text for chunk in model.stream("Who is the Hatter?")]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "Fake answer to: Who is the Hatter?"
+
+
+def test_token_bucket_spaces_reservations():
+    bucket = TokenBucket(per_minute=600)  # 10 a second, bursts of 600
+    assert bucket.reserve(600) == 0
+    assert bucket.reserve(5) == pytest.approx(0.5, abs=0.01)
+    assert not bucket.try_take(1)
+    bucket.adjust(-10)
+    assert bucket.try_take(4)
+    assert TokenBucket(0).reserve(10**9) == 0
+
+
+def test_retryable_errors():
+    class StatusError(Exception):
+        def __init__(self, code):
+            super().__init__(f"error {code}")
+            self.code = code
+
+    assert is_retryable(FakeRateLimitError("slow down"))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(StatusError(400))
+    wrapped = RuntimeError("Error calling model (RESOURCE_EXHAUSTED): quota")
+    wrapped.__cause__ = StatusError(429)
+    assert is_retryable(wrapped)
+    # A status code decides over numbers in the message
+    over_limit = StatusError(400)
+    over_limit.args = ("prompt over 500 tokens",)
+    assert not is_retryable(over_limit)
+    assert retry_delay(0, RuntimeError("429 [retry_delay { seconds: 7 }]")) == 7
+
+
+def test_gateway_retries_then_gives_up(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_RETRY_BASE_MS", 1)
+    gateway = LLMGateway(max_retries=2)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise FakeRateLimitError("429")
+        return "ok"
+
+    assert gateway.call(flaky, "prompt") == "ok"
+    assert gateway.counters.as_dict()["retries"] == 2
+
+    with pytest.raises(ValueError):
+        gateway.call(lambda: (_ for _ in ()).throw(ValueError("bad request")), "prompt")
+    assert gateway.counters.as_dict()["retries"] == 2
+
+    model = type("Model", (llm.GatewayMixin, FakeChatModel), {})(latency=0, error_rate=1.0)
+    monkeypatch.setattr(llm, "llm_gateway", gateway)
+    with pytest.raises(FakeRateLimitError):
+        model.invoke("Who is the Hatter?")
+    assert gateway.counters.as_dict()["retries"] == 4
+
+
+def test_gateway_hedges_slow_calls():
+    gateway = LLMGateway(hedge_after=0.02)
+    durations = iter([1.0, 0.0])
+
+    def sync_call():
+        time.sleep(next(durations))
+        return "answer"
+
+    start = time.perf_counter()
+    assert gateway.call(sync_call, "prompt") == "answer"
+    assert time.perf_counter() - start < 0.5
+
+    async def async_call(delays=iter([1.0, 0.0])):
+        await asyncio.sleep(next(delays))
+        return "answer"
+
+    start = time.perf_counter()
+    assert asyncio.run(gateway.acall(async_call, "prompt")) == "answer"
+    assert time.perf_counter() - start < 0.5
+    counters = gateway.counters.as_dict()
+    assert counters["hedges"] == counters["hedge_wins"] == 2
+
+
+def test_gateway_streams_retry_only_before_the_first_chunk(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_RETRY_BASE_MS", 1)
+    gateway = LLMGateway(max_retries=3)
+    attempts = []
+
+    def stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise FakeRateLimitError("429")
+        yield "first"
+        raise FakeRateLimitError("429")
+
+    chunks = []
+    with pytest.raises(FakeRateLimitError):
+        for chunk in gateway.stream(stream, "prompt"):
+            chunks.append(chunk)
+    assert chunks == ["first"] and len(attempts) == 2
+
+
+def test_gemini_clients_share_the_pool_size(monkeypatch):
+    pytest.importorskip("langchain_google_genai")
+    monkeypatch.setattr(llm, "LLM_PROVIDER", "gemini")
+    monkeypatch.setattr(llm, "LLM_POOL_CONNECTIONS", 5)
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    api_client = llm.create_llm().client._api_client
+
+    # Async calls go through httpx with the configured pool, not an unbounded aiohttp session
+    assert not api_client._use_aiohttp()
+    for client in (api_client._httpx_client, api_client._async_httpx_client):
+        transport = client._transport
+        assert transport._sync._pool._max_connections == 5
+        assert transport._async._pool._max_connections == 5
+
+
+def charged(bucket: TokenBucket) -> float:
+    "Units taken from a bucket that started full (refill over a test's milliseconds is negligible)."
+    return bucket.capacity - bucket._balance
+
+
+def test_streams_charge_the_reported_usage_once(monkeypatch):
+    monkeypatch.setattr(llm, "llm_gateway", LLMGateway(tpm=600))
+    model = type("Model", (llm.GatewayMixin, FakeChatModel), {})(latency=0, token_latency=0)
+
+    chunks = list(model.stream("Who is the Hatter at the Mad Tea Party?"))
+    usage = [chunk.usage_metadata["total_tokens"] for chunk in chunks if chunk.usage_metadata]
+    # Every word chunk reports its own share of the usage, like Gemini's
+    assert len(usage) > 1
+    total = sum(usage)
+    assert abs(charged(llm.llm_gateway.tokens) - total) < 0.5
+
+    async def astream():
+        return [chunk async for chunk in model.astream("Who is the Hatter at the Mad Tea Party?")]
+
+    assert len(asyncio.run(astream())) == len(chunks)
+    assert abs(charged(llm.llm_gateway.tokens) - 2 * total) < 0.5
+
+
+def test_failed_attempts_are_refunded_before_retrying(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_RETRY_BASE_MS", 1)
+    gateway = LLMGateway(rpm=60, tpm=600, max_retries=3)
+    prompt = "x" * 400  # estimated at 101 tokens
+    failures = iter([True, True, False])
+
+    def flaky():
+        if next(failures):
+            raise FakeRateLimitError("429")
+        return "ok"
+
+    assert gateway.call(flaky, prompt) == "ok"
+    assert round(charged(gateway.requests)) == 1 and round(charged(gateway.tokens)) == 101
+
+    async def aflaky(failures=iter([True, False])):
+        if next(failures):
+            raise FakeRateLimitError("429")
+        return "ok"
+
+    assert asyncio.run(gateway.acall(aflaky, prompt)) == "ok"
+    assert round(charged(gateway.requests)) == 2 and round(charged(gateway.tokens)) == 202
+
+    attempts = []
+
+    def stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise FakeRateLimitError("429")
+        yield "chunk"
+
+    assert list(gateway.stream(stream, prompt)) == ["chunk"]
+    assert round(charged(gateway.requests)) == 3 and round(charged(gateway.tokens)) == 303
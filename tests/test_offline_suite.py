@@ -0,0 +1,34 @@
+import math
+
+from benchmarks.offline_suite import flatten, retrieval_metrics
+from shared.fake_embeddings import HashingEmbeddings
+
+
+def cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_hashing_embeddings_are_deterministic_and_lexical():
+    embeddings = HashingEmbeddings(size=64)
+    query = embeddings.embed_query("Which direwolf belongs to Bran?")
+    assert query == HashingEmbeddings(size=64).embed_query("Which direwolf belongs to Bran?")
+    assert len(query) == 64
+    assert math.isclose(cosine(query, query), 1.0)
+
+    related, unrelated = embeddings.embed_documents(
+        ["Summer is Bran's direwolf.", "The Hatter poured tea for the Dormouse."])
+    assert cosine(query, related) > cosine(query, unrelated)
+
+
+def test_retrieval_metrics():
+    metrics = retrieval_metrics([1, 3, None, 2], ks=[1, 2, 4])
+    assert metrics["recall@1"] == 0.25
+    assert metrics["recall@2"] == 0.5
+    assert metrics["recall@4"] == 0.75
+    assert math.isclose(metrics["mrr"], (1 + 1 / 3 + 1 / 2) / 4)
+
+
+def test_flatten_keeps_numeric_leaves():
+    results = {"meta": {"commit": "abc", "repeat": 3, "context_assembly": True},
+               "latency": {"graph": {"p50_ms": 1.5}}}
+    assert flatten(results) == {"meta.repeat": 3, "latency.graph.p50_ms": 1.5}
@@ -0,0 +1,46 @@
+from shared.fake_embeddings import HashingEmbeddings
+from shared.query_router import NameMatcher, QueryRouter, keyword_route
+
+
+def test_name_matcher_finds_whole_words_case_insensitively():
+    matcher = NameMatcher({"Ana": "u1", "ana": "u1", "Anna": "u2", "Nan": "u3",
+                           "Marco": "u5"})
+    assert matcher.user_ids("What is Ana's profile?") == ["u1"]
+    assert matcher.user_ids("anna and NAN met marco, then ana") == ["u2", "u3", "u5", "u1"]
+    assert matcher.find("a banana, Nanna and Marcos") == []
+    assert matcher.find("ask ANA") == [(4, 7, "u1")]
+
+
+def test_name_matcher_follows_failure_links():
+    # "he" must be found inside "she"/"hers" through the automaton's failure links
+    matcher = NameMatcher({"he": "1", "she": "2", "his": "3", "hers": "4"})
+    assert [user_id for _, _, user_id in matcher.find("ushers he his")] == ["1", "3"]
+    assert matcher.user_ids("she said hers") == ["2", "4"]
+
+
+def test_router_uses_names_then_centroids():
+    calls = []
+
+    class CountingEmbeddings(HashingEmbeddings):
+        def embed_query(self, text):
+            calls.append(text)
+            return super().embed_query(text)
+
+    router = QueryRouter(CountingEmbeddings(), min_margin=0.0)
+    decision = router.route("Who is Sarah?")
+    assert (decision.route, decision.method, decision.user_ids) == ("tools", "name", ["user_002"])
+    # A name match needs no embedding at all
+    assert calls == [] and router._centroids is None
+
+    assert router.route("How many people follow this account?").route == "tools"
+    assert router.route("What is the profile of the Mad Hatter in the story?").route == "rag"
+    assert router.counters.as_dict() == {"name": 1, "centroid": 2, "fallback": 0}
+    assert router.classify_latency.count == 2
+
+
+def test_router_falls_back_to_keywords_on_close_calls():
+    router = QueryRouter(HashingEmbeddings(), min_margin=10.0)
+    decision = router.route("What is the profile of the Mad Hatter in the story?")
+    # The keyword rules send any mention of "profile" to the tools
+    assert (decision.method, decision.route) == ("fallback", "tools")
+    assert keyword_route("Who is the Mother of Dragons?") == "rag"
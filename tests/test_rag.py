@@ -1,8 +1,5 @@
-import os
-
-from langchain_google_genai import GoogleGenerativeAI
-
 import shared.config
+from shared.components import get_llm
 from tests.query_data_gemini import query_rag
 
 EVAL_PROMPT = """
@@ -33,9 +30,7 @@ def query_and_validate(question: str, expected_response: str):
         expected_response=expected_response, actual_response=response_text
     )
 
-    model = GoogleGenerativeAI(
-        model="gemini-flash-latest", google_api_key=os.environ['GEMINI_API_KEY'])
-    response_text = model.invoke(prompt)
+    response_text = get_llm().invoke(prompt).text
     evaluation_results_str_cleaned = response_text.strip().lower()
 
     print(prompt)
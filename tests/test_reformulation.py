@@ -0,0 +1,43 @@
+import pytest
+
+from rag.reformulation import ReformulationPolicy, is_self_contained
+
+HISTORY = ["earlier turn"]
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What are the names of the Stark children's direwolves?", True),
+    ("Who are the three characters at the Mad Tea Party?", True),
+    ("What happened to him after that?", False),
+    ("And Arya?", False),
+    ("What about the Lannisters?", False),
+    ("Why?", False),
+    ("Tell me more about their father.", False),
+])
+def test_is_self_contained(question, expected):
+    assert is_self_contained(question) is expected
+
+
+def test_policies_and_counters():
+    standalone = {"input": "Who is the Queen of Hearts in Wonderland?",
+                  "chat_history": HISTORY}
+    follow_up = {"input": "Why did she do it?", "chat_history": HISTORY}
+    first_turn = {"input": "Why did she do it?", "chat_history": []}
+
+    heuristic = ReformulationPolicy("heuristic")
+    assert heuristic.skip_reason(standalone) == "skipped_self_contained"
+    assert heuristic.skip_reason(follow_up) is None
+    assert heuristic.skip_reason(first_turn) == "skipped_no_history"
+
+    assert ReformulationPolicy("history").skip_reason(standalone) is None
+    assert ReformulationPolicy("always").skip_reason(first_turn) is None
+
+    heuristic.record("skipped_self_contained", 0.001)
+    heuristic.record(None, 0.5)
+    stats = heuristic.stats()
+    assert stats["llm_calls"] == 1 and stats["avoided_rate"] == 0.5
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        ReformulationPolicy("sometimes")
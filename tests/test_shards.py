@@ -0,0 +1,148 @@
+import os
+
+import pytest
+from langchain_chroma import Chroma
+
+from ingest.bm25_index import BM25Index
+from ingest.shards import (ShardedLexicalIndex, ShardedVectorStore, ShardSet, load_catalog,
+                           matches, shard_name)
+from rag import rag_helper
+from rag.hybrid_retriever import HybridRetriever
+from shared.fake_embeddings import HashingEmbeddings
+
+CHUNKS = {
+    "data/books/got.html": [
+        "Nymeria smashes Joff to the ground and mangles his arm.",
+        "Cersei decrees that Lady be killed since Nymeria has not been found.",
+        "Jon was feeding Ghost under the table when Benjen approaches.",
+    ],
+    "data/books/alice.md": [
+        "The Mad Hatter and the March Hare were having tea under a tree.",
+        "Alice follows the White Rabbit down the rabbit hole.",
+    ],
+    "data/personal/cv.pdf": [
+        "Software engineer experienced in Python, retrieval and vector databases.",
+        "Led the migration of the team's search service to Kubernetes.",
+    ],
+}
+
+
+def build(directory, embeddings, shard_by="corpus"):
+    "Ingest CHUNKS like create_db.py does, returning the manifest's files."
+    shards = ShardSet(str(directory), "data", shard_by)
+    files = {}
+    for source, texts in CHUNKS.items():
+        ids = [f"{source}:{i}" for i in range(len(texts))]
+        shards.upsert(ids, embeddings.embed_documents(texts), [{"source": source}] * len(texts),
+                      texts)
+        shards.stores(source)[1].add(zip(ids, texts))
+        files[source] = {"sha256": source, "chunks": {id_: 0 for id_ in ids}}
+    shards.commit(files)
+    return shards, files
+
+
+@pytest.fixture
+def embeddings():
+    return HashingEmbeddings(size=32)
+
+
+def test_shard_names_and_filters():
+    assert shard_name("data/books/got.html", "data", "corpus") == "books"
+    assert shard_name("data/top.md", "data", "corpus") == "data"
+    assert shard_name("data/personal/My CV.pdf", "data", "source") == "personal--My-CV.pdf"
+    assert shard_name("data/books/got.html", "data", "none") == ""
+    with pytest.raises(ValueError):
+        shard_name("data/books/got.html", "data", "chapter")
+
+    metadata = {"name": "books", "corpus": "books", "types": [".html", ".md"]}
+    assert matches(metadata, None) and matches(metadata, {"corpus": ["books", "news"]})
+    assert matches(metadata, {"types": ".md"}) and not matches(metadata, {"types": [".pdf"]})
+    assert not matches(metadata, {"corpus": "personal"})
+
+
+def test_ingestion_writes_a_shard_per_corpus(tmp_path, embeddings):
+    build(tmp_path, embeddings)
+    catalog = load_catalog(str(tmp_path))
+    assert catalog["shard_by"] == "corpus"
+    assert catalog["shards"]["books"] == {
+        "corpus": "books", "sources": ["data/books/alice.md", "data/books/got.html"],
+        "types": [".md", ".html"], "chunks": 5}
+    assert catalog["shards"]["personal"]["chunks"] == 2
+    assert sorted(os.listdir(tmp_path / "shards")) == ["books", "personal"]
+
+
+def test_fan_out_search_matches_a_single_collection(tmp_path, embeddings):
+    from langchain_chroma import Chroma
+
+    build(tmp_path / "sharded", embeddings, "source")
+    single = Chroma(persist_directory=str(tmp_path / "single"), embedding_function=embeddings)
+    for source, texts in CHUNKS.items():
+        single.add_texts(texts, ids=[f"{source}:{i}" for i in range(len(texts))])
+
+    store = ShardedVectorStore(str(tmp_path / "sharded"), embeddings)
+    for query in ["Nymeria and Joff", "tea with the Hatter", "Python vector databases"]:
+        sharded = store.similarity_search_with_score(query, k=4)
+        expected = single.similarity_search_with_score(query, k=4)
+        assert [doc.id for doc, _ in sharded] == [doc.id for doc, _ in expected]
+        assert [-score for _, score in sharded] == pytest.approx(
+            [distance for _, distance in expected], abs=1e-5)
+
+    [batch] = store.similarity_search_by_vectors([embeddings.embed_query("rabbit hole")], k=1)
+    assert batch[0].id == "data/books/alice.md:1"
+    assert [doc.id for doc in store.get_by_ids(["data/personal/cv.pdf:1", "missing",
+                                                "data/books/got.html:0"])] == [
+        "data/personal/cv.pdf:1", "data/books/got.html:0"]
+
+
+def test_shard_filter_prunes_before_searching(tmp_path, embeddings):
+    build(tmp_path, embeddings)
+    store = ShardedVectorStore(str(tmp_path), embeddings)
+    lexical = ShardedLexicalIndex(str(tmp_path))
+    assert len(lexical) == 7
+
+    docs = store.similarity_search("software engineer", k=7, shard_filter={"corpus": "books"})
+    assert len(docs) == 5 and all(doc.metadata["source"].startswith("data/books/") for doc in docs)
+    assert store.similarity_search("anything", shard_filter={"corpus": "news"}) == []
+
+    assert [id_ for id_, _ in lexical.search("Nymeria")] == [
+        "data/books/got.html:0", "data/books/got.html:1"]
+    assert lexical.search("Nymeria", shard_filter={"name": "personal"}) == []
+    assert [id_ for id_, _ in lexical.search("Kubernetes python", k=1)] == [
+        "data/personal/cv.pdf:1"]
+
+    retriever = HybridRetriever(vector_store=store, lexical_index=lexical, k=2,
+                                shard_filter={"corpus": "personal"})
+    assert {doc.metadata["source"] for doc in retriever.invoke("Nymeria")} == {
+        "data/personal/cv.pdf"}
+    docs = retriever.invoke("Nymeria", shard_filter={"types": ".html"})
+    assert {doc.id for doc in docs} == {"data/books/got.html:0", "data/books/got.html:1"}
+
+
+def test_readers_follow_the_catalog(tmp_path, embeddings):
+    shards, files = build(tmp_path, embeddings)
+    store = ShardedVectorStore(str(tmp_path), embeddings)
+    assert set(store.shards.select()) == {"books", "personal"}
+
+    del files["data/personal/cv.pdf"]
+    shards.commit(files)
+    assert not os.path.exists(tmp_path / "shards" / "personal")
+    assert set(store.shards.select()) == {"books"}
+    assert {doc.metadata["source"] for doc in store.similarity_search("Python", k=10)} == {
+        "data/books/alice.md", "data/books/got.html"}
+
+
+def test_shard_filter_on_an_unsharded_db_is_an_error(tmp_path, embeddings, monkeypatch):
+    build(tmp_path, embeddings, shard_by="none")
+    db = Chroma(persist_directory=str(tmp_path), embedding_function=embeddings)
+    lexical = BM25Index(str(tmp_path))
+    monkeypatch.setattr(rag_helper, "get_vector_store", lambda: db)
+    monkeypatch.setattr(rag_helper, "RETRIEVAL_SHARD_FILTER", {"corpus": "books"})
+    for retriever in ("vector", "hybrid"):
+        monkeypatch.setattr(rag_helper, "RETRIEVER", retriever)
+        with pytest.raises(ValueError, match="not sharded"):
+            rag_helper.build_retriever()
+
+    retriever = HybridRetriever(vector_store=db, lexical_index=lexical, k=2)
+    assert len(retriever.invoke("Nymeria")) == 2
+    with pytest.raises(ValueError, match="not sharded"):
+        retriever.invoke("Nymeria", shard_filter={"corpus": "books"})
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import langchain_helper
+from rag import rag_helper
+from rag.speculative_retrieval import SpeculativeRetrieval, union
+from shared.fake_embeddings import HashingEmbeddings
+
+FOLLOW_UP = {"input": "Which one belongs to Arya?",
+             "chat_history": ["What are the names of the Stark children's direwolves?"]}
+
+
+class SlowRetriever(BaseRetriever):
+    "Returns a document per query word after `delay` seconds, recording the queries."
+    delay: float = 0.05
+    queries: list = []
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.queries.append(query)
+        time.sleep(self.delay)
+        return [Document(word, id=word) for word in query.rstrip("?").split()]
+
+
+def speculative(threshold=0.95):
+    return SpeculativeRetrieval(SlowRetriever(queries=[]), HashingEmbeddings(size=64), threshold)
+
+
+def test_near_identical_question_reuses_the_speculative_search():
+    retrieval = speculative()
+    speculation = retrieval.start("which one belongs to Arya")
+    time.sleep(0.1)  # the reformulation LLM call
+    docs = speculation.result("Which one belongs to Arya?")
+
+    assert [doc.id for doc in docs] == ["which", "one", "belongs", "to", "Arya"]
+    assert retrieval.retriever.queries == ["which one belongs to Arya"]
+    stats = retrieval.stats()
+    assert stats["reused"] == 1 and stats["reuse_rate"] == 1.0
+    # The whole search overlapped the LLM call
+    assert stats["saved"]["mean_ms"] > 40 and stats["wasted"]["mean_ms"] == 0
+
+
+def test_rewritten_question_is_searched_and_unioned():
+    retrieval = speculative()
+    speculation = retrieval.start("Which one belongs to Arya?")
+    docs = speculation.result("Nymeria belongs to Arya Stark")
+
+    assert [doc.id for doc in docs] == ["Nymeria", "belongs", "to", "Arya", "Stark",
+                                        "Which", "one"]
+    # The second search runs while the speculative one may still be going
+    assert sorted(retrieval.retriever.queries) == ["Nymeria belongs to Arya Stark",
+                                                   "Which one belongs to Arya?"]
+    stats = retrieval.stats()
+    assert stats["second_search"] == 1 and stats["wasted"]["mean_ms"] > 40
+
+
+def test_async_result_and_discard():
+    retrieval = speculative(threshold=0.0)
+
+    async def main():
+        speculation = retrieval.start("Which one belongs to Arya?")
+        await asyncio.sleep(0.1)
+        return await speculation.aresult("Arya's direwolf")
+
+    assert [doc.id for doc in asyncio.run(main())] == ["Which", "one", "belongs", "to", "Arya"]
+
+    speculation = retrieval.start("What about Bran?")
+    speculation.discard()
+    speculation.discard()
+    time.sleep(0.1)
+    assert retrieval.stats()["discarded"] == 1 and retrieval.stats()["reused"] == 1
+
+
+def test_union_keeps_first_order_and_drops_duplicates():
+    first = [Document("a", id="1"), Document("b")]
+    second = [Document("a", id="1"), Document("b"), Document("c", id="3")]
+    assert [doc.page_content for doc in union(first, second)] == ["a", "b", "c"]
+
+
+def test_rag_chain_takes_the_speculation(monkeypatch):
+    retrieval = speculative()
+    monkeypatch.setattr(rag_helper, "get_speculative_retrieval", lambda: retrieval)
+    monkeypatch.setattr(rag_helper, "get_retriever", lambda: retrieval.retriever)
+
+    monkeypatch.setattr(rag_helper, "SPECULATIVE_RETRIEVAL_ENABLED", False)
+    assert rag_helper.speculate(FOLLOW_UP) is None
+    monkeypatch.setattr(rag_helper, "SPECULATIVE_RETRIEVAL_ENABLED", True)
+    # Questions that are not reformulated are searched as they are, without speculating
+    assert rag_helper.speculate({**FOLLOW_UP, "chat_history": []}) is None
+
+    speculation = rag_helper.speculate(FOLLOW_UP)
+    state = {**FOLLOW_UP, "standalone_question": "Which direwolf belongs to Arya?",
+             "speculation": speculation}
+    docs = rag_helper.retrieve_context(state, None)
+    assert [doc.id for doc in docs][:2] == ["Which", "direwolf"] and len(docs) == 6
+    assert retrieval.stats()["second_search"] == 1
+
+    docs = rag_helper.retrieve_context({**state, "speculation": None}, None)
+    assert len(docs) == 5 and retrieval.stats()["second_search"] == 1
+
+
+def test_failed_speculation_falls_back_to_a_normal_search():
+    class FailingRetriever(SlowRetriever):
+        def _get_relevant_documents(self, query, *, run_manager):
+            if query == "Which one belongs to Arya?":
+                raise RuntimeError("search backend unavailable")
+            return super()._get_relevant_documents(query, run_manager=run_manager)
+
+    retrieval = SpeculativeRetrieval(FailingRetriever(queries=[]), HashingEmbeddings(size=64))
+    # Reused question: searched again as it would be without speculation
+    docs = retrieval.start("Which one belongs to Arya?").result("which one belongs to arya")
+    assert [doc.id for doc in docs] == ["which", "one", "belongs", "to", "arya"]
+    # Rewritten question: its own documents alone
+    speculation = retrieval.start("Which one belongs to Arya?")
+    docs = asyncio.run(speculation.aresult("Nymeria belongs to Arya Stark"))
+    assert [doc.id for doc in docs] == ["Nymeria", "belongs", "to", "Arya", "Stark"]
+
+    stats = retrieval.stats()
+    assert stats["failed"] == 2 and stats["reused"] == stats["second_search"] == 0
+    assert stats["wasted"]["mean_ms"] > 0
+
+
+def test_speculation_is_discarded_when_the_request_fails(monkeypatch):
+    retrieval = speculative()
+
+    def fail(state):
+        raise RuntimeError("LLM unavailable")
+
+    monkeypatch.setattr(langchain_helper, "route", lambda state: "rag")
+    monkeypatch.setattr(langchain_helper, "get_answer_cache", lambda: None)
+    monkeypatch.setattr(langchain_helper, "speculate",
+                        lambda state: retrieval.start(state["input"]))
+    monkeypatch.setattr(langchain_helper, "standalone_question", fail)
+    with pytest.raises(RuntimeError, match="LLM unavailable"):
+        langchain_helper.call_model(FOLLOW_UP)
+
+    async def afail(state):
+        fail(state)
+
+    monkeypatch.setattr(langchain_helper, "astandalone_question", afail)
+    with pytest.raises(RuntimeError, match="LLM unavailable"):
+        asyncio.run(langchain_helper.acall_model(FOLLOW_UP))
+    time.sleep(0.2)
+    assert retrieval.stats()["discarded"] == 2
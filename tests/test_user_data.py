@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agent.external_tools import ACTIVITY, PROFILES, STATS, USER_NAME_TO_ID
+from agent.user_data import (InMemoryBackend, NameIndex, SQLiteBackend, UserDataStore,
+                             normalize_name)
+
+RECORDS = {"profile": PROFILES, "stats": STATS, "activity": ACTIVITY}
+
+
+class SlowBackend(InMemoryBackend):
+    def __init__(self, delay=0.05, fail=False):
+        super().__init__(RECORDS)
+        self.delay, self.fail, self.calls = delay, fail, []
+
+    def fetch_many(self, kind, user_ids):
+        self.calls.append((kind, list(user_ids)))
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("backend down")
+        return super().fetch_many(kind, user_ids)
+
+
+def test_name_index_is_case_accent_and_typo_tolerant():
+    index = NameIndex({user_id: p["name"] for user_id, p in PROFILES.items()}, USER_NAME_TO_ID)
+    assert normalize_name("  Ana  MÜLLER ") == "ana muller"
+    assert [index.resolve(name) for name in ("ANA", "ana muller", "Chen", "Sara", "Marko")] == [
+        "user_001", "user_001", "user_002", "user_002", "user_005"]
+    assert index.resolve("Sara", fuzzy=False) is None
+    assert index.resolve("Bob") is None and index.resolve("") is None
+
+
+def test_get_many_uses_one_backend_call_and_caches():
+    backend = SlowBackend(delay=0)
+    store = UserDataStore(backend, USER_NAME_TO_ID)
+    records = store.get_many("stats", ["Ana", "user_001", "priya", "Nobody"])
+    assert records["Ana"] is records["user_001"] is STATS["user_001"]
+    assert records["priya"] is STATS["user_004"] and records["Nobody"] is None
+    assert backend.calls == [("stats", ["user_001", "user_004"])]
+
+    assert store.get("stats", "ANA") is STATS["user_001"]
+    assert len(backend.calls) == 1 and store.counters["hits"] == 1
+
+
+def test_concurrent_requests_are_coalesced():
+    backend = SlowBackend()
+    store = UserDataStore(backend)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: store.get("profile", "user_002"), range(8)))
+    assert all(result is PROFILES["user_002"] for result in results)
+    assert backend.calls == [("profile", ["user_002"])]
+    assert store.counters["misses"] == 1 and store.counters["coalesced"] == 7
+
+
+def test_failures_reach_waiters_and_are_not_cached():
+    backend = SlowBackend(fail=True)
+    store = UserDataStore(backend)
+    errors, barrier = [], threading.Barrier(2)
+
+    def get():
+        barrier.wait()
+        try:
+            store.get("profile", "user_003")
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 2 and len(backend.calls) == 1
+
+    backend.fail = False
+    assert store.get("profile", "user_003") is PROFILES["user_003"]
+
+
+def test_ttl_and_invalidation():
+    backend = SlowBackend(delay=0)
+    store = UserDataStore(backend, ttl_seconds=-1)
+    store.get("profile", "user_001")
+    store.get("profile", "user_001")
+    assert len(backend.calls) == 2
+
+    store.ttl_seconds = 60
+    store.get("stats", "user_001")
+    store.invalidate(user_id="user_001")
+    store.get("stats", "user_001")
+    assert len(backend.calls) == 4
+
+
+@pytest.mark.parametrize("kind", ["profile", "stats", "activity"])
+def test_sqlite_backend_matches_in_memory(tmp_path, kind):
+    backend = SQLiteBackend(str(tmp_path / "users.sqlite3"))
+    backend.load(RECORDS)
+    assert backend.names() == InMemoryBackend(RECORDS).names()
+    assert backend.fetch_many(kind, ["user_005", "user_001", "user_999"]) == \
+        InMemoryBackend(RECORDS).fetch_many(kind, ["user_005", "user_001", "user_999"])
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pytest
+
+from ingest.vector_index import (MmapVectorStore, VectorIndexWriter, export_vector_index,
+                                 index_meta, quantize)
+from rag.hybrid_retriever import similarity_search_many
+from shared.fake_embeddings import HashingEmbeddings
+
+TEXTS = [
+    "Nymeria smashes Joff to the ground and mangles his arm.",
+    "Cersei decrees that Lady be killed since Nymeria has not been found.",
+    "Jon was feeding Ghost under the table when Benjen approaches.",
+    "The Mad Hatter and the March Hare were having tea under a tree.",
+    "Alice follows the White Rabbit down the rabbit hole.",
+]
+
+
+def write_index(path, vectors, dtype, generation=0, batch=300):
+    writer = VectorIndexWriter(str(path), dtype, generation)
+    for start in range(0, len(vectors), batch):
+        rows = range(start, min(start + batch, len(vectors)))
+        writer.add([f"c{i}" for i in rows], vectors[start:start + batch],
+                   [f"Chunk {i}, ünïcode." for i in rows], [{"row": i} for i in rows])
+    writer.close()
+    return MmapVectorStore(str(path))
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(1000, 32)).astype(np.float32)
+
+
+def test_quantize_round_trip(vectors):
+    quantized, scales = quantize(vectors)
+    assert quantized.dtype == np.int8 and np.abs(quantized).max() == 127
+    assert np.abs(quantized * scales[:, None] - vectors).max() <= scales.max() / 2 + 1e-6
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_search_matches_exact_cosine(tmp_path, vectors, dtype):
+    store = write_index(tmp_path / "index", vectors, dtype)
+    assert len(store) == 1000 and index_meta(str(tmp_path / "index"))["dtype"] == dtype
+
+    queries = vectors[:20] + np.random.default_rng(1).normal(scale=0.5, size=(20, 32))
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact = np.argsort(-(queries @ normed.T), axis=1)[:, :5]
+    for query, want in zip(queries, exact):
+        results = store.similarity_search_with_score_by_vector(query.tolist(), k=5)
+        assert [doc.id for doc, _ in results] == [f"c{i}" for i in want]
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True) and scores[0] <= 1.0 + 1e-5
+
+    doc = store.similarity_search_by_vector(vectors[7].tolist(), k=1)[0]
+    assert (doc.id, doc.page_content, doc.metadata) == ("c7", "Chunk 7, ünïcode.", {"row": 7})
+
+
+def test_batch_search_get_by_ids_and_empty_index(tmp_path, vectors):
+    store = write_index(tmp_path / "index", vectors, "int8")
+    batch = store.similarity_search_by_vectors(vectors[:3].tolist(), k=2)
+    assert [docs[0].id for docs in batch] == ["c0", "c1", "c2"]
+    assert similarity_search_many(store, vectors[:3].tolist(), k=2) == batch
+    assert [doc.id for doc in store.get_by_ids(["c9", "missing", "c2"])] == ["c9", "c2"]
+
+    empty = write_index(tmp_path / "empty", vectors[:0], "int8")
+    assert len(empty) == 0 and empty.similarity_search_by_vector([1.0] * 32, k=3) == []
+    with pytest.raises(NotImplementedError):
+        store.add_texts(["new"])
+    # Metadata filters cannot be applied, so they fail instead of returning unfiltered results
+    assert len(store.similarity_search_by_vector(vectors[0].tolist(), k=2, filter=None)) == 2
+    with pytest.raises(ValueError, match="filter"):
+        store.similarity_search_by_vector(vectors[0].tolist(), k=2, filter={"source": "a.md"})
+    with pytest.raises(ValueError, match="shard_filter"):
+        store.similarity_search_with_score_by_vector(vectors[0].tolist(),
+                                                     shard_filter={"corpus": "books"})
+
+
+def test_store_reopens_a_re_exported_index(tmp_path, vectors):
+    store = write_index(tmp_path / "index", vectors[:10], "float32", generation=1)
+    assert len(store) == 10
+    old = store.index
+
+    write_index(tmp_path / "index", vectors, "int8", generation=2)
+    os.utime(tmp_path / "index" / "meta.json", ns=(0, old.mtime + 1))
+    assert len(store) == 1000 and store.index.meta["generation"] == 2
+    # A search holding the old mapping can still finish on it
+    assert [row for row, _ in store.search([vectors[3]], 1, old)[0]] == [3]
+
+
+def test_export_from_chroma(tmp_path):
+    from langchain_chroma import Chroma
+
+    embeddings = HashingEmbeddings(size=16)
+    db = Chroma(collection_name="export", embedding_function=embeddings)
+    db.add_texts(TEXTS, metadatas=[{"source": f"s{i}"} for i in range(len(TEXTS))],
+                 ids=[f"chunk-{i}" for i in range(len(TEXTS))])
+
+    path = str(tmp_path / "vectors")
+    assert export_vector_index(db, path, "int8", generation=3, page_size=2) == len(TEXTS)
+    assert index_meta(path) == {"count": 5, "dim": 16, "dtype": "int8", "generation": 3}
+
+    store = MmapVectorStore(path, embeddings)
+    for i, text in enumerate(TEXTS):
+        results = store.similarity_search_with_score(text, k=3)
+        assert results[0][0].id == f"chunk-{i}"
+        # Chroma returns squared L2 distances, 2 - 2 * cosine for normalized vectors
+        distances = [distance for _, distance in db.similarity_search_with_score(text, k=3)]
+        assert [score for _, score in results] == pytest.approx(
+            [1 - distance / 2 for distance in distances], abs=1e-5)
+    assert store.get_by_ids(["chunk-4"])[0].metadata == {"source": "s4"}